@@ -0,0 +1,70 @@
+"""
+Aho-Corasick multi-pattern substring matcher.
+
+Finds which of many patterns occur in a text with a single pass over the text,
+independent of the number of patterns. Used by the collection rule engine to
+resolve `in` (substring) rules across all collections at once.
+"""
+
+from collections import deque
+from collections.abc import Iterable, Mapping
+
+
+class AhoCorasick:
+    """Automaton over a fixed set of patterns, each tagged with a set of integer labels.
+
+    find(text) returns the union of the labels of every pattern that occurs in text.
+    Patterns are matched case-sensitively; lowercase both sides for case-insensitive use.
+    """
+
+    def __init__(self, patterns: Mapping[str, Iterable[int]]) -> None:
+        goto: list[dict[str, int]] = [{}]
+        out: list[set[int]] = [set()]
+        for pattern, labels in patterns.items():
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(set())
+                state = nxt
+            out[state].update(labels)
+
+        # Breadth-first: a state's failure link is the longest proper suffix that is also
+        # a prefix, and it inherits that state's labels so find() never walks the chain.
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0) if goto[f].get(ch) != nxt else 0
+                out[nxt] |= out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = {state: frozenset(labels) for state, labels in enumerate(out) if labels}
+
+    def find(self, text: str) -> set[int]:
+        """Labels of all patterns occurring in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set(out.get(0, ()))  # the empty pattern occurs in every text
+        state = 0
+        for ch in text:
+            while True:
+                nxt = goto[state].get(ch)
+                if nxt is not None:
+                    state = nxt
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            labels = out.get(state)
+            if labels is not None:
+                found |= labels
+        return found
@@ -8,14 +8,18 @@ import io
 import ipaddress
 import json
 import logging
+import multiprocessing as mp
 import os
 import re
 import shutil
 import time
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from collections.abc import Callable, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Literal
+from typing import Literal, NamedTuple
 from urllib.parse import quote, unquote
 
 import httpx
@@ -27,25 +31,52 @@ from plexapi.exceptions import PlexApiException
 from pydantic import BaseModel, field_validator
 
 from collection_map import (
+    BASE_FIELDS,
     MAPPING_FILE_NAME,
-    MATCH_FIELDS,
     YAMP_DIR,
+    CompiledCollections,
+    VideoPostings,
+    collection_membership,
+    compile_collections,
     diff_collections,
     find_collection_map,
-    load_map,
+    flush_maps,
     match_video,
+    migrate_map_to_sqlite,
+    projected_fields,
+    read_collections,
+    read_map,
+    read_map_summary,
     recompute_all_collections,
     resolve_collections,
-    save_map,
+    rule_stats_report,
+    take_map_edit,
+    write_map,
 )
+from index_snapshot import (
+    SNAPSHOT_FILE_NAME,
+    Fingerprint,
+    ProjectionResult,
+    SnapshotEntry,
+    file_fingerprint,
+    fingerprint_and_project,
+    load_snapshot,
+    save_snapshot,
+)
+from info_json import load_fields
 from metadata import (
     _BILIBILI_ID_RE,
     _GENERIC_ID_RE,
     _YOUTUBE_ID_RE,
+    METADATA_FIELDS,
     build_metadata_response,
     extract_video_id,
     parse_upload_date,
 )
+from reconciler import IOBudget, Reconciler
+from sqlite_store import open_store
+from video_index import VideoIndex
+from watcher import SIDECAR_SUFFIX, Change, watch_sidecars
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s — %(message)s")
 logger = logging.getLogger(__name__)
@@ -88,18 +119,52 @@ YAMP_URL = os.environ.get("YAMP_URL", "").rstrip("/")
 PORT = int(os.environ.get("PORT", "8765"))
 API_KEY = os.environ.get("API_KEY", "")
 APP_VERSION = os.environ.get("APP_VERSION", "dev")
+# Sidecar watcher: "auto" (inotify on local disks, polling on network mounts), "inotify", "poll", or "off".
+WATCH_MODE = os.environ.get("YAMP_WATCH", "auto")
+WATCH_POLL_INTERVAL = float(os.environ.get("YAMP_WATCH_POLL_INTERVAL", "30"))
+# Concurrent directory listings during index walks. Raise for high-latency NFS/SMB mounts.
+INDEX_WORKERS = max(1, int(os.environ.get("YAMP_INDEX_WORKERS", "8")))
+# Worker processes parsing .info.json files during index builds (0 = one per CPU, 1 = in-process).
+META_WORKERS = int(os.environ.get("YAMP_META_WORKERS", "0")) or os.cpu_count() or 1
+# Seconds the match state of videos Plex asks about may stay in memory before it is
+# written to the collection map in one batch (0 = write on every new video).
+MAP_FLUSH_DELAY = float(os.environ.get("YAMP_MAP_FLUSH_DELAY", "5"))
+# Seconds between checks of the collection map file for hand edits (0 = off).
+MAP_WATCH_INTERVAL = float(os.environ.get("YAMP_MAP_WATCH_INTERVAL", "5"))
+# Where the collection map, match state, and index snapshot live: "json" files, or one "sqlite"
+# database under .yamp/ (existing JSON files are moved into it at startup). Once a database
+# exists it is used regardless of this setting.
+STORAGE = os.environ.get("YAMP_STORAGE", "json")
+# Worker processes for recomputes that match videos one by one (0 = one per CPU, 1 = in-process).
+RECOMPUTE_WORKERS = int(os.environ.get("YAMP_RECOMPUTE_WORKERS", "0")) or os.cpu_count() or 1
+# Background reconciliation: stat budget per second for scheduled passes and the polling watcher (0 = unthrottled),
+# and the bounds of the adaptive gap between passes, in seconds.
+RECONCILE_IOPS = float(os.environ.get("YAMP_RECONCILE_IOPS", "500"))
+RECONCILE_MIN_INTERVAL = float(os.environ.get("YAMP_RECONCILE_MIN_INTERVAL", "60"))
+RECONCILE_MAX_INTERVAL = float(os.environ.get("YAMP_RECONCILE_MAX_INTERVAL", "3600"))
 
 METADATA_KEY = "/library/metadata"
 MATCH_KEY = "/library/metadata/matches"
 
 # ── Video index ───────────────────────────────────────────────────────────────
-# Maps video_id → absolute path to its .info.json file
-
-_video_index: dict[str, str] = {}
-_stem_index: dict[str, str] = {}  # info.json filename stem → video_id (match endpoint fallback)
-_video_meta_cache: dict[str, dict] = {}  # video_id → MATCH_FIELDS subset of info_json
-_last_rebuild: float = 0.0
-_REBUILD_COOLDOWN = 60.0
+# The current immutable VideoIndex: video_id → .info.json path, stem fallback, meta cache,
+# and warm-start entries. Replaced wholesale (never mutated) so threads can read it freely;
+# take one reference per operation for a consistent view.
+
+_index = VideoIndex()
+# Fields the meta cache should be projected to: BASE_FIELDS plus whatever the collection
+# rules read. Set from the map at startup and on rule changes; index passes catch up to it.
+_meta_fields: frozenset[str] = BASE_FIELDS
+_dir_cache: dict[str, "_DirListing"] = {}  # directory → listing from the last walk (incremental rebuilds)
+_snapshot_dirty = False  # True once the watcher has changed _index.entries since they were saved
+# Unknown video IDs that a rebuild already failed to find → (generation, expiry). While the
+# generation is unchanged and the entry is fresh, asking for them again does not rebuild.
+_missing_ids: OrderedDict[str, tuple[int, float]] = OrderedDict()
+_MISSING_IDS_MAX = 10_000
+_MISSING_ID_TTL = 600.0
+_watcher_task: asyncio.Task | None = None
+_reconcile_task: asyncio.Task | None = None
+_map_watch_task: asyncio.Task | None = None
 
 # Channel art cache: uploader_url → {channel, avatar_url, banner_url}
 # Populated at startup and after collection saves; keyed by the YouTube channel URL.
@@ -133,47 +198,160 @@ def _log_task_exception(task: asyncio.Task, label: str) -> None:
 _VALID_ID_RE = re.compile(r"^[A-Za-z0-9_-]{4,}$")
 
 
-def build_index(data_path: str) -> tuple[dict[str, str], dict[str, str]]:
+class _DirListing(NamedTuple):
+    """What one directory contributed to the last index walk (incremental build_index)."""
+
+    mtime_ns: int
+    subdirs: tuple[str, ...]
+    sidecars: tuple[tuple[str, str], ...]  # (filename, video_id) for each indexable .info.json
+
+
+def _list_dir(root: str, mtime_ns: int, snapshot: Mapping[str, SnapshotEntry] | None) -> tuple[_DirListing, int]:
+    """List one directory for build_index. Returns (listing, read_errors); raises OSError if unlistable."""
+    subdirs: list[str] = []
+    sidecars: list[tuple[str, str]] = []
+    read_errors = 0
+    with os.scandir(root) as it:
+        entries = list(it)
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            # Same as os.walk(followlinks=False): symlinked directories are not descended into.
+            if not entry.is_symlink():
+                subdirs.append(entry.name)
+            continue
+        f = entry.name
+        # Only index yt-dlp video metadata files. *.channel.json (channel art
+        # cache written by _fetch_channel_art) and _collection_map.json must
+        # not be treated as video entries.
+        if not f.endswith(".info.json"):
+            continue
+        # Try the filename first (yt-dlp default: "Title [VIDEO_ID].info.json").
+        # Fall back to the containing directory name, which covers MeTube's
+        # per-video folder layout: "Channel/Title [VIDEO_ID]/Title.info.json".
+        video_id = extract_video_id(f) or extract_video_id(os.path.basename(root))
+        path = entry.path
+        cached = snapshot.get(path) if snapshot and not video_id else None
+        if cached is not None and cached.fingerprint == file_fingerprint(path):
+            video_id = cached.video_id
+        if not video_id:
+            # No bracket-wrapped ID found — read the canonical ID from the JSON itself.
+            # Handles non-standard output templates where yt-dlp omits [id] from the name.
+            try:
+                raw_id = load_fields(path, ("id",)).get("id", "")
+                video_id = raw_id if raw_id and _VALID_ID_RE.match(raw_id) else None
+            except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
+                logger.warning("build_index: could not read '%s': %s", path, e)
+                read_errors += 1
+        if video_id:
+            sidecars.append((f, video_id))
+    return _DirListing(mtime_ns, tuple(subdirs), tuple(sidecars)), read_errors
+
+
+def build_index(
+    data_path: str,
+    snapshot: Mapping[str, SnapshotEntry] | None = None,
+    dir_cache: dict[str, _DirListing] | None = None,
+    workers: int = 1,
+    on_listing: Callable[[str, _DirListing], None] | None = None,
+) -> tuple[dict[str, str], dict[str, str]]:
     """Walk data_path and index all .info.json files by video ID.
 
     Returns (video_index, stem_index). video_index maps video_id → absolute
     path to the .info.json. stem_index maps the info.json filename stem
     (filename minus ".info.json") → video_id, used as a last-resort fallback
     in the match endpoint for video files whose names contain no embedded ID.
+
+    When snapshot is given, files with no embedded ID reuse the snapshot's ID
+    instead of being parsed, as long as their fingerprint is unchanged.
+
+    When dir_cache is given (incremental mode), a directory whose mtime matches
+    its cached listing is not re-listed: its subdirectories and sidecar IDs are
+    reused, so an unchanged directory costs one stat. dir_cache is updated in
+    place to describe this walk.
+
+    With workers > 1, directories are listed concurrently on a bounded thread
+    pool — on NFS/SMB each listing is a network round trip, so walk time then
+    scales with parallelism. The result is identical to a sequential walk.
+
+    on_listing, if given, is called with (directory, listing) as each directory
+    is listed or reused, so callers can start work before the walk finishes.
     """
-    index: dict[str, str] = {}
-    stem_index: dict[str, str] = {}
     read_errors = 0
+    relisted = 0
+    listings: dict[str, _DirListing] = {}
+    uncacheable: set[str] = set()  # listed with a failed sidecar read — retry next walk
 
     def onerror(err: OSError) -> None:
         logger.warning("Index walk error at '%s' (errno %d) — skipping: %s", err.filename, err.errno, err)
 
-    for root, _, files in os.walk(data_path, onerror=onerror):
-        for f in files:
-            # Only index yt-dlp video metadata files. *.channel.json (channel art
-            # cache written by _fetch_channel_art) and _collection_map.json must
-            # not be treated as video entries.
-            if not f.endswith(".info.json"):
-                continue
-            # Try the filename first (yt-dlp default: "Title [VIDEO_ID].info.json").
-            # Fall back to the containing directory name, which covers MeTube's
-            # per-video folder layout: "Channel/Title [VIDEO_ID]/Title.info.json".
-            video_id = extract_video_id(f) or extract_video_id(os.path.basename(root))
-            if not video_id:
-                # No bracket-wrapped ID found — read the canonical ID from the JSON itself.
-                # Handles non-standard output templates where yt-dlp omits [id] from the name.
-                try:
-                    with open(os.path.join(root, f), encoding="utf-8") as fh:
-                        raw_id = json.load(fh).get("id", "")
-                    video_id = raw_id if raw_id and _VALID_ID_RE.match(raw_id) else None
-                except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
-                    logger.warning("build_index: could not read '%s': %s", os.path.join(root, f), e)
-                    read_errors += 1
-            if not video_id:
+    def visit(root: str) -> tuple[_DirListing, int, bool]:
+        """Return (listing, read_errors, relisted) for root; raises OSError."""
+        mtime_ns = os.stat(root).st_mtime_ns
+        cached = dir_cache.get(root) if dir_cache is not None else None
+        if cached is not None and cached.mtime_ns == mtime_ns:
+            return cached, 0, False
+        return *_list_dir(root, mtime_ns, snapshot), True
+
+    def record(root: str, result: tuple[_DirListing, int, bool]) -> list[str]:
+        nonlocal read_errors, relisted
+        listing, errors, was_listed = result
+        listings[root] = listing
+        read_errors += errors
+        relisted += was_listed
+        if errors:
+            uncacheable.add(root)
+        if on_listing is not None:
+            on_listing(root, listing)
+        return [os.path.join(root, d) for d in listing.subdirs]
+
+    # Phase 1: list every directory (fanning out across the pool when workers > 1).
+    if workers <= 1:
+        stack = [data_path]
+        while stack:
+            root = stack.pop()
+            try:
+                result = visit(root)
+            except OSError as e:
+                onerror(e)
                 continue
-            path = os.path.join(root, f)
-            index[video_id] = path
+            stack.extend(record(root, result))
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="yamp-walk") as pool:
+            pending = {pool.submit(visit, data_path): data_path}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    root = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except OSError as e:
+                        onerror(e)
+                        continue
+                    for subdir in record(root, result):
+                        pending[pool.submit(visit, subdir)] = subdir
+
+    # Phase 2: assemble the index in os.walk's top-down pre-order so duplicate IDs
+    # resolve the same way regardless of which listing finished first.
+    index: dict[str, str] = {}
+    stem_index: dict[str, str] = {}
+    order = [data_path]
+    while order:
+        root = order.pop()
+        listing = listings.get(root)
+        if listing is None:
+            continue
+        for f, video_id in listing.sidecars:
+            index[video_id] = os.path.join(root, f)
             stem_index[f.removesuffix(".info.json")] = video_id
+        order.extend(os.path.join(root, d) for d in reversed(listing.subdirs))
+
+    if dir_cache is not None:
+        dir_cache.clear()
+        dir_cache.update((root, listing) for root, listing in listings.items() if root not in uncacheable)
 
     if read_errors:
         logger.error(
@@ -184,12 +362,12 @@ def build_index(data_path: str) -> tuple[dict[str, str], dict[str, str]]:
     if not index:
         logger.warning("Index is empty — no .info.json files found under %s", data_path)
     else:
-        logger.info("Indexed %d videos from %s", len(index), data_path)
+        logger.info("Indexed %d videos from %s (%d directories listed)", len(index), data_path, relisted)
     return index, stem_index
 
 
 def build_meta_cache(video_index: dict[str, str]) -> dict[str, dict]:
-    """Read all indexed info_json files and cache the fields used for collection matching.
+    """Read all indexed info_json files and cache the fields in _meta_fields.
 
     This eliminates disk I/O from recompute_all_collections on subsequent saves.
     Called once at startup and after periodic index rebuilds.
@@ -197,41 +375,336 @@ def build_meta_cache(video_index: dict[str, str]) -> dict[str, dict]:
     cache: dict[str, dict] = {}
     for video_id, path in video_index.items():
         try:
-            with open(path, encoding="utf-8") as f:
-                info = json.load(f)
-            cache[video_id] = {k: info[k] for k in MATCH_FIELDS if k in info}
+            cache[video_id] = load_fields(path, _meta_fields)
         except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
             logger.warning("build_meta_cache: skipping %s: %s", video_id, e)
     logger.info("build_meta_cache: cached %d videos", len(cache))
     return cache
 
 
-def _try_index_from_filename(video_id: str, media_path: str) -> bool:
+def refresh_meta_cache(
+    video_index: dict[str, str],
+    snapshot: Mapping[str, SnapshotEntry],
+    results: dict[str, ProjectionResult] | None = None,
+    budget: IOBudget | None = None,
+    fields: frozenset[str] | None = None,
+) -> tuple[dict[str, dict], dict[str, SnapshotEntry], int]:
+    """Like build_meta_cache, but reuse snapshot entries whose fingerprint is unchanged.
+
+    Costs one stat per indexed file plus one JSON parse per new or modified file.
+    `results` may carry fingerprint_and_project output computed ahead of time by
+    _MetaLoader; indexed paths missing from it are processed inline, paced by budget.
+    Sidecars are projected to `fields` (default _meta_fields); snapshot entries are
+    assumed to hold the same fields.
+    Returns (meta_cache, entries, reread) where entries is the refreshed snapshot
+    for video_index and reread counts the sidecars that had to be parsed.
+    """
+    fields = _meta_fields if fields is None else fields
+    results = dict(results or {})
+    todo = [(p, e.fingerprint if (e := snapshot.get(p)) else None) for p in video_index.values() if p not in results]
+    for start in range(0, len(todo), _MetaLoader.BATCH_SIZE):
+        batch = todo[start : start + _MetaLoader.BATCH_SIZE]
+        if budget is not None:
+            budget.spend(len(batch))
+        results.update((r[0], r) for r in fingerprint_and_project(batch, fields))
+
+    cache: dict[str, dict] = {}
+    entries: dict[str, SnapshotEntry] = {}
+    reread = 0
+    for video_id, path in video_index.items():
+        _, fingerprint, status, payload = results[path]
+        if fingerprint is None:
+            logger.warning("refresh_meta_cache: skipping %s: could not stat '%s'", video_id, path)
+            continue
+        if status == "unchanged":
+            meta = snapshot[path].meta
+        else:
+            reread += 1
+            if status == "read":
+                meta = payload
+            elif status == "corrupt":
+                # Recorded with meta=None so an unchanged corrupt file is not re-parsed every startup.
+                logger.warning("refresh_meta_cache: skipping %s: %s", video_id, payload)
+                meta = None
+            else:
+                # Possibly transient — leave it out of the snapshot so the next refresh retries.
+                logger.warning("refresh_meta_cache: skipping %s: %s", video_id, payload)
+                continue
+        entries[path] = SnapshotEntry(video_id, fingerprint, meta)
+        if meta is not None:
+            cache[video_id] = meta
+    logger.info("refresh_meta_cache: cached %d videos (%d re-read from disk)", len(cache), reread)
+    return cache, entries, reread
+
+
+class _MetaLoader:
+    """Feed changed sidecars to a process pool as build_index lists their directories.
+
+    Parsing a large library is CPU-bound, so sidecars are sharded into batches and
+    projected by fingerprint_and_project in worker processes while the walk is still
+    running. Sidecars are stat'ed here first and only those whose fingerprint differs
+    from the snapshot are queued; the pool is started once a full batch of them has
+    queued up. Passes over a mostly unchanged library (scheduled reconciles) and small
+    libraries never pay the process start-up cost; leftovers are parsed inline by
+    refresh_meta_cache.
+    """
+
+    BATCH_SIZE = 256
+
+    def __init__(
+        self,
+        snapshot: Mapping[str, SnapshotEntry],
+        workers: int,
+        budget: IOBudget | None = None,
+        fields: frozenset[str] | None = None,
+    ) -> None:
+        self._snapshot = snapshot
+        self._workers = workers
+        self._budget = budget
+        self._fields = _meta_fields if fields is None else fields
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending: list[tuple[str, Fingerprint | None]] = []
+        self._futures: list[Future] = []
+        self._results: dict[str, ProjectionResult] = {}  # sidecars settled by their stat alone
+
+    def add_listing(self, root: str, listing: _DirListing) -> None:
+        if self._budget is not None:
+            self._budget.spend(1)  # the directory stat build_index just made
+        if self._workers <= 1:
+            return
+        for f, _ in listing.sidecars:
+            path = os.path.join(root, f)
+            prev = self._snapshot.get(path)
+            known = prev.fingerprint if prev else None
+            if known is not None:
+                if self._budget is not None:
+                    self._budget.spend(1)
+                fingerprint = file_fingerprint(path)
+                if fingerprint is None:
+                    self._results[path] = (path, None, "missing", None)
+                    continue
+                if fingerprint == known:
+                    self._results[path] = (path, fingerprint, "unchanged", None)
+                    continue
+            self._pending.append((path, known))
+        while len(self._pending) >= self.BATCH_SIZE:
+            if self._pool is None:
+                # spawn, not fork: the server process has live threads (event loop, watcher).
+                self._pool = ProcessPoolExecutor(max_workers=self._workers, mp_context=mp.get_context("spawn"))
+            batch, self._pending = self._pending[: self.BATCH_SIZE], self._pending[self.BATCH_SIZE :]
+            if self._budget is not None:
+                self._budget.spend(len(batch))
+            self._futures.append(self._pool.submit(fingerprint_and_project, batch, self._fields))
+
+    def results(self) -> dict[str, ProjectionResult]:
+        """Wait for the submitted batches and return their results keyed by path."""
+        results = self._results
+        if self._pool is None:
+            return results
+        try:
+            for future in self._futures:
+                try:
+                    results.update((r[0], r) for r in future.result())
+                except Exception as e:  # e.g. BrokenProcessPool — refresh_meta_cache reads these inline
+                    logger.error("_MetaLoader: worker batch failed — reading inline instead: %s", e)
+        finally:
+            self._pool.shutdown()
+        return results
+
+
+async def _try_index_from_filename(video_id: str, media_path: str) -> bool:
     """Try to index a single video by finding its .info.json alongside the media file.
 
     Plex sends the full media file path in the match request. The sidecar .info.json
     lives next to it (yt-dlp flat layout) or in the same per-video folder (MeTube layout).
+    If it is not under the media file's own name, the media file's directory and its
+    parent are listed and every sidecar not yet indexed there is indexed — at most two
+    directory listings, so a freshly downloaded file never costs a library walk. The
+    listing and reading run in a thread; the result is published on the event loop.
     Returns True if the entry was added to the index.
     """
+    changes = await asyncio.to_thread(_sidecars_near_media, video_id, media_path)
+    _publish_changes(changes)
+    if video_id in _index.videos:
+        logger.info("Indexed new video '%s' from %d sidecar(s) near %s", video_id, len(changes), media_path)
+        return True
+    return False
+
+
+def _sidecars_near_media(video_id: str, media_path: str) -> list[tuple[str, SnapshotEntry | None]]:
+    """Find and read the sidecars _try_index_from_filename indexes. Synchronous — call via thread."""
+    data_root = Path(DATA_PATH).resolve()
     p = Path(media_path).resolve()
-    if not p.is_relative_to(Path(DATA_PATH).resolve()):
+    if not p.is_relative_to(data_root):
         logger.warning("_try_index_from_filename: path '%s' is outside DATA_PATH — ignoring", media_path)
-        return False
+        return []
     # yt-dlp flat:  Title [ID].mp4  →  Title [ID].info.json
     # MeTube:       Title [ID]/Title.mp4  →  Title [ID]/Title.info.json
-    candidate = p.with_suffix(".info.json")
-    if candidate.is_file():
-        _video_index[video_id] = str(candidate)
-        _stem_index[candidate.name.removesuffix(".info.json")] = video_id
-        logger.info("Indexed new video '%s' from sidecar: %s", video_id, candidate)
+    candidate = str(p.with_suffix(".info.json"))
+    fingerprint = file_fingerprint(candidate)
+    if fingerprint is not None:
+        meta: dict | None = None
         try:
-            with open(candidate, encoding="utf-8") as f:
-                info = json.load(f)
-            _video_meta_cache[video_id] = {k: info[k] for k in MATCH_FIELDS if k in info}
+            meta = load_fields(candidate, _meta_fields)
         except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
             logger.warning("_try_index_from_filename: could not cache meta for %s: %s", video_id, e)
-        return True
-    return False
+        return [(candidate, SnapshotEntry(video_id, fingerprint, meta))]
+
+    known = _index.entries
+    paths: list[str] = []
+    for directory in (p.parent, p.parent.parent):
+        if not directory.is_relative_to(data_root):
+            break
+        try:
+            with os.scandir(directory) as it:
+                paths += [e.path for e in it if e.name.endswith(SIDECAR_SUFFIX) and e.path not in known]
+        except OSError as e:
+            logger.warning("_try_index_from_filename: cannot list '%s': %s", directory, e)
+    return [(path, entry) for path, entry in _read_sidecars(paths) if entry is not None]
+
+
+def _read_sidecars(paths: list[str]) -> list[tuple[str, SnapshotEntry | None]]:
+    """Read changed sidecars for incremental indexing. Synchronous — call via thread.
+
+    Returns (path, entry) pairs; entry is None when the file is gone or has no usable
+    video ID. Files that exist but cannot be read are left out so their current index
+    entry is kept until the next change.
+    """
+    fields = _meta_fields
+    results: list[tuple[str, SnapshotEntry | None]] = []
+    for path in paths:
+        fingerprint = file_fingerprint(path)
+        if fingerprint is None:
+            results.append((path, None))
+            continue
+        meta: dict | None = None
+        raw_id = ""
+        try:
+            info = load_fields(path, fields | {"id"})
+            meta = {k: v for k, v in info.items() if k in fields}
+            raw_id = info.get("id", "")
+        except OSError as e:
+            logger.warning("_read_sidecars: could not read '%s' — keeping current entry: %s", path, e)
+            continue
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logger.warning("_read_sidecars: could not parse '%s': %s", path, e)
+        # Same ID resolution order as build_index: filename, parent directory, then JSON "id".
+        video_id = extract_video_id(os.path.basename(path)) or extract_video_id(os.path.basename(os.path.dirname(path)))
+        if not video_id and raw_id and _VALID_ID_RE.match(raw_id):
+            video_id = raw_id
+        results.append((path, SnapshotEntry(video_id, fingerprint, meta) if video_id else None))
+    return results
+
+
+def _publish_changes(changes: list[tuple[str, SnapshotEntry | None]]) -> None:
+    """Publish the next index generation with these .info.json paths re-synced (entry=None drops)."""
+    global _index, _snapshot_dirty
+    if changes:
+        _index = _index.apply(changes)
+        _snapshot_dirty = True
+
+
+async def _on_sidecar_changes(changes: list[Change]) -> None:
+    """Watcher callback: re-read the changed sidecars in a thread, then update the index.
+
+    Every change is treated as "re-sync this path" — the file's current state on disk
+    decides whether it is indexed, so event kinds and ordering within a batch don't matter.
+    """
+    paths = list(dict.fromkeys(path for _, path in changes))
+    results = await asyncio.to_thread(_read_sidecars, paths)
+    _publish_changes(results)
+    logger.info("Sidecar watcher: applied %d change(s) — %d videos indexed", len(results), len(_index.videos))
+
+
+# ── Collection map watcher ────────────────────────────────────────────────────
+
+
+def _names_are_unique(collections: list) -> bool:
+    """True if every collection is an object with a name, and no two share one."""
+    if not isinstance(collections, list):
+        return False
+    names = [c.get("name") if isinstance(c, dict) else None for c in collections]
+    return all(isinstance(n, str) and n for n in names) and len(names) == len(set(names))
+
+
+async def _apply_map_edit() -> bool:
+    """Recompute the collections whose rules a hand edit of the collection map changed.
+
+    Returns True if a recompute ran.
+    """
+    mapping_path = await asyncio.to_thread(_collection_map_path)
+    if not mapping_path:
+        return False
+    try:
+        edit = await asyncio.to_thread(take_map_edit, mapping_path)
+    except (OSError, ValueError) as e:
+        logger.error("_apply_map_edit: could not read collection map at '%s': %s", mapping_path, e)
+        return False
+    if edit is None:
+        return False
+    old_cols, new_cols = edit
+    if not _names_are_unique(new_cols):
+        # PUT rejects such lists too; matching keys collections by name.
+        logger.error(
+            "_apply_map_edit: edited collection map has collections with missing or duplicate names — "
+            "not recomputing until they are fixed"
+        )
+        return False
+    rules_changed: set[str] | None
+    if not _names_are_unique(old_cols):
+        # The diff keys collections by name, so it can't tell what the edit changed.
+        rules_changed = None
+        logger.info("_apply_map_edit: collection map edited on disk — recomputing every collection")
+    else:
+        try:
+            rules_changed, has_rule_changes = diff_collections(old_cols, new_cols)
+        except (KeyError, TypeError, AttributeError) as e:
+            logger.error("_apply_map_edit: edited collection map has a malformed collection — not recomputing: %s", e)
+            return False
+        if not has_rule_changes:
+            logger.info("_apply_map_edit: collection map edited on disk — no rule changes")
+            return False
+        logger.info("_apply_map_edit: collection map edited on disk — recomputing %s", ", ".join(sorted(rules_changed)))
+
+    _retarget_meta_cache(new_cols)
+    index = _index  # one consistent generation for the whole thread
+    try:
+        stats = await asyncio.to_thread(
+            recompute_all_collections,
+            index.videos,
+            mapping_path,
+            index.meta,
+            index.postings,
+            rules_changed,
+            RECOMPUTE_WORKERS,
+        )
+    except (OSError, ValueError) as e:
+        logger.error("_apply_map_edit: recompute failed — save the collections again to retry: %s", e)
+        return False
+    logger.info("_apply_map_edit: %d matched, %d unmatched", stats["matched"], stats["unmatched"])
+
+    if PLEX_URL and PLEX_TOKEN:
+        task = asyncio.ensure_future(_do_rescan_bg())
+        task.add_done_callback(lambda f: _log_task_exception(f, "rescan after collection map edit"))
+    changed_names = [c["name"] for c in new_cols] if rules_changed is None else list(rules_changed)
+    task = asyncio.ensure_future(_prefetch_channel_art_bg(changed_names))
+    task.add_done_callback(lambda f: _log_task_exception(f, "channel art prefetch after collection map edit"))
+    return True
+
+
+async def _watch_collection_map(interval: float) -> None:
+    """Check the collection map for hand edits every `interval` seconds until cancelled.
+
+    Polled rather than watched with inotify: one stat per check finds edits on network
+    mounts too, and files replaced by a git checkout or sync change inode.
+    """
+    logger.info("Watching the collection map for edits (every %.0fs)", interval)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await _apply_map_edit()
+        except Exception:
+            logger.exception("_watch_collection_map: failed to apply an edit of the collection map")
 
 
 # ── Channel art helpers ───────────────────────────────────────────────────────
@@ -337,40 +810,50 @@ def _get_channel_urls_for_collection(collection_name: str) -> list[str]:
         logger.debug("_get_channel_urls_for_collection: no collection map found for '%s'", collection_name)
         return []
     try:
-        data = load_map(mapping_path)
+        collections = read_collections(mapping_path)
     except (OSError, ValueError) as e:
         logger.error("_get_channel_urls_for_collection: failed to load collection map at '%s': %s", mapping_path, e)
         return []
 
-    col = next((c for c in data.get("collections", []) if c.get("name") == collection_name), None)
+    col = next((c for c in collections if c.get("name") == collection_name), None)
     if not col:
         return []
 
-    matched_ids = data.get("matched_ids", [])
-    # Filter to IDs actually in this collection using the in-memory meta cache for the
-    # match check (no disk I/O). Only read info.json from disk for matched videos, and
-    # only to extract uploader_url which is not stored in the meta cache.
-    col_spec = [{"name": col["name"], "rules": col.get("rules", [])}]
+    # Members come from the materialized membership (no per-video matching). Only read
+    # info.json from disk for members, and only to extract uploader_url which is not
+    # stored in the meta cache.
+    index = _index
+    membership = collection_membership(compile_collections(collections), index.postings)
+    if membership is not None:
+        members = membership.members(collection_name)
+    else:
+        col_spec = compile_collections([{"name": col["name"], "rules": col.get("rules", [])}])
+        members = []
+        try:
+            matched_ids = read_map(mapping_path).get("matched_ids", [])
+        except (OSError, ValueError) as e:
+            logger.error("_get_channel_urls_for_collection: failed to load collection map at '%s': %s", mapping_path, e)
+            return []
+        for video_id in matched_ids:
+            cached = index.meta.get(video_id)
+            if cached is None:
+                continue
+            try:
+                matched, _ = match_video(cached, col_spec)
+            except Exception:
+                logger.warning("_get_channel_urls_for_collection: match_video raised for '%s' — skipping", video_id)
+                continue
+            if matched:
+                members.append(video_id)
     seen: set[str] = set()
     urls: list[str] = []
-    for video_id in matched_ids:
-        cached = _video_meta_cache.get(video_id)
-        if cached is None:
-            continue
-        try:
-            matched, _ = match_video(cached, col_spec)
-        except Exception:
-            logger.warning("_get_channel_urls_for_collection: match_video raised for '%s' — skipping", video_id)
-            continue
-        if not matched:
-            continue
+    for video_id in members:
         # Disk read only for matched videos, solely to get uploader_url.
-        info_path = _video_index.get(video_id)
+        info_path = index.videos.get(video_id)
         if not info_path:
             continue
         try:
-            with open(info_path, encoding="utf-8") as f:
-                info = json.load(f)
+            info = load_fields(info_path, ("uploader_url",))
         except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
             logger.warning("_get_channel_urls_for_collection: skipping '%s' at '%s': %s", video_id, info_path, e)
             continue
@@ -433,7 +916,7 @@ async def _prefetch_channel_art_bg(collection_names: list[str]) -> None:
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global _video_index, _stem_index, _video_meta_cache
+    global _watcher_task, _reconcile_task, _map_watch_task, _meta_fields
     if not os.path.isdir(DATA_PATH):
         logger.error(
             "YOUTUBE_DATA_PATH '%s' does not exist or is not a directory. Refusing to start.",
@@ -441,8 +924,30 @@ async def lifespan(app: FastAPI):
         )
         raise RuntimeError(f"YOUTUBE_DATA_PATH '{DATA_PATH}' is not a directory")
     _migrate_yamp_dir()
-    _video_index, _stem_index = build_index(DATA_PATH)
-    _video_meta_cache = build_meta_cache(_video_index)
+    if STORAGE == "sqlite":
+        _migrate_to_sqlite()
+    _meta_fields = _rule_meta_fields()
+    snapshot = _load_index_snapshot(DATA_PATH, _meta_fields)
+    started = time.monotonic()
+    changed = _install_indexes(_rebuild_indexes(DATA_PATH, snapshot, _dir_cache))
+    _reconciler.record_pass(time.monotonic() - started, changed)
+    _reconcile_task = asyncio.ensure_future(_reconciler.run_forever())
+    _reconcile_task.add_done_callback(lambda f: _log_task_exception(f, "index reconciler"))
+
+    _watcher_task = asyncio.ensure_future(
+        watch_sidecars(
+            DATA_PATH,
+            _on_sidecar_changes,
+            WATCH_MODE,
+            WATCH_POLL_INTERVAL,
+            _poller_baseline,
+            lambda: _reconciler.throttle,
+        )
+    )
+    _watcher_task.add_done_callback(lambda f: _log_task_exception(f, "sidecar watcher"))
+    if MAP_WATCH_INTERVAL > 0:
+        _map_watch_task = asyncio.ensure_future(_watch_collection_map(MAP_WATCH_INTERVAL))
+        _map_watch_task.add_done_callback(lambda f: _log_task_exception(f, "collection map watcher"))
 
     if not _YT_DLP_AVAILABLE:
         logger.warning("yt-dlp is not installed — channel art fetching disabled")
@@ -450,29 +955,194 @@ async def lifespan(app: FastAPI):
     # Pre-fetch channel art for all collections with matched videos in the background.
     mapping_path = _collection_map_path()
     if mapping_path:
-        col_map: dict = {}
+        collections: list[dict] = []
         try:
-            col_map = load_map(mapping_path)
+            collections = read_collections(mapping_path)
         except OSError as e:
             logger.error("lifespan: could not read collection map for channel art prefetch: %s", e)
         except ValueError as e:
             logger.error("lifespan: collection map is corrupt — channel art prefetch skipped: %s", e)
-        names = [c.get("name") for c in col_map.get("collections", []) if c.get("name")]
+        names = [c.get("name") for c in collections if c.get("name")]
         if names:
             task = asyncio.ensure_future(_prefetch_channel_art_bg(names))
             task.add_done_callback(lambda f: _log_task_exception(f, "lifespan channel art prefetch"))
 
     yield
 
+    _watcher_task.cancel()
+    _reconcile_task.cancel()
+    if _map_watch_task is not None:
+        _map_watch_task.cancel()
+    # Write behind whatever match state is still only in memory.
+    await asyncio.to_thread(flush_maps)
+    if _snapshot_dirty and _index.meta_fields is not None:
+        # Persist what the watcher learned so the next startup doesn't re-read those files.
+        try:
+            await asyncio.to_thread(_save_index_snapshot, DATA_PATH, _index.entries, _index.meta_fields)
+        except OSError as e:
+            logger.warning("lifespan: could not save index snapshot on shutdown: %s", e)
+
+
+def _snapshot_path(data_path: str) -> str:
+    return os.path.join(data_path, YAMP_DIR, SNAPSHOT_FILE_NAME)
+
+
+def _load_index_snapshot(data_path: str, fields: frozenset[str]) -> dict[str, SnapshotEntry]:
+    """Load the index snapshot from the SQLite store of .yamp/ if it has one, else from the JSON file."""
+    store = open_store(os.path.join(data_path, YAMP_DIR))
+    if store is None:
+        return load_snapshot(_snapshot_path(data_path), fields)
+    try:
+        return store.load_snapshot(fields)
+    except OSError as e:
+        logger.warning("_load_index_snapshot: could not read the stored snapshot — starting cold: %s", e)
+        return {}
+
+
+def _save_index_snapshot(data_path: str, entries: Mapping[str, SnapshotEntry], fields: frozenset[str]) -> None:
+    """Save the index snapshot where _load_index_snapshot reads it. Raises OSError."""
+    store = open_store(os.path.join(data_path, YAMP_DIR))
+    if store is None:
+        save_snapshot(_snapshot_path(data_path), entries, fields)
+    else:
+        store.save_snapshot(entries, fields)
+
+
+def _rule_meta_fields() -> frozenset[str]:
+    """Fields the meta cache needs for the rules in the current collection map (BASE_FIELDS if unreadable)."""
+    mapping_path = _collection_map_path()
+    if not mapping_path:
+        return BASE_FIELDS
+    try:
+        return projected_fields(read_collections(mapping_path))
+    except (OSError, ValueError) as e:
+        logger.error("_rule_meta_fields: could not read collection map — caching base fields only: %s", e)
+        return BASE_FIELDS
+
+
+def _rebuild_indexes(
+    data_path: str,
+    snapshot: Mapping[str, SnapshotEntry],
+    dir_cache: dict[str, _DirListing] | None = None,
+    budget: IOBudget | None = None,
+    snapshot_fields: frozenset[str] | None = None,
+) -> tuple[dict, dict, dict, dict, frozenset[str]]:
+    """Build video index, stem index, meta cache, and index snapshot in one synchronous call.
+
+    Sidecars whose fingerprint matches `snapshot` are not re-read, and with a
+    dir_cache only directories whose mtime changed are re-listed. Sidecars are parsed
+    on META_WORKERS processes while the walk is still running. The refreshed
+    snapshot is written to .yamp/ when anything changed, for the next warm start.
+    With a budget, each directory and sidecar stat is charged to it, which paces the pass.
+    The meta cache is projected to _meta_fields. If `snapshot_fields` (the fields the
+    snapshot holds; None means the same) lacks one of them, every sidecar is re-read;
+    fields no longer needed are dropped from the snapshot's meta.
+    Returns (video_index, stem_index, meta_cache, snapshot, fields) for publishing as one VideoIndex.
+    """
+    fields = _meta_fields
+    known = snapshot
+    if snapshot_fields is not None and snapshot_fields != fields:
+        logger.info(
+            "_rebuild_indexes: meta cache fields changed (+%s, -%s)",
+            ", ".join(sorted(fields - snapshot_fields)) or "none",
+            ", ".join(sorted(snapshot_fields - fields)) or "none",
+        )
+        # The snapshot still supplies video IDs to build_index either way.
+        if not fields <= snapshot_fields:
+            known = {}
+        else:
+            known = {
+                path: e if e.meta is None else e._replace(meta={k: v for k, v in e.meta.items() if k in fields})
+                for path, e in snapshot.items()
+            }
+    loader = _MetaLoader(known, META_WORKERS, budget, fields)
+    idx, stem = build_index(data_path, snapshot, dir_cache, INDEX_WORKERS, loader.add_listing)
+    cache, entries, reread = refresh_meta_cache(idx, known, loader.results(), budget, fields)
+    if reread or entries.keys() != snapshot.keys() or known is not snapshot:
+        try:
+            _save_index_snapshot(data_path, entries, fields)
+        except OSError as e:
+            logger.warning("_rebuild_indexes: could not save index snapshot — next startup will be cold: %s", e)
+    return idx, stem, cache, entries, fields
+
+
+def _install_indexes(result: tuple[dict, dict, dict, dict, frozenset[str]]) -> bool:
+    """Publish a _rebuild_indexes result as the next index generation. Returns True if anything changed."""
+    global _index
+    previous = _index
+    _index = _index.updated(*result)
+    return _index is not previous
+
+
+def _poller_baseline() -> dict[str, tuple[int, tuple[str, ...], dict[str, Fingerprint]]]:
+    """The tree as the last index walk listed it, to prime the polling watcher without another walk.
+
+    Sidecars without a video ID are not in the listings; the poller reports them as
+    added the next time their directory changes, and re-syncing them is a no-op.
+    """
+    dir_cache, entries = dict(_dir_cache), _index.entries
+    baseline = {}
+    for root, listing in dir_cache.items():
+        sidecars = {}
+        for f, _ in listing.sidecars:
+            entry = entries.get(os.path.join(root, f))
+            if entry is not None:
+                sidecars[f] = entry.fingerprint
+        baseline[root] = (listing.mtime_ns, listing.subdirs, sidecars)
+    return baseline
+
+
+def _reconcile(budget: IOBudget) -> tuple[dict, dict, dict, dict, frozenset[str]]:
+    """One reconciliation pass: an incremental rebuild against the current index (worker thread)."""
+    index = _index
+    return _rebuild_indexes(DATA_PATH, index.entries, _dir_cache, budget, index.meta_fields)
+
+
+# Every rebuild — scheduled, on an index miss, or via the API — goes through this one
+# Reconciler, so concurrent callers share the pass in flight.
+_reconciler: Reconciler = Reconciler(
+    _reconcile, _install_indexes, RECONCILE_IOPS, RECONCILE_MIN_INTERVAL, RECONCILE_MAX_INTERVAL
+)
+
 
-def _rebuild_indexes(data_path: str) -> tuple[dict, dict, dict]:
-    """Build video index, stem index, and meta cache in one synchronous call.
+def _retarget_meta_cache(collections: list[dict]) -> None:
+    """Project the meta cache to the fields these collections' rules read, catching up in the background.
 
-    Returns (video_index, stem_index, meta_cache) so all three globals can be
-    replaced atomically in a single assignment — no window where they're mismatched.
+    Until a pass has re-projected it, recomputes that need a new field read the sidecars instead.
     """
-    idx, stem = build_index(data_path)
-    return idx, stem, build_meta_cache(idx)
+    global _meta_fields
+    fields = projected_fields(collections)
+    if fields == _meta_fields:
+        return
+    _meta_fields = fields
+    task = asyncio.ensure_future(_reproject_meta_cache())
+    task.add_done_callback(lambda f: _log_task_exception(f, "meta cache reprojection"))
+
+
+async def _reproject_meta_cache() -> None:
+    """Run throttled index passes until the published meta cache is projected to _meta_fields."""
+    # A pass already in flight may have started with the old fields, hence the loop.
+    while _index.meta_fields != _meta_fields:
+        await _reconciler.run_pass(throttled=True)
+
+
+def _known_missing(video_id: str) -> bool:
+    """True if a rebuild in the current index generation already failed to find video_id."""
+    entry = _missing_ids.get(video_id)
+    if entry is None:
+        return False
+    generation, expires = entry
+    if generation == _index.generation and time.monotonic() < expires:
+        return True
+    del _missing_ids[video_id]
+    return False
+
+
+def _remember_missing(video_id: str) -> None:
+    _missing_ids[video_id] = (_index.generation, time.monotonic() + _MISSING_ID_TTL)
+    _missing_ids.move_to_end(video_id)
+    while len(_missing_ids) > _MISSING_IDS_MAX:
+        _missing_ids.popitem(last=False)
 
 
 app = FastAPI(title="YAMP", lifespan=lifespan)
@@ -480,25 +1150,29 @@ app = FastAPI(title="YAMP", lifespan=lifespan)
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
 
-async def _get_info_json(video_id: str) -> dict:
+async def _get_info_json(video_id: str, fields: frozenset[str] | None = None) -> dict:
     """
-    Load info_json for a video.
+    Load info_json for a video — only the given top-level keys when fields is set.
 
     If the video ID is not in the current index, triggers an index rebuild
-    (rate-limited to once per 60 s) before retrying. Raises HTTP 404 if
-    still not found after rebuild, or HTTP 500 on read/parse failure.
+    (joining any pass already in flight, or else only if the reconciler's duty cycle
+    allows one now) before retrying — unless a rebuild since the index last changed
+    already missed this ID. This holds while the sidecar watcher runs too: it can miss
+    events (in-place edits, overflowed inotify queues) that a rebuild picks up.
+    Raises HTTP 404 if still not found, or HTTP 500 on read/parse failure.
     """
-    global _video_index, _stem_index, _video_meta_cache, _last_rebuild
-    path = _video_index.get(video_id)
-    if not path:
-        if time.monotonic() - _last_rebuild > _REBUILD_COOLDOWN:
-            _video_index, _stem_index, _video_meta_cache = await asyncio.to_thread(_rebuild_indexes, DATA_PATH)
-            _last_rebuild = time.monotonic()
-        path = _video_index.get(video_id)
+    path = _index.videos.get(video_id)
+    if not path and not _known_missing(video_id) and _reconciler.may_run_now():
+        await _reconciler.run_pass()
+        path = _index.videos.get(video_id)
+        if not path:
+            _remember_missing(video_id)
     if not path:
         logger.warning("Video '%s' not found in index (after rebuild)", video_id)
         raise HTTPException(status_code=404, detail=f"Video '{video_id}' not found")
     try:
+        if fields is not None:
+            return load_fields(path, fields)
         with open(path, encoding="utf-8") as f:
             return json.load(f)
     except OSError as e:
@@ -557,6 +1231,35 @@ def _migrate_yamp_dir() -> None:
         )
 
 
+def _migrate_to_sqlite() -> None:
+    """One-time migration for YAMP_STORAGE=sqlite: move the JSON collection map and index snapshot into SQLite.
+
+    No-op if there is no collection map or it is in SQLite already. The JSON files are
+    kept with a .bak suffix. On failure the JSON files stay in use.
+    """
+    mapping_path = _collection_map_path()
+    if not mapping_path:
+        return
+    try:
+        if not migrate_map_to_sqlite(mapping_path):
+            return
+    except (OSError, ValueError) as e:
+        logger.error("_migrate_to_sqlite: could not move the collection map into SQLite: %s", e)
+        return
+    snapshot_path = _snapshot_path(DATA_PATH)
+    if not os.path.exists(snapshot_path):
+        return
+    store = open_store(_YAMP_DIR)
+    assert store is not None
+    fields = _rule_meta_fields()
+    try:
+        store.save_snapshot(load_snapshot(snapshot_path, fields), fields)
+        os.replace(snapshot_path, snapshot_path + ".bak")
+    except OSError as e:
+        # Only costs a cold start — the next rebuild stores a fresh snapshot.
+        logger.warning("_migrate_to_sqlite: could not move the index snapshot into SQLite: %s", e)
+
+
 _ASSETS_FILENAME_RE = re.compile(r"^[a-z0-9_-]{1,200}\.(jpg|jpeg|png|webp)$", re.IGNORECASE)
 
 
@@ -607,6 +1310,10 @@ async def get_provider():
     }
 
 
+# info_json keys each Plex endpoint reads — only these are decoded from the sidecar.
+_MATCH_RESPONSE_FIELDS = frozenset({"title", "upload_date"})
+
+
 @app.post("/movies/library/metadata/matches")
 async def match(request: Request):
     """
@@ -623,17 +1330,17 @@ async def match(request: Request):
     if not video_id:
         video_id = extract_video_id(Path(filename).parent.name)
     if not video_id:
-        video_id = _stem_index.get(Path(filename).stem)
+        video_id = _index.stems.get(Path(filename).stem)
     if not video_id:
         safe_filename = "".join(c for c in filename[:256] if c >= " ")
         logger.warning("Could not extract video ID from filename: %s", safe_filename)
         return JSONResponse(_media_container([]))
 
-    if video_id not in _video_index and filename:
-        _try_index_from_filename(video_id, filename)
+    if video_id not in _index.videos and filename:
+        await _try_index_from_filename(video_id, filename)
 
     try:
-        info_json = await _get_info_json(video_id)
+        info_json = await _get_info_json(video_id, _MATCH_RESPONSE_FIELDS)
     except HTTPException as exc:
         if exc.status_code == 404:
             logger.warning("No info_json found for video ID: %s", video_id)
@@ -681,7 +1388,7 @@ _THUMB_MIME = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png",
 
 def _local_thumb_path(video_id: str) -> Path | None:
     """Return the path to a local thumbnail file for video_id, or None."""
-    path = _video_index.get(video_id)
+    path = _index.videos.get(video_id)
     if not path:
         return None
     base = Path(path).with_suffix("").with_suffix("")
@@ -704,12 +1411,11 @@ async def api_thumbnail(video_id: str):
     if thumb:
         return FileResponse(str(thumb), media_type=_THUMB_MIME.get(thumb.suffix.lower(), "image/jpeg"))
     # No local file — proxy the remote thumbnail so Plex always gets a YAMP-served URL
-    info_path = _video_index.get(video_id)
+    info_path = _index.videos.get(video_id)
     if not info_path:
         raise HTTPException(status_code=404, detail="Video not found")
     try:
-        with open(info_path, encoding="utf-8") as f:
-            info = json.load(f)
+        info = load_fields(info_path, ("thumbnail",))
     except OSError as e:
         logger.error("api_thumbnail: could not read info_json for '%s' at '%s': %s", video_id, info_path, e)
         raise HTTPException(status_code=500, detail=f"Could not read metadata for '{video_id}'") from e
@@ -742,7 +1448,7 @@ async def get_images(rating_key: str, request: Request):
         logger.warning("get_images: invalid video ID format: %r", video_id)
         raise HTTPException(status_code=404)
 
-    await _get_info_json(video_id)
+    await _get_info_json(video_id, frozenset({"id"}))
     images = []
 
     # Always proxy through YAMP — derive our own URL from the incoming request so
@@ -771,13 +1477,16 @@ async def get_metadata(rating_key: str):
         logger.warning("get_metadata: invalid video ID format: %r", video_id)
         raise HTTPException(status_code=404)
 
-    info_json = await _get_info_json(video_id)
+    # The rule fields too, for matching when the membership can't be used.
+    info_json = await _get_info_json(video_id, METADATA_FIELDS | _meta_fields)
 
     mapping_path = _collection_map_path()
     collections: list[str] = []
     if mapping_path:
         try:
-            collections = await asyncio.to_thread(resolve_collections, info_json, mapping_path)
+            collections = await asyncio.to_thread(
+                resolve_collections, info_json, mapping_path, _index.postings, MAP_FLUSH_DELAY
+            )
         except OSError as e:
             logger.error(
                 "resolve_collections failed for '%s' (I/O error, collection state not persisted): %s",
@@ -864,7 +1573,7 @@ async def api_get_collections():
             "unmatched_count": 0,
         }
     try:
-        data = load_map(mapping_path)
+        summary = read_map_summary(mapping_path)
     except OSError as e:
         logger.error("api_get_collections: could not read collection map at '%s': %s", mapping_path, e)
         raise HTTPException(status_code=500, detail="Collection map could not be read — check file permissions") from e
@@ -883,13 +1592,8 @@ async def api_get_collections():
             logger.exception("api_get_collections: unexpected error fetching Plex thumbs")
             plex_thumb_error = True
 
-    collections = [{**col, "plex_thumb": plex_thumbs.get(col.get("name"))} for col in data.get("collections", [])]
-    result: dict = {
-        "collections": collections,
-        "unmatched_tags": data.get("unmatched_tags", {}),
-        "matched_count": len(data.get("matched_ids", [])),
-        "unmatched_count": len(data.get("unmatched_ids", [])),
-    }
+    collections = [{**col, "plex_thumb": plex_thumbs.get(col.get("name"))} for col in summary["collections"]]
+    result: dict = {**summary, "collections": collections}
     if plex_thumb_error:
         result["plex_thumb_error"] = True
     return result
@@ -901,7 +1605,7 @@ async def api_put_collections(body: CollectionsBody, background_tasks: Backgroun
     if not mapping_path:
         raise HTTPException(status_code=404, detail="Collection map not found")
     try:
-        data = load_map(mapping_path)
+        data = read_map(mapping_path)
     except OSError as e:
         logger.error("api_put_collections: could not read collection map at '%s': %s", mapping_path, e)
         raise HTTPException(status_code=500, detail="Collection map could not be read — check file permissions") from e
@@ -915,19 +1619,23 @@ async def api_put_collections(body: CollectionsBody, background_tasks: Backgroun
 
     data["collections"] = new_cols
     try:
-        save_map(mapping_path, data)
+        write_map(mapping_path, data)
     except OSError as e:
         logger.error("api_put_collections: failed to save collection map at '%s': %s", mapping_path, e)
         raise HTTPException(status_code=500, detail="Could not write collection map") from e
 
     if has_rule_changes:
-        cache = _video_meta_cache  # capture ref before thread dispatch
+        _retarget_meta_cache(new_cols)
+        index = _index  # one consistent generation for the whole thread
         try:
             stats = await asyncio.to_thread(
                 recompute_all_collections,
-                _video_index,
+                index.videos,
                 mapping_path,
-                cache,
+                index.meta,
+                index.postings,
+                rules_changed,
+                RECOMPUTE_WORKERS,
             )
         except (OSError, ValueError) as e:
             logger.error("api_put_collections: recompute failed: %s", e)
@@ -969,6 +1677,20 @@ async def api_put_collections(body: CollectionsBody, background_tasks: Backgroun
     return {"ok": True, **stats, "plex_sync": plex_tasks_queued}
 
 
+@app.get("/api/collections/rule-stats")
+async def api_collection_rule_stats():
+    """Per-rule hit rates and evaluation costs measured during recomputes, and the resulting rule order."""
+    mapping_path = _collection_map_path()
+    if not mapping_path:
+        return {"collections": []}
+    try:
+        collections = read_collections(mapping_path)
+    except (OSError, ValueError) as e:
+        logger.error("api_collection_rule_stats: could not read collection map at '%s': %s", mapping_path, e)
+        raise HTTPException(status_code=500, detail="Collection map could not be read") from e
+    return {"collections": rule_stats_report(collections)}
+
+
 @app.get("/api/channel-art")
 async def api_channel_art(collection: str):
     """Return cached channel avatar/banner options for a collection.
@@ -1002,18 +1724,29 @@ async def api_channel_art(collection: str):
     return result
 
 
-def _build_video_list(video_index: dict[str, str], collections: list[dict]) -> tuple[list[dict], list[str]]:
+# Fields the video list displays; the fields the rules read are loaded alongside.
+_VIDEO_LIST_FIELDS = frozenset({"title", "channel", "uploader", "thumbnail", "tags", "upload_date"})
+
+
+def _build_video_list(
+    video_index: Mapping[str, str], collections: list[dict], postings: VideoPostings | None = None
+) -> tuple[list[dict], list[str]]:
     """Synchronous helper: build the video list from the index. Run via asyncio.to_thread.
 
+    With postings for video_index, each video's collections come from the materialized
+    membership instead of being matched one by one.
+
     Returns (videos, skipped_ids) where skipped_ids contains video IDs that could
     not be read or parsed.
     """
     videos = []
     skipped_ids = []
+    compiled = compile_collections(collections)
+    membership = collection_membership(compiled, postings) if postings is not None else None
+    fields = _VIDEO_LIST_FIELDS if membership is not None else _VIDEO_LIST_FIELDS | compiled.fields()
     for video_id, path in video_index.items():
         try:
-            with open(path, encoding="utf-8") as f:
-                info_json = json.load(f)
+            info_json = load_fields(path, fields)
         except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
             logger.warning("api_videos: skipping %s: %s", video_id, e)
             skipped_ids.append(video_id)
@@ -1028,7 +1761,8 @@ def _build_video_list(video_index: dict[str, str], collections: list[dict]) -> t
             thumbnail = info_json.get("thumbnail", "")
 
         try:
-            c_matches, _ = match_video(info_json, collections)
+            names = membership.of(video_id) if membership is not None else None
+            c_matches = list(names) if names is not None else match_video(info_json, compiled)[0]
         except Exception as e:
             logger.warning("api_videos: skipping %s (match error): %s", video_id, e)
             skipped_ids.append(video_id)
@@ -1066,12 +1800,13 @@ async def api_videos():
     collections_error = False
     if mapping_path:
         try:
-            collections = load_map(mapping_path).get("collections", [])
+            collections = read_collections(mapping_path)
         except (OSError, ValueError) as e:
             logger.error("api_videos: failed to load collection map at '%s': %s", mapping_path, e)
             collections_error = True
 
-    videos, skipped_ids = await asyncio.to_thread(_build_video_list, _video_index, collections)
+    index = _index
+    videos, skipped_ids = await asyncio.to_thread(_build_video_list, index.videos, collections, index.postings)
     result: dict = {"videos": videos}
     if collections_error:
         result["collections_error"] = True
@@ -1129,7 +1864,7 @@ def _video_id_from_plex_item(item, stem_index: dict[str, str] | None = None) ->
                 return video_id
         # Fallback: stem-index lookup for no-bracket filenames where the ID
         # was read from info.json content during build_index.
-        _si = stem_index if stem_index is not None else _stem_index
+        _si = stem_index if stem_index is not None else _index.stems
         return _si.get(path.stem)
 
     return None
@@ -1144,19 +1879,20 @@ def _has_local_thumbnail(video_id: str, video_index: dict[str, str]) -> bool:
     return any(base.with_suffix(ext).exists() for ext in (".jpg", ".jpeg", ".png", ".webp"))
 
 
-def _find_matching_plex_items(section, col_spec: list) -> list:
+def _find_matching_plex_items(section, col_spec: list[dict] | CompiledCollections) -> list:
     """Return Plex video objects in `section` whose info_json matches col_spec."""
+    index = _index
+    fields = compile_collections(col_spec).fields()
     results = []
     for item in section.all():
         video_id = _video_id_from_plex_item(item)
         if not video_id:
             continue
-        info_path = _video_index.get(video_id)
+        info_path = index.videos.get(video_id)
         if not info_path:
             continue
         try:
-            with open(info_path, encoding="utf-8") as f:
-                info_json = json.load(f)
+            info_json = load_fields(info_path, fields)
         except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
             logger.warning("_find_matching_plex_items: skipping '%s' at '%s': %s", video_id, info_path, e)
             continue
@@ -1219,7 +1955,7 @@ def _sync_collection_artwork(col: CollectionModel) -> dict:
         logger.error("_sync_collection_artwork: Plex connection failed: %s", e)
         return {"ok": False, "created": False, "error": f"Plex connection failed: {e}"}
 
-    col_spec = [{"name": col.name, "rules": [r.model_dump() for r in col.rules]}]
+    col_spec = compile_collections([{"name": col.name, "rules": [r.model_dump() for r in col.rules]}])
     try:
         yamp_sections = [s for s in plex.library.sections() if s.agent == IDENTIFIER]
     except _PLEX_ERRS as e:
@@ -1491,8 +2227,7 @@ def _fix_all_thumbnails(
                 )  # noqa: E501
                 skipped += 1
                 continue
-            _index = video_index or _video_index
-            has_local = _has_local_thumbnail(video_id, _index)
+            has_local = _has_local_thumbnail(video_id, video_index if video_index is not None else _index.videos)
             has_youtube = bool(((meta_cache or {}).get(video_id) or {}).get("thumbnail"))
             if not (has_local or has_youtube):
                 skipped += 1
@@ -1521,11 +2256,9 @@ async def api_fix_thumbnails(request: Request):
     """Push YAMP-proxied thumbnails to Plex for all videos in YAMP-managed libraries."""
     if not PLEX_URL or not PLEX_TOKEN:
         raise HTTPException(status_code=400, detail="PLEX_URL and PLEX_TOKEN env vars not set")
-    cache = _video_meta_cache  # capture refs before thread dispatch
-    index = _video_index
-    si = _stem_index
+    index = _index  # one consistent generation for the whole thread
     base = YAMP_URL or str(request.base_url).rstrip("/")
-    result = await asyncio.to_thread(_fix_all_thumbnails, cache, index, si, base)
+    result = await asyncio.to_thread(_fix_all_thumbnails, index.meta, index.videos, index.stems, base)
     if "error" in result:
         raise HTTPException(status_code=502, detail=result["error"])
     return result
@@ -1533,12 +2266,19 @@ async def api_fix_thumbnails(request: Request):
 
 @app.post("/api/index/rebuild", dependencies=[Depends(_require_api_key)])
 async def api_rebuild_index():
-    """Force a rebuild of the in-memory video index."""
-    global _video_index, _stem_index, _video_meta_cache
-    _video_index, _stem_index, _video_meta_cache = await asyncio.to_thread(_rebuild_indexes, DATA_PATH)
-    if not _video_index:
+    """Force a rebuild of the in-memory video index (or join the one already running)."""
+    await _reconciler.run_pass()
+    _missing_ids.clear()
+    if not _index.videos:
         logger.warning("Rebuilt index is empty — no videos found under %s", DATA_PATH)
-    return {"indexed": len(_video_index)}
+    return {"indexed": len(_index.videos)}
+
+
+@app.get("/api/index/status")
+async def api_index_status():
+    """Index size and generation, plus the background reconciler's progress and schedule."""
+    index = _index
+    return {"indexed": len(index.videos), "generation": index.generation, "reconciler": _reconciler.status()}
 
 
 # ── Asset management ─────────────────────────────────────────────────────────
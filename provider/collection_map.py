@@ -4,37 +4,67 @@ Collection map: rule-based matching of yt-dlp videos to Plex collections.
 Ported from the legacy Plex .bundle agent, updated to Python 3.
 """
 
+import contextlib
+import copy
+import functools
 import json
 import logging
+import multiprocessing as mp
 import operator
 import os
 import threading
+import time
+from bisect import bisect_right
+from collections import Counter
+from collections.abc import Collection, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, compress
 from pathlib import Path
+from typing import NamedTuple
+
+from aho_corasick import AhoCorasick
+from collection_matrix import NUMPY_AVAILABLE, incidence_matrix
+from sqlite_store import SQLITE_FILE_NAME, build_store, open_store
 
 logger = logging.getLogger(__name__)
 
 YAMP_DIR = ".yamp"
 MAPPING_FILE_NAME = "collection_map.json"
 
-# Fields read by the rule engine — used to populate the in-memory meta cache.
-# Includes "thumbnail" so the Fix Thumbnails fallback can use the cache too.
-MATCH_FIELDS = frozenset(
-    {"tags", "title", "channel", "uploader", "categories", "description", "extractor", "thumbnail"}
-)
+# Fields the in-memory meta cache holds whatever the rules read: tags for the unmatched
+# tag counts, and thumbnail for the Fix Thumbnails fallback. See projected_fields.
+BASE_FIELDS = frozenset({"tags", "thumbnail"})
 
 _MAP_LOCK = threading.Lock()
 
 
+# Maps found by find_collection_map, by (start_dir, root).
+_found_maps: dict[tuple[str, str | None], str] = {}
+
+
+def _map_exists(candidate: Path) -> bool:
+    # A map moved into SQLite keeps this path as its name.
+    return candidate.exists() or candidate.with_name(SQLITE_FILE_NAME).exists()
+
+
 def find_collection_map(start_dir: str, root: str | None = None) -> str | None:
-    """Walk up from start_dir to find .yamp/collection_map.json, stopping at root."""
+    """Walk up from start_dir to find .yamp/collection_map.json, stopping at root.
+
+    The map found is remembered and only checked for existence on later calls; the
+    walk is repeated once it is gone.
+    """
+    found = _found_maps.get((start_dir, root))
+    if found is not None and _map_exists(Path(found)):
+        return found
     current = Path(start_dir).resolve()
     stop = Path(root).resolve() if root else Path(current.anchor)
 
     while True:
         candidate = current / YAMP_DIR / MAPPING_FILE_NAME
-        if candidate.exists():
+        if _map_exists(candidate):
             logger.info("Found mapping file at: %s", candidate)
-            return str(candidate)
+            found = _found_maps[(start_dir, root)] = str(candidate)
+            return found
         if current == stop or current == current.parent:
             break
         current = current.parent
@@ -43,23 +73,98 @@ def find_collection_map(start_dir: str, root: str | None = None) -> str | None:
     return None
 
 
-def load_map(mapping_path: str) -> dict:
+# ── Map files ─────────────────────────────────────────────────────────────────
+# collection_map.json holds the user-edited collections only. The per-video match
+# state (MATCH_STATE_KEYS) lives next to it: a compact snapshot, plus an append-only
+# journal of the videos tracked since — one small line per new video instead of a
+# rewrite of every ID. load_map and save_map put the two back together, so callers
+# see one map. Maps that still hold the match state (written before the split) are
+# read as they are, and split on their next save. A map moved into the SQLite store
+# of its .yamp/ directory (migrate_map_to_sqlite) is read and written there instead.
+
+MATCH_STATE_KEYS = ("matched_ids", "unmatched_ids", "unmatched_tags")
+MATCH_STATE_FILE_NAME = "match_state.json"
+MATCH_JOURNAL_FILE_NAME = "match_state.journal"
+# Journal records after which a flush folds the journal into the snapshot.
+_JOURNAL_COMPACT_RECORDS = 1000
+
+
+def _state_paths(mapping_path: str) -> tuple[str, str]:
+    """(snapshot, journal) paths of a map's match state."""
+    directory = os.path.dirname(mapping_path)
+    return os.path.join(directory, MATCH_STATE_FILE_NAME), os.path.join(directory, MATCH_JOURNAL_FILE_NAME)
+
+
+def _read_map_files(mapping_path: str) -> tuple[dict, int, bool]:
+    """Read a map and its match state: (data, journal records replayed, whether the files need rewriting).
+
+    They need rewriting when the map file still holds the match state, or the journal
+    has a line that can't be replayed (a crash mid-append) that later appends would
+    run into. A snapshot or journal that can't be read is logged and skipped; a
+    recompute rebuilds the match state.
+    """
+    store = open_store(os.path.dirname(mapping_path))
+    if store is not None:
+        return store.load_map(), 0, False
     try:
         with open(mapping_path, encoding="utf-8") as f:
-            return json.load(f)
+            data = json.load(f)
     except OSError as e:
         raise OSError(f"Failed to open collection map '{mapping_path}': {e}") from e
     except (json.JSONDecodeError, UnicodeDecodeError) as e:
         raise ValueError(f"Failed to parse collection map '{mapping_path}': {e}") from e
+    if not isinstance(data, dict):
+        return data, 0, False
+    rewrite = any(key in data for key in MATCH_STATE_KEYS)
 
+    snapshot_path, journal_path = _state_paths(mapping_path)
+    try:
+        with open(snapshot_path, encoding="utf-8") as f:
+            state = json.load(f)
+        for key in MATCH_STATE_KEYS:
+            data[key] = state[key]
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        logger.error("load_map: ignoring unreadable match state '%s': %s", snapshot_path, e)
 
-def save_map(mapping_path: str, data: dict) -> None:
-    content = json.dumps(data, indent=2, ensure_ascii=False)
-    tmp_path = mapping_path + ".tmp"
+    records = 0
+    try:
+        with open(journal_path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        lines = []
+    except (OSError, UnicodeDecodeError) as e:
+        logger.error("load_map: ignoring unreadable match journal '%s': %s", journal_path, e)
+        lines = []
+    if lines:
+        tracked = {*data.get("matched_ids", []), *data.get("unmatched_ids", [])}
+        for line in lines:
+            try:
+                kind, video_id, *tags = json.loads(line)
+            except (ValueError, TypeError):
+                logger.warning("load_map: skipping unreadable record in '%s': %r", journal_path, line)
+                rewrite = True
+                continue
+            records += 1
+            if video_id not in tracked:  # already in the snapshot if a compaction was cut short
+                _track(data, tracked, video_id, kind == "m", tags[0] if tags else ())
+        if "unmatched_tags" in data:
+            data["unmatched_tags"] = _sorted_tags(data["unmatched_tags"])
+    return data, records, rewrite
+
+
+def load_map(mapping_path: str) -> dict:
+    """Read a collection map from disk, match state included. Raises OSError or ValueError."""
+    return _read_map_files(mapping_path)[0]
+
+
+def _write_atomic(path: str, content: str) -> None:
+    tmp_path = path + ".tmp"
     try:
         with open(tmp_path, encoding="utf-8", mode="w") as f:
             f.write(content)
-        os.replace(tmp_path, mapping_path)
+        os.replace(tmp_path, path)
     except OSError:
         # Clean up temp file if it was created
         try:
@@ -69,6 +174,318 @@ def save_map(mapping_path: str, data: dict) -> None:
         raise
 
 
+def _save_match_state(mapping_path: str, data: dict) -> None:
+    """Write the match state snapshot, then drop the journal it now covers. Raises OSError."""
+    snapshot_path, journal_path = _state_paths(mapping_path)
+    state = {key: data.get(key, {} if key == "unmatched_tags" else []) for key in MATCH_STATE_KEYS}
+    state["unmatched_tags"] = _sorted_tags(state["unmatched_tags"])
+    _write_atomic(snapshot_path, json.dumps(state, ensure_ascii=False, separators=(",", ":")))
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(journal_path)
+
+
+def save_map(mapping_path: str, data: dict) -> None:
+    """Atomically write a collection map: its match state to the snapshot, the rest to the map file.
+
+    Raises OSError on failure.
+    """
+    store = open_store(os.path.dirname(mapping_path))
+    if store is not None:
+        store.save_map(data)
+        return
+    if isinstance(data, dict) and any(key in data for key in MATCH_STATE_KEYS):
+        _save_match_state(mapping_path, data)
+        data = {key: value for key, value in data.items() if key not in MATCH_STATE_KEYS}
+    _write_atomic(mapping_path, json.dumps(data, indent=2, ensure_ascii=False))
+
+
+def _append_journal(mapping_path: str, records: list[list]) -> None:
+    """Append match state records to the journal, one JSON line each. Raises OSError."""
+    lines = "".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records)
+    with open(_state_paths(mapping_path)[1], encoding="utf-8", mode="a") as f:
+        f.write(lines)
+
+
+def _sorted_tags(unmatched_tags: Mapping[str, int]) -> dict[str, int]:
+    """unmatched_tags ordered most frequent first, ties by tag, as the map stores them.
+
+    The order depends only on the counts, so a replayed journal, an incremental recompute
+    and a full one write the same map.
+    """
+    return dict(sorted(sorted(unmatched_tags.items()), key=operator.itemgetter(1), reverse=True))
+
+
+def _track(data: dict, tracked: set[str], video_id: str, matched: bool, tags: Collection[str]) -> None:
+    """Add a newly seen video to the match state, counting its remaining tags if it is unmatched.
+
+    Updates the lists and counts in place and leaves unmatched_tags unsorted until it
+    is written. Callers tracking into a live map drop its hit state (_hit_states).
+    """
+    data.setdefault("matched_ids" if matched else "unmatched_ids", []).append(video_id)
+    tracked.add(video_id)
+    # Track unused tags only for newly-seen unmatched videos to surface collection patterns
+    if not matched and tags:
+        unmatched_tags: dict[str, int] = data.setdefault("unmatched_tags", {})
+        for tag in tags:
+            try:
+                current = int(unmatched_tags.get(tag, 0))
+            except (ValueError, TypeError):
+                logger.warning(
+                    "Non-numeric count for tag %r in unmatched_tags (got %r) — treating as 0",
+                    tag,
+                    unmatched_tags.get(tag),
+                )
+                current = 0
+            unmatched_tags[tag] = current + 1
+
+
+# ── In-memory map ─────────────────────────────────────────────────────────────
+# While the server runs, the map held here is the source of truth: each path is read
+# from disk once, and every change goes through write_map, recompute_all_collections
+# or resolve_collections. A map file edited by hand is noticed by its (inode, mtime,
+# size) stamp, one stat per access, and read again; take_map_edit reports the edit so
+# the collections it touched can be recomputed. Changes that can wait (the match state
+# of videos Plex asks about) are queued as journal records and appended in one batch,
+# so a scan of new content costs one small append per flush; the flush that takes the
+# journal past _JOURNAL_COMPACT_RECORDS folds it into the snapshot.
+
+# Seconds a failed write-behind waits before it is retried.
+_FLUSH_RETRY_DELAY = 60.0
+
+# (inode, mtime_ns, size) of a map file.
+_FileStamp = tuple[int, int, int]
+
+
+class _MapState:
+    """A map's content, the video IDs it tracks (built on first use), and its journal bookkeeping."""
+
+    def __init__(self, data: dict, journal_records: int = 0, stamp: _FileStamp | None = None) -> None:
+        self.data = data
+        self.tracked: set[str] | None = None
+        self.pending: list[list] = []  # journal records not appended yet
+        self.journal_records = journal_records  # records in the journal file
+        self.stamp = stamp  # of the map file as last read or written; None if kept in SQLite
+        # The collections before the file was edited by hand, until take_map_edit reports the edit.
+        self.edited_from: list | None = None
+
+
+_maps: dict[str, _MapState] = {}
+_flush_timer: threading.Timer | None = None
+
+
+def _file_stamp(path: str) -> _FileStamp | None:
+    """(inode, mtime_ns, size) of a file, or None if it can't be stat'ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _load_state(mapping_path: str, state: _MapState | None) -> _MapState:
+    """Read a map from disk into a new state, carrying over the records state has not flushed yet.
+
+    Call with _MAP_LOCK held. Raises like load_map.
+    """
+    stamp = _file_stamp(mapping_path)  # before the read, so an edit during it is seen next time
+    data, records, rewrite = _read_map_files(mapping_path)
+    new = _MapState(data, records, stamp)
+    if state is not None:
+        new.edited_from = state.edited_from if state.edited_from is not None else state.data.get("collections", [])
+    if state is not None and state.pending and isinstance(data, dict):
+        tracked = {*data.get("matched_ids", []), *data.get("unmatched_ids", [])}
+        for kind, video_id, *tags in state.pending:
+            if video_id not in tracked:
+                _track(data, tracked, video_id, kind == "m", tags[0] if tags else ())
+                new.pending.append([kind, video_id, *tags])
+    # The last recompute's hit state still holds for a reread that only changed collections.
+    if state is None or new.pending or _match_state_changed(state.data, data):
+        _hit_states.pop(mapping_path, None)
+    _maps[mapping_path] = new
+    if rewrite:
+        try:
+            save_map(mapping_path, data)
+            new.journal_records = 0
+            new.stamp = _file_stamp(mapping_path)
+        except OSError as e:
+            logger.error("_map_state: could not split match state out of '%s': %s", mapping_path, e)
+    return new
+
+
+def _map_state(mapping_path: str) -> _MapState:
+    """The in-memory state of a map, loaded on first use and again after the file changed.
+
+    Call with _MAP_LOCK held.
+    """
+    state = _maps.get(mapping_path)
+    if state is None:
+        return _load_state(mapping_path, None)
+    if state.stamp is not None:
+        stamp = _file_stamp(mapping_path)
+        # A map file that went missing keeps being served from memory.
+        if stamp is not None and stamp != state.stamp:
+            logger.info("_map_state: '%s' changed on disk — reading it again", mapping_path)
+            try:
+                return _load_state(mapping_path, state)
+            except (OSError, ValueError) as e:
+                # Likely caught mid-edit; read again once the file changes next.
+                logger.error("_map_state: keeping the map in memory, could not read '%s': %s", mapping_path, e)
+                state.stamp = stamp
+    return state
+
+
+def _match_state_changed(old: dict, new: dict) -> bool:
+    return any(old.get(key) != new.get(key) for key in MATCH_STATE_KEYS)
+
+
+def _write_map(mapping_path: str, data: dict) -> None:
+    """Write data to disk and make it the map's content. Call with _MAP_LOCK held."""
+    save_map(mapping_path, data)
+    stamp = _file_stamp(mapping_path)
+    state = _maps.get(mapping_path)
+    if state is None:
+        _maps[mapping_path] = _MapState(data, stamp=stamp)
+    else:
+        state.data, state.tracked, state.pending, state.journal_records = data, None, [], 0
+        state.stamp = stamp
+
+
+def read_map(mapping_path: str) -> dict:
+    """Return the collection map. Raises like load_map if the first read of the path fails.
+
+    The result is a copy, one level deep, that the caller may modify and pass to write_map.
+    That copies the library-sized ID lists, so callers that only read use read_collections
+    or read_map_summary instead.
+    """
+    with _MAP_LOCK:
+        return {key: copy.copy(value) for key, value in _map_state(mapping_path).data.items()}
+
+
+def read_collections(mapping_path: str) -> list[dict]:
+    """Return the map's collections. Raises like load_map if the first read of the path fails.
+
+    Not a copy: the list is replaced, never changed, when the map changes, so it stays
+    consistent, but the caller must not modify it.
+    """
+    with _MAP_LOCK:
+        return _map_state(mapping_path).data.get("collections", [])
+
+
+def read_map_summary(mapping_path: str) -> dict:
+    """The map without its ID lists: collections, unmatched_tags, matched_count and unmatched_count.
+
+    Only the tag counts are copied (tracking updates them in place); collections are
+    shared as in read_collections. Raises like load_map if the first read of the path fails.
+    """
+    with _MAP_LOCK:
+        data = _map_state(mapping_path).data
+        return {
+            "collections": data.get("collections", []),
+            "unmatched_tags": dict(data.get("unmatched_tags", {})),
+            "matched_count": len(data.get("matched_ids", [])),
+            "unmatched_count": len(data.get("unmatched_ids", [])),
+        }
+
+
+def write_map(mapping_path: str, data: dict) -> None:
+    """Replace the collection map with data and write it to disk now.
+
+    data is taken over, not copied. Raises OSError if the write fails, leaving the map as it was.
+    """
+    with _MAP_LOCK:
+        state = _maps.get(mapping_path)
+        if state is None or _match_state_changed(state.data, data):
+            _hit_states.pop(mapping_path, None)
+        _write_map(mapping_path, data)
+
+
+def take_map_edit(mapping_path: str) -> tuple[list, list] | None:
+    """Check a map file for hand edits: (collections before, collections now), or None if unedited.
+
+    Reads the file again if it changed. An edit is reported once, spanning every edit
+    since the last report. Raises like load_map if the first read of the path fails.
+    """
+    with _MAP_LOCK:
+        state = _map_state(mapping_path)
+        if state.edited_from is None:
+            return None
+        old, state.edited_from = state.edited_from, None
+        return old, state.data.get("collections", [])
+
+
+def _schedule_flush(delay: float) -> None:
+    """Start the write-behind timer unless one is already pending. Call with _MAP_LOCK held."""
+    global _flush_timer
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(delay, flush_maps)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def _flush(mapping_path: str, state: _MapState) -> None:
+    """Append a map's pending journal records, compacting the journal once it is long. Raises OSError."""
+    store = open_store(os.path.dirname(mapping_path))
+    if store is not None:
+        store.track(state.pending)
+        state.pending = []
+        return
+    _append_journal(mapping_path, state.pending)
+    state.journal_records += len(state.pending)
+    state.pending = []
+    if state.journal_records >= _JOURNAL_COMPACT_RECORDS:
+        try:
+            _save_match_state(mapping_path, state.data)
+            state.journal_records = 0
+        except OSError as e:  # the journal still holds everything; compaction is retried next flush
+            logger.warning("flush_maps: could not compact match journal of '%s': %s", mapping_path, e)
+
+
+def flush_maps() -> None:
+    """Write every map's match state changes that are not on disk yet.
+
+    Called by the write-behind timer and at shutdown. A map that can't be written
+    keeps its changes queued and is retried after _FLUSH_RETRY_DELAY seconds.
+    """
+    global _flush_timer
+    with _MAP_LOCK:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        failed = False
+        for mapping_path, state in _maps.items():
+            if not state.pending:
+                continue
+            try:
+                _flush(mapping_path, state)
+            except OSError as e:
+                logger.error("flush_maps: could not write match state of '%s' — will retry: %s", mapping_path, e)
+                failed = True
+        if failed:
+            _schedule_flush(_FLUSH_RETRY_DELAY)
+
+
+def migrate_map_to_sqlite(mapping_path: str) -> bool:
+    """Move a JSON collection map, match state included, into the SQLite store of its .yamp/ directory.
+
+    Returns False if the map is in SQLite already. The JSON files are kept with a .bak
+    suffix. Raises OSError or ValueError.
+    """
+    yamp_dir = os.path.dirname(mapping_path)
+    with _MAP_LOCK:
+        if open_store(yamp_dir) is not None:
+            return False
+        state = _maps.get(mapping_path)
+        # The in-memory map, if loaded, is ahead of the files by the records not flushed yet.
+        build_store(yamp_dir, state.data if state is not None else load_map(mapping_path))
+        if state is not None:
+            state.pending, state.journal_records, state.stamp = [], 0, None
+        for path in (mapping_path, *_state_paths(mapping_path)):
+            if os.path.exists(path):
+                os.replace(path, path + ".bak")
+    logger.info("migrate_map_to_sqlite: moved '%s' into %s", mapping_path, os.path.join(yamp_dir, SQLITE_FILE_NAME))
+    return True
+
+
 def diff_collections(old: list[dict], new: list[dict]) -> tuple[set[str], bool]:
     """Compare old and new collection lists by name.
 
@@ -87,144 +504,1055 @@ def diff_collections(old: list[dict], new: list[dict]) -> tuple[set[str], bool]:
     return rules_changed, bool(rules_changed)
 
 
-def match_video(info_json: dict, collections: list[dict]) -> tuple[list[str], set[str]]:
+class _Rule(NamedTuple):
+    """One validated rule. values is the lowered value set, or None if it could not be lowered."""
+
+    field: str
+    exact: bool
+    values: frozenset[str] | None
+    raw: object  # the rule's "values" as written, to re-raise the lowering error at match time
+    key: str  # the rule's content, which its RuleStats are kept under
+
+
+# Evaluations of a rule needed before its measured cost and hit rate are trusted for ordering.
+_RULE_STATS_MIN_EVALS = 32
+
+
+class RuleStats:
+    """Per-rule evaluation counts, hits and time, keyed by rule content, so they survive edits to other rules.
+
+    Filled in by CompiledCollections.match() while recomputes evaluate rules, and used by
+    CompiledCollections.reorder() to evaluate cheap, often-hitting rules first.
     """
-    Pure function: apply collection rules to a video.
 
-    Returns (matched_names, remaining_tags) where remaining_tags excludes
-    any tags consumed during collection matching.
-    """
-    tags = {t.lower() for t in info_json.get("tags", [])}
-    collection_matches: list[str] = []
-
-    for collection in collections:
-        c_name = str(collection.get("name", ""))
-        for rule in collection.get("rules", []):
-            field_name = rule.get("field")
-            match_type = rule.get("match")
-            rule_values_raw = rule.get("values")
-            if not field_name or not match_type or not rule_values_raw:
-                continue
-            if match_type not in ("exact", "in"):
-                logger.warning(
-                    "match_video: unknown match_type %r in collection '%s' rule — skipping",
-                    match_type,
-                    c_name,
-                )
+    def __init__(self) -> None:
+        self._counts: dict[str, list[int]] = {}  # key → [evaluations, hits, nanoseconds]
+
+    def record(self, key: str, hit: bool, elapsed_ns: int) -> None:
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0, 0, 0]
+        counts[0] += 1
+        counts[1] += hit
+        counts[2] += elapsed_ns
+
+    def merge(self, other: "RuleStats") -> None:
+        for key, (evaluations, hits, elapsed_ns) in other._counts.items():
+            counts = self._counts.setdefault(key, [0, 0, 0])
+            counts[0] += evaluations
+            counts[1] += hits
+            counts[2] += elapsed_ns
+
+    def get(self, key: str) -> tuple[int, int, int]:
+        """(evaluations, hits, nanoseconds) recorded for a rule."""
+        evaluations, hits, elapsed_ns = self._counts.get(key, (0, 0, 0))
+        return evaluations, hits, elapsed_ns
+
+    def cost_per_hit(self, key: str) -> float | None:
+        """Expected evaluation time spent per hit, or None until the rule has been evaluated enough."""
+        evaluations, hits, elapsed_ns = self.get(key)
+        if evaluations < _RULE_STATS_MIN_EVALS:
+            return None
+        # Smoothed hit rate: a rule that never hit still ranks by its cost.
+        return (elapsed_ns / evaluations) / ((hits + 1) / (evaluations + 2))
+
+
+# What recomputes have measured so far, for every map. Recomputes run on worker threads,
+# so every access holds _RULE_STATS_LOCK; measure into a RuleStats of your own and merge.
+_rule_stats = RuleStats()
+_RULE_STATS_LOCK = threading.Lock()
+
+
+# Below this many `in` patterns on a field, testing each with `in` (C substring search)
+# beats walking the text through the pure-Python automaton.
+_AUTOMATON_MIN_PATTERNS = 200
+
+
+class _PatternScan:
+    """Same interface as AhoCorasick for a few patterns: one substring test per pattern."""
+
+    def __init__(self, patterns: Mapping[str, set[int]]) -> None:
+        self._patterns = tuple(patterns.items())
+
+    def find(self, text: str) -> set[int]:
+        found: set[int] = set()
+        for pattern, labels in self._patterns:
+            if pattern in text:
+                found |= labels
+        return found
+
+
+def _substring_matcher(patterns: Mapping[str, set[int]]) -> "AhoCorasick | _PatternScan":
+    if len(patterns) >= _AUTOMATON_MIN_PATTERNS:
+        return AhoCorasick(patterns)
+    return _PatternScan(patterns)
+
+
+class VideoPostings:
+    """Inverted index of the meta cache: field → lowered value → ordinals of the videos holding it.
+
+    Ordinals follow the video_index order, so posting lists come out sorted. A field is
+    indexed the first time a rule needs it. Videos whose value can't be indexed the way
+    match_video reads it (a list with non-string items, say) are listed as irregular for
+    that field, and CompiledCollections.matched_ordinals matches them one by one.
+    """
+
+    def __init__(
+        self, video_index: Mapping[str, str], meta_cache: Mapping[str, dict], fields: frozenset[str] | None = None
+    ) -> None:
+        # Nothing is read until first use, so creating one is free on the event loop.
+        self._video_index = video_index
+        self._meta_cache = meta_cache
+        self.fields = fields  # the fields meta_cache is projected to (None: every field a rule reads)
+        self._fields: dict[str, tuple[dict[str, list[int]], frozenset[int]]] = {}
+        self._texts: dict[str, tuple[str, list[int], list[str], list[str]]] = {}
+        self._tag_lists: tuple[tuple[str, ...] | None, ...] | None = None
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def _split(self) -> tuple[tuple[str, ...], tuple[dict, ...], tuple[str, ...]]:
+        ids: list[str] = []
+        metas: list[dict] = []
+        missing: list[str] = []
+        for video_id in self._video_index:
+            meta = self._meta_cache.get(video_id)
+            if meta is None:
+                missing.append(video_id)
+            else:
+                ids.append(video_id)
+                metas.append(meta)
+        return tuple(ids), tuple(metas), tuple(missing)
+
+    @property
+    def ids(self) -> tuple[str, ...]:
+        """Video IDs by ordinal: the indexed videos with cached meta, in video_index order."""
+        return self._split[0]
+
+    @property
+    def missing(self) -> tuple[str, ...]:
+        """Indexed videos with no cached meta."""
+        return self._split[2]
+
+    @property
+    def _metas(self) -> tuple[dict, ...]:
+        return self._split[1]
+
+    def meta(self, ordinal: int) -> dict:
+        return self._metas[ordinal]
+
+    def tag_lists(self) -> tuple[tuple[str, ...] | None, ...]:
+        """Per ordinal, the lowered tags in their original order (None if not all strings)."""
+        if self._tag_lists is None:
+            lists: list[tuple[str, ...] | None] = []
+            for meta in self._metas:
+                try:
+                    lists.append(tuple(t.lower() for t in meta.get("tags", [])))
+                except (AttributeError, TypeError):
+                    lists.append(None)
+            self._tag_lists = tuple(lists)
+        return self._tag_lists
+
+    def field(self, name: str) -> tuple[dict[str, list[int]], frozenset[int]]:
+        """Return (postings, irregular ordinals) for field name, indexing it on first use."""
+        cached = self._fields.get(name)
+        if cached is None:
+            with self._lock:
+                cached = self._fields.get(name)
+                if cached is None:
+                    cached = self._fields[name] = self._index_field(name)
+        return cached
+
+    def containing(self, name: str, pattern: str) -> list[list[int]]:
+        """Posting lists of the field's values that contain pattern as a substring."""
+        postings, _ = self.field(name)
+        return [postings[value] for value in self.values_containing(name, pattern)]
+
+    def values_containing(self, name: str, pattern: str) -> list[str]:
+        """The field's indexed values that contain pattern as a substring.
+
+        Searches the field's whole vocabulary, joined into one string, with str.find —
+        one C-speed scan per pattern instead of a Python-level test per value.
+        """
+        text, starts, keys, odd = self._text(name)
+        found = [value for value in odd if pattern in value]
+        if "\0" in pattern:
+            return found + [value for value in keys if pattern in value]
+        pos = text.find(pattern) if keys else -1
+        while pos != -1:
+            i = bisect_right(starts, pos) - 1
+            found.append(keys[i])
+            if i + 1 == len(keys):
+                break
+            pos = text.find(pattern, starts[i + 1])
+        return found
+
+    def _text(self, name: str) -> tuple[str, list[int], list[str], list[str]]:
+        """(joined vocabulary, start offsets, values, values containing NUL) for field name."""
+        cached = self._texts.get(name)
+        if cached is None:
+            postings, _ = self.field(name)
+            keys = [value for value in postings if "\0" not in value]
+            odd = [value for value in postings if "\0" in value]  # would let a pattern span two values
+            starts: list[int] = []
+            offset = 0
+            for value in keys:
+                starts.append(offset)
+                offset += len(value) + 1
+            cached = self._texts[name] = ("\0".join(keys), starts, keys, odd)
+        return cached
+
+    def _index_field(self, name: str) -> tuple[dict[str, list[int]], frozenset[int]]:
+        postings: dict[str, list[int]] = {}
+        irregular: list[int] = []
+        tag_lists = self.tag_lists() if name == "tags" else None
+        for ordinal, meta in enumerate(self._metas):
+            if name not in meta:
                 continue
-            if field_name not in info_json:
+            raw = meta[name]
+            if not isinstance(raw, (list, str)):
                 continue
+            if tag_lists is not None:
+                # Tag rules read the lowered tag set, built the same way for a string.
+                values = tag_lists[ordinal]
+                if values is None:
+                    irregular.append(ordinal)
+                    continue
+                values = set(values)
+            elif isinstance(raw, str):
+                values = (raw.lower(),)
+            else:
+                try:
+                    values = {v.lower() for v in raw}
+                except AttributeError:
+                    irregular.append(ordinal)
+                    continue
+            for value in values:
+                postings.setdefault(value, []).append(ordinal)
+        return postings, frozenset(irregular)
+
 
-            rule_values = {v.lower() for v in rule_values_raw}
-            raw = info_json[field_name]
+class CompiledCollections:
+    """A collection list with every rule validated and lowercased once.
 
-            if isinstance(raw, list):
-                v_values = [v.lower() for v in raw]
+    Build one per loaded map and reuse it for every video matched against that map;
+    match() returns exactly what match_video returns for the original list. Rules
+    that match_video would skip are dropped here, and unknown match types are logged
+    once, at compile time.
+
+    Candidate collections are found per field value rather than by a pass over every
+    collection: `exact` values through a reverse index from (field, lowered value) to
+    collection, and `in` values through one substring matcher per field — an
+    Aho-Corasick automaton once the field has enough patterns to beat plain scanning.
+    """
+
+    def __init__(self, collections: list[dict]) -> None:
+        compiled: list[tuple[str, tuple[_Rule, ...]]] = []
+        for collection in collections:
+            c_name = str(collection.get("name", ""))
+            rules: list[_Rule] = []
+            for rule in collection.get("rules", []):
+                field_name = rule.get("field")
+                match_type = rule.get("match")
+                rule_values_raw = rule.get("values")
+                if not field_name or not match_type or not rule_values_raw:
+                    continue
+                if match_type not in ("exact", "in"):
+                    logger.warning(
+                        "match_video: unknown match_type %r in collection '%s' rule — skipping",
+                        match_type,
+                        c_name,
+                    )
+                    continue
+                try:
+                    values = frozenset(v.lower() for v in rule_values_raw)
+                except (AttributeError, TypeError):
+                    values = None  # raise from match(), for the videos that reach this rule
+                key = json.dumps([field_name, match_type, rule_values_raw], sort_keys=True, default=repr)
+                rules.append(_Rule(field_name, match_type == "exact", values, rule_values_raw, key))
+            if rules:
+                compiled.append((c_name, tuple(rules)))
+        self._collections = tuple(compiled)
+
+        # Per field: lowered exact value → collection positions, and the `in` patterns.
+        exact: dict[str, dict[str, list[int]]] = {}
+        substrings: dict[str, dict[str, set[int]]] = {}
+        scan: list[int] = []  # collections that need evaluating for every video
+        for pos, (_, rules) in enumerate(self._collections):
+            if any(rule.values is None for rule in rules):
+                scan.append(pos)
+                continue
+            for rule in rules:
+                if rule.exact:
+                    by_value = exact.setdefault(rule.field, {})
+                    for value in rule.values:
+                        by_value.setdefault(value, []).append(pos)
+                else:
+                    patterns = substrings.setdefault(rule.field, {})
+                    for value in rule.values:
+                        patterns.setdefault(value, set()).add(pos)
+        self._scan = frozenset(scan)
+        self._substrings = substrings
+        self._fields: dict[str, tuple[dict[str, list[int]], AhoCorasick | _PatternScan | None]] = {
+            field_name: (
+                exact.get(field_name, {}),
+                _substring_matcher(substrings[field_name]) if field_name in substrings else None,
+            )
+            for field_name in exact.keys() | substrings.keys()
+        }
+        self._ordered = self._collections  # evaluation order; see reorder()
+        with _RULE_STATS_LOCK:
+            self.reorder(_rule_stats)
+
+    def _candidates(self, info_json: dict, tags: set[str]) -> list[int] | range:
+        """Positions of the collections that could match info_json, in map order."""
+        found = set(self._scan)
+        for field_name, (by_value, matcher) in self._fields.items():
+            raw = info_json.get(field_name)
+            if field_name not in info_json or not isinstance(raw, (list, str)):
+                continue
+            if field_name == "tags":
+                values = tags
             elif isinstance(raw, str):
-                v_values = [raw.lower()]
+                values = (raw.lower(),)
             else:
+                try:
+                    values = [v.lower() for v in raw]
+                except AttributeError:
+                    return range(len(self._collections))  # let the full evaluation raise as it would
+            for value in values:
+                found.update(by_value.get(value, ()))
+                if matcher is not None:
+                    found |= matcher.find(value)
+        return sorted(found)
+
+    def fields(self) -> set[str]:
+        """Fields read by the rules."""
+        return {rule.field for _, rules in self._collections for rule in rules}
+
+    def names(self) -> set[str]:
+        """Names of the collections with at least one usable rule."""
+        return {c_name for c_name, _ in self._collections}
+
+    def has_unique_names(self) -> bool:
+        """True unless two collections with usable rules share a name (incremental recomputes key by name)."""
+        return len(self.names()) == len(self._collections)
+
+    def collection_terms(
+        self, postings: VideoPostings, names: Collection[str] | None = None
+    ) -> dict[str, list[tuple[str, str]]] | None:
+        """Per collection name (all, or just names), the (field, value) terms of postings its rules hit.
+
+        An exact rule hits the indexed values equal to one of its values, an `in` rule
+        those containing one. Returns None in the cases collection_hits does.
+        """
+        terms: dict[str, list[tuple[str, str]]] = {}
+        for pos, (c_name, rules) in enumerate(self._collections):
+            if names is not None and c_name not in names:
                 continue
+            if pos in self._scan:
+                return None
+            found = terms.setdefault(c_name, [])
+            for rule in rules:
+                field_postings, irregular = postings.field(rule.field)
+                if irregular:
+                    return None
+                if rule.exact:
+                    found.extend((rule.field, value) for value in rule.values if value in field_postings)
+                else:
+                    for pattern in rule.values:
+                        found.extend((rule.field, value) for value in postings.values_containing(rule.field, pattern))
+        return terms
 
-            if field_name == "tags":
-                if match_type == "exact":
-                    matched = tags & rule_values
-                else:  # "in" — substring match against tags
-                    matched = {t for t in tags if any(rv in t for rv in rule_values)}
-                if matched:
+    def collection_hits(
+        self, postings: VideoPostings, names: Collection[str] | None = None
+    ) -> dict[str, set[int]] | None:
+        """Per collection name (all, or just names), the ordinals of the videos its rules hit.
+
+        A rule hits a video when it matches the video's original field values. A video
+        matches some collection exactly when it is in one of these sets: a tag is only
+        ever consumed by a collection that matched. The sets are unions of posting lists,
+        with no per-video matching. Returns None if that can't reproduce match_video —
+        a rule's values could not be lowered, or a video's field value can't be indexed —
+        and the caller should match video by video instead, which raises where it would.
+        """
+        terms = self.collection_terms(postings, names)
+        if terms is None:
+            return None
+        hits: dict[str, set[int]] = {}
+        for c_name, field_values in terms.items():
+            found = hits[c_name] = set()
+            for field_name, value in field_values:
+                found.update(postings.field(field_name)[0][value])
+        return hits
+
+    def reorder(self, stats: RuleStats) -> None:
+        """Evaluate each collection's rules cheapest-per-hit first, wherever that can't change a result.
+
+        match() stops at a collection's first hitting rule, and only a tag rule consumes
+        tags, so rules on other fields may be swapped freely among themselves — but not
+        across a tag rule, and not around a rule whose values can't be lowered (it raises
+        if reached). Runs keep the written order until every rule in them has stats.
+        """
+        ordered: list[tuple[str, tuple[_Rule, ...]]] = []
+        for pos, (c_name, rules) in enumerate(self._collections):
+            if pos in self._scan or len(rules) < 2:
+                ordered.append((c_name, rules))
+                continue
+            result: list[_Rule] = []
+            run: list[_Rule] = []
+            for rule in (*rules, None):
+                if rule is not None and rule.field != "tags":
+                    run.append(rule)
+                    continue
+                costs = [stats.cost_per_hit(r.key) for r in run]
+                if len(run) > 1 and None not in costs:
+                    run = [r for _, r in sorted(zip(costs, run, strict=True), key=operator.itemgetter(0))]
+                result += run
+                run = []
+                if rule is not None:
+                    result.append(rule)
+            ordered.append((c_name, tuple(result)))
+        self._ordered = tuple(ordered)
+
+    def rules(self) -> list[tuple[str, tuple[_Rule, ...], tuple[_Rule, ...]]]:
+        """(name, rules as written, rules in evaluation order) per collection."""
+        return [(c_name, rules, self._ordered[pos][1]) for pos, (c_name, rules) in enumerate(self._collections)]
+
+    def match(self, info_json: dict, stats: RuleStats | None = None) -> tuple[list[str], set[str]]:
+        """Apply the compiled rules to a video — see match_video. Rule evaluations are recorded in stats."""
+        tags = {t.lower() for t in info_json.get("tags", [])}
+        collection_matches: list[str] = []
+
+        # A collection left out of the candidates has no exact value in common with the
+        # video and none of its substrings occur in it, so it cannot match — and
+        # skipping it consumes no tags.
+        candidates = self._candidates(info_json, tags)
+        # A video _candidates can't read gets the written order, so it raises where match_video would.
+        collections = self._collections if isinstance(candidates, range) else self._ordered
+        for pos in candidates:
+            c_name, rules = collections[pos]
+            for rule in rules:
+                if stats is None:
+                    hit = _rule_hit(rule, info_json, tags)
+                else:
+                    started = time.perf_counter_ns()
+                    hit = _rule_hit(rule, info_json, tags)
+                    stats.record(rule.key, bool(hit), time.perf_counter_ns() - started)
+                if hit:
                     collection_matches.append(c_name)
-                    tags -= matched
+                    if rule.field == "tags":
+                        tags -= hit
                     break
-            elif (match_type == "exact" and rule_values & set(v_values)) or (
-                match_type == "in" and any(rv in iv for rv in rule_values for iv in v_values)
-            ):
-                collection_matches.append(c_name)
-                break
 
-    return list(set(collection_matches)), tags
+        return list(set(collection_matches)), tags
+
+
+def _rule_hit(rule: _Rule, info_json: dict, tags: set[str]) -> set[str] | bool:
+    """Whether a rule matches a video: the tags it matched for a tag rule, else a bool.
+
+    `tags` is the lowered tag set, minus tags consumed so far.
+    """
+    if rule.field not in info_json:
+        return False
+    rule_values = rule.values
+    if rule_values is None:
+        rule_values = frozenset(v.lower() for v in rule.raw)
+    raw = info_json[rule.field]
+    if not isinstance(raw, (list, str)):
+        return False
+
+    if rule.field == "tags":
+        if rule.exact:
+            return tags & rule_values
+        # "in" — substring match against tags
+        return {t for t in tags if any(rv in t for rv in rule_values)}
+
+    v_values = [v.lower() for v in raw] if isinstance(raw, list) else [raw.lower()]
+    if rule.exact:
+        return not rule_values.isdisjoint(v_values)
+    return any(rv in iv for rv in rule_values for iv in v_values)
+
+
+@functools.lru_cache(maxsize=8)
+def _compile_cached(key: str) -> CompiledCollections:
+    return CompiledCollections(json.loads(key))
+
+
+def compile_collections(collections: "list[dict] | CompiledCollections") -> CompiledCollections:
+    """Return the compiled form of a collection list, reusing it while the list's content is unchanged."""
+    if isinstance(collections, CompiledCollections):
+        return collections
+    try:
+        key = json.dumps(collections, sort_keys=True)
+    except (TypeError, ValueError):
+        return CompiledCollections(collections)
+    return _compile_cached(key)
+
+
+def projected_fields(collections: "list[dict] | CompiledCollections") -> frozenset[str]:
+    """Fields the meta cache must hold for these collections: BASE_FIELDS plus every field a rule reads."""
+    return BASE_FIELDS | compile_collections(collections).fields()
+
+
+def _covers(postings: VideoPostings, collections: CompiledCollections) -> bool:
+    """True if the postings' meta cache holds every field the rules read."""
+    return postings.fields is None or collections.fields() <= postings.fields
+
+
+def match_video(info_json: dict, collections: "list[dict] | CompiledCollections") -> tuple[list[str], set[str]]:
+    """
+    Pure function: apply collection rules to a video.
+
+    Returns (matched_names, remaining_tags) where remaining_tags excludes
+    any tags consumed during collection matching. When matching many videos
+    against the same collections, pass compile_collections(collections).
+    """
+    if not isinstance(collections, CompiledCollections):
+        collections = CompiledCollections(collections)
+    return collections.match(info_json)
+
+
+class _HitState:
+    """Per-collection rule hits behind the last recompute of one map, kept for incremental updates.
+
+    coverage counts, per video ordinal, the collections whose rules hit it; a video is
+    matched while its count is non-zero. Only valid for the VideoPostings it was built on;
+    hits are those of `collections`.
+    """
+
+    def __init__(
+        self,
+        collections: CompiledCollections,
+        postings: VideoPostings,
+        hits: dict[str, set[int]],
+        coverage: list[int] | None = None,
+    ) -> None:
+        self.collections = collections
+        self.postings = postings
+        self.hits = hits
+        if coverage is None:
+            coverage = [0] * len(postings.ids)
+            for ordinals in hits.values():
+                for o in ordinals:
+                    coverage[o] += 1
+        self.coverage = coverage
+        self.unmatched_tags: Counter[str] = Counter()
+        self.matched_ids: list[str] = []
+        self.unmatched_ids: list[str] = []
+
+    def lists(self, unmatched_tags: Counter[str] | None = None) -> tuple[list[str], list[str]] | None:
+        """Rebuild matched/unmatched IDs and unmatched tag counts from coverage (None to fall back).
+
+        unmatched_tags, if given, is the tag count already computed for this coverage.
+        """
+        ids, coverage = self.postings.ids, self.coverage
+        if unmatched_tags is None:
+            unmatched = [o for o in range(len(ids)) if not coverage[o]]
+            tag_lists = self.postings.tag_lists()
+            if any(tag_lists[o] is None for o in unmatched):
+                return None
+            unmatched_tags = Counter(chain.from_iterable(tag_lists[o] for o in unmatched))
+        self.unmatched_tags = unmatched_tags
+        self.matched_ids = list(compress(ids, coverage))
+        self.unmatched_ids = list(compress(ids, map(operator.not_, coverage)))
+        return self.matched_ids, self.unmatched_ids
+
+    def update(self, changed: dict[str, set[int]]) -> bool:
+        """Swap in new hit sets for the changed collections; adjust the lists by delta.
+
+        Returns False if a video that became unmatched has tags match_video can't read.
+        """
+        coverage = self.coverage
+        was_matched: dict[int, bool] = {}
+        for name, new in changed.items():
+            old = self.hits.pop(name, set())
+            if new:
+                self.hits[name] = new
+            for o in old - new:
+                was_matched.setdefault(o, coverage[o] > 0)
+                coverage[o] -= 1
+            for o in new - old:
+                was_matched.setdefault(o, coverage[o] > 0)
+                coverage[o] += 1
+        flipped = sorted(o for o, before in was_matched.items() if before != (coverage[o] > 0))
+        if not flipped:
+            return True
+        tag_lists = self.postings.tag_lists()
+        for o in flipped:
+            tags = tag_lists[o]
+            if tags is None:
+                return False
+            if coverage[o]:
+                self.unmatched_tags.subtract(tags)
+            else:
+                self.unmatched_tags.update(tags)
+        self.unmatched_tags = +self.unmatched_tags  # drop tags whose count fell to zero
+        ids = self.postings.ids
+        self.matched_ids = list(compress(ids, coverage))
+        self.unmatched_ids = list(compress(ids, map(operator.not_, coverage)))
+        return True
+
+
+# mapping_path → hit state behind the lists last written there by recompute_all_collections.
+_hit_states: dict[str, _HitState] = {}
+
+# Below this many videos the vectorized engine's array setup costs more than it saves.
+_MATRIX_MIN_VIDEOS = 50_000
+
+
+def _matrix_hit_state(collections: CompiledCollections, postings: VideoPostings) -> _HitState | None:
+    """Full recompute on the NumPy incidence matrix (see collection_matrix), or None to fall back."""
+    terms = collections.collection_terms(postings)
+    if terms is None:
+        return None
+    matrix = incidence_matrix(postings)
+    hits, coverage = matrix.hits(terms)
+    state = _HitState(collections, postings, {c_name: set(o.tolist()) for c_name, o in hits.items()}, coverage.tolist())
+    # Counted in Python instead when the tag columns can't stand in for the tag lists.
+    if state.lists(matrix.unmatched_tags(coverage)) is None:
+        return None
+    return state
+
+
+def _recompute_from_postings(
+    previous: _HitState | None,
+    collections: CompiledCollections,
+    postings: VideoPostings,
+    rules_changed: Collection[str] | None,
+) -> _HitState | None:
+    """Set-algebra recompute: the hit state behind the new lists, or None to fall back.
+
+    previous is the hit state the last recompute left in _hit_states (dropped by whatever
+    changes the map's match state in between), taken out by the caller. With
+    rules_changed and a previous built on the same postings, only the changed
+    collections are re-evaluated, updating previous in place.
+    """
+    if None in postings.tag_lists():
+        return None  # match_video raises on a tag list it can't lower, matched or not
+    state = previous
+    if (
+        rules_changed is not None
+        and state is not None
+        and state.postings is postings
+        and collections.has_unique_names()
+        and state.collections.has_unique_names()
+    ):
+        current = collections.names()
+        # Also catch collections the caller didn't name but whose presence changed.
+        names = set(rules_changed) | (current ^ state.hits.keys())
+        hits = collections.collection_hits(postings, names)
+        if hits is not None:
+            for name in names:
+                hits.setdefault(name, set())
+            if state.update(hits):
+                state.collections = collections
+                return state
+
+    if NUMPY_AVAILABLE and len(postings.ids) >= _MATRIX_MIN_VIDEOS:
+        return _matrix_hit_state(collections, postings)
+    hits = collections.collection_hits(postings)
+    state = None if hits is None else _HitState(collections, postings, hits)
+    if state is not None and state.lists() is None:
+        return None
+    return state
+
+
+class CollectionMembership:
+    """What match_video returns for every video in a VideoPostings, in both directions.
+
+    A video hit by one collection's rules is in exactly that collection; a video hit by
+    several is matched for real, since tag consumption decides which of them it joins.
+    """
+
+    def __init__(self, collections: CompiledCollections, postings: VideoPostings, hits: dict[str, set[int]]) -> None:
+        by_ordinal: dict[int, list[str]] = {}
+        for c_name, ordinals in hits.items():
+            for o in ordinals:
+                by_ordinal.setdefault(o, []).append(c_name)
+        of: dict[str, tuple[str, ...]] = dict.fromkeys(postings.ids, ())
+        members: dict[str, list[str]] = {}
+        for o in sorted(by_ordinal):
+            names = by_ordinal[o]
+            if len(names) > 1:
+                names = collections.match(postings.meta(o))[0]
+            video_id = postings.ids[o]
+            of[video_id] = tuple(names)
+            for c_name in names:
+                members.setdefault(c_name, []).append(video_id)
+        self._of = of
+        self._members = members
+
+    def of(self, video_id: str) -> tuple[str, ...] | None:
+        """Collections video_id is in, or None if it isn't covered (no cached meta)."""
+        return self._of.get(video_id)
+
+    def members(self, collection_name: str) -> list[str]:
+        """IDs of the videos in a collection, in index order. Don't mutate the list."""
+        return self._members.get(collection_name, [])
+
+
+# The membership for the latest (compiled collections, postings) pair asked for.
+_membership: tuple[CompiledCollections, VideoPostings, CollectionMembership] | None = None
+# Held while a membership is built, so concurrent callers wait for one build instead of each running their own.
+_MEMBERSHIP_LOCK = threading.Lock()
+
+
+def collection_membership(collections: CompiledCollections, postings: VideoPostings) -> CollectionMembership | None:
+    """Return the materialized membership for these collections and postings.
+
+    Built on first use from the rule hits the last recompute kept for this pair, or
+    else from posting lists, and kept for reuse. Returns None if a rule reads a field
+    the postings' meta cache isn't projected to, or the rules can't be resolved through
+    postings — callers then match_video.
+    """
+    global _membership
+    cached = _membership
+    if cached is not None and cached[0] is collections and cached[1] is postings:
+        return cached[2]
+    if not _covers(postings, collections):
+        return None
+    with _MEMBERSHIP_LOCK:
+        cached = _membership
+        if cached is not None and cached[0] is collections and cached[1] is postings:
+            return cached[2]
+        # Only the lookup needs the map lock. A shallow copy is enough: _HitState.update
+        # swaps in new hit sets rather than changing them in place.
+        with _MAP_LOCK:
+            hits = next(
+                (dict(s.hits) for s in _hit_states.values() if s.postings is postings and s.collections is collections),
+                None,
+            )
+        if hits is None:
+            hits = collections.collection_hits(postings)
+        if hits is None:
+            return None
+        membership = CollectionMembership(collections, postings, hits)
+        _membership = (collections, postings, membership)
+    return membership
+
+
+# Videos per recompute (or per shard) whose rule evaluations are timed for _rule_stats.
+_RULE_SAMPLE_SIZE = 256
+
+
+def _sample_rule_stats(collections: CompiledCollections, postings: VideoPostings) -> RuleStats:
+    """Time rule evaluations on an evenly spaced sample of videos, to merge into _rule_stats.
+
+    Posting-list recomputes don't evaluate rules per video, so this is how they learn
+    the evaluation order match() uses for single videos. Only called once the postings
+    path succeeded, which guarantees match() can read every video.
+    """
+    stats = RuleStats()
+    count = len(postings.ids)
+    for ordinal in range(0, count, max(1, count // _RULE_SAMPLE_SIZE)):
+        collections.match(postings.meta(ordinal), stats)
+    return stats
+
+
+# Below this many videos a per-video recompute stays in-process: starting worker
+# processes would cost more than the matching it spreads out.
+_SHARD_MIN_VIDEOS = 50_000
+
+
+class _ShardResult(NamedTuple):
+    matched_ids: list[str]
+    unmatched_ids: list[str]
+    unmatched_tags: dict[str, int]
+    skipped: list[tuple[str, str | None]]  # (video_id, read error) — None if not in the meta cache
+    rule_stats: RuleStats
+
+
+def _match_shard(
+    entries: list[tuple[str, str, dict | None]], collections: list[dict], from_cache: bool
+) -> _ShardResult:
+    """Match one shard of (video_id, path, meta) entries, in order, for recompute_all_collections.
+
+    meta is the cached metadata when from_cache, else None and the sidecar at path is
+    read. Rule evaluations are measured on a sample of the shard's videos. Runs in
+    worker processes for large recomputes, so it logs nothing itself and returns the
+    measurements instead of recording them.
+    """
+    compiled = compile_collections(collections)
+    matched_ids: list[str] = []
+    unmatched_ids: list[str] = []
+    unmatched_tags: dict[str, int] = {}
+    skipped: list[tuple[str, str | None]] = []
+    rule_stats = RuleStats()
+    sample_every = max(1, len(entries) // _RULE_SAMPLE_SIZE)
+    for i, (video_id, path, info_json) in enumerate(entries):
+        if from_cache:
+            if info_json is None:
+                skipped.append((video_id, None))
+                continue
+        else:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    info_json = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                skipped.append((video_id, str(e)))
+                continue
+
+        c_matches, _ = compiled.match(info_json, None if i % sample_every else rule_stats)
+        if c_matches:
+            matched_ids.append(video_id)
+        else:
+            unmatched_ids.append(video_id)
+            for tag in info_json.get("tags", []):
+                t = tag.lower()
+                unmatched_tags[t] = unmatched_tags.get(t, 0) + 1
+    return _ShardResult(matched_ids, unmatched_ids, unmatched_tags, skipped, rule_stats)
+
+
+def _match_sharded(
+    video_index: Mapping[str, str],
+    collections: list[dict],
+    meta_cache: Mapping[str, dict] | None,
+    workers: int,
+) -> _ShardResult:
+    """Per-video matching of video_index, split into contiguous shards over up to `workers` processes.
+
+    Shard results are concatenated in index order and tag counts merged in shard order,
+    so the outcome is exactly that of one in-process _match_shard over the whole index.
+    """
+    from_cache = meta_cache is not None
+    entries = [
+        (video_id, path, meta_cache.get(video_id) if from_cache else None) for video_id, path in video_index.items()
+    ]
+    if workers <= 1 or len(entries) < _SHARD_MIN_VIDEOS:
+        return _match_shard(entries, collections, from_cache)
+
+    if from_cache:
+        # Workers only need what match_video reads: the rule fields, and tags for the counts.
+        fields = compile_collections(collections).fields() | {"tags"}
+        entries = [
+            (video_id, path, meta if meta is None else {k: meta[k] for k in fields if k in meta})
+            for video_id, path, meta in entries
+        ]
+    size = -(-len(entries) // workers)
+    shards = [entries[start : start + size] for start in range(0, len(entries), size)]
+    # spawn, not fork: the server process has live threads (event loop, watcher).
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=mp.get_context("spawn")) as pool:
+        results = list(pool.map(_match_shard, shards, [collections] * len(shards), [from_cache] * len(shards)))
+
+    merged = _ShardResult([], [], {}, [], RuleStats())
+    for shard in results:
+        merged.matched_ids.extend(shard.matched_ids)
+        merged.unmatched_ids.extend(shard.unmatched_ids)
+        for tag, count in shard.unmatched_tags.items():
+            merged.unmatched_tags[tag] = merged.unmatched_tags.get(tag, 0) + count
+        merged.skipped.extend(shard.skipped)
+        merged.rule_stats.merge(shard.rule_stats)
+    logger.info("recompute_all_collections: matched %d videos in %d shard(s)", len(entries), len(shards))
+    return merged
+
+
+# mapping_path → one list per recompute in flight, collecting the journal records of
+# videos resolve_collections tracks while that recompute runs without the map lock.
+_tracking_logs: dict[str, list[list[list]]] = {}
 
 
 def recompute_all_collections(
-    video_index: dict[str, str],
+    video_index: Mapping[str, str],
     mapping_path: str,
-    meta_cache: dict[str, dict] | None = None,
+    meta_cache: Mapping[str, dict] | None = None,
+    postings: VideoPostings | None = None,
+    rules_changed: Collection[str] | None = None,
+    workers: int = 1,
 ) -> dict:
     """
     Re-run collection matching against all indexed videos.
 
     Clears and rebuilds matched_ids, unmatched_ids, and unmatched_tags from scratch.
-    When meta_cache is provided, uses it instead of reading files from disk.
+    When meta_cache is provided, uses it instead of reading files from disk. When
+    postings (built from the same video_index and meta_cache) is provided too, the
+    lists are computed from posting-list unions instead of matching every video, and
+    rules_changed (from diff_collections) limits the work to the collections it names.
+    Videos that do need matching one by one are spread over up to `workers` processes
+    on large libraries. If the rules read a field the postings' meta cache isn't
+    projected to yet, every video is read from disk instead.
+    The map lock is held only to take the collections and to write the result, so
+    resolve_collections keeps answering while videos are matched. Videos it tracks
+    meanwhile are carried into the result; if the collections change meanwhile (a
+    write_map, or a hand edit seen by its file stamp), matching runs again on them.
+    The result is written through to disk, along with any write-behind changes.
     Returns {"matched": int, "unmatched": int, "skipped": int} stats.
     """
+    tracked_meanwhile: list[list] = []
     with _MAP_LOCK:
-        mapping_data = load_map(mapping_path)
-        collections = mapping_data.get("collections", [])
-
-        matched_ids: list[str] = []
-        unmatched_ids: list[str] = []
-        unmatched_tags: dict[str, int] = {}
-        skipped = 0
-
-        for video_id, path in video_index.items():
-            if meta_cache is not None:
-                info_json = meta_cache.get(video_id)
-                if info_json is None:
-                    logger.warning("recompute: %s not in meta cache — skipping", video_id)
-                    skipped += 1
-                    continue
-            else:
-                try:
-                    with open(path, encoding="utf-8") as f:
-                        info_json = json.load(f)
-                except (OSError, json.JSONDecodeError) as e:
-                    logger.warning("recompute: skipping %s: %s", video_id, e)
-                    skipped += 1
-                    continue
+        _tracking_logs.setdefault(mapping_path, []).append(tracked_meanwhile)
+    try:
+        while True:
+            with _MAP_LOCK:
+                mapping_data = dict(_map_state(mapping_path).data)
+                previous = _hit_states.pop(mapping_path, None)
+            stats = _recompute(
+                video_index,
+                mapping_path,
+                mapping_data,
+                meta_cache,
+                postings,
+                previous,
+                rules_changed,
+                workers,
+                tracked_meanwhile,
+            )
+            if stats is not None:
+                break
+            logger.info("recompute_all_collections: collections changed while matching — matching again")
+            rules_changed = None
+    finally:
+        with _MAP_LOCK:
+            logs = _tracking_logs[mapping_path]
+            logs.remove(tracked_meanwhile)
+            if not logs:
+                del _tracking_logs[mapping_path]
+    return stats
 
-            c_matches, _ = match_video(info_json, collections)
-            if c_matches:
-                matched_ids.append(video_id)
+
+def _recompute(
+    video_index: Mapping[str, str],
+    mapping_path: str,
+    mapping_data: dict,
+    meta_cache: Mapping[str, dict] | None,
+    postings: VideoPostings | None,
+    previous: _HitState | None,
+    rules_changed: Collection[str] | None,
+    workers: int,
+    tracked_meanwhile: list[list],
+) -> dict | None:
+    """One matching run of recompute_all_collections over a copy of the map taken under the lock.
+
+    Returns its stats, or None without writing if the map's collections changed meanwhile.
+    """
+    collections = compile_collections(mapping_data.get("collections", []))
+    if postings is not None and not _covers(postings, collections):
+        logger.info(
+            "recompute_all_collections: meta cache lacks %s — reading sidecars from disk",
+            ", ".join(sorted(collections.fields() - postings.fields)),
+        )
+        meta_cache = postings = None
+
+    state = None
+    if meta_cache is not None and postings is not None:
+        state = _recompute_from_postings(previous, collections, postings, rules_changed)
+    shards = None
+    if state is not None:
+        matched_ids, unmatched_ids, unmatched_tags = state.matched_ids, state.unmatched_ids, state.unmatched_tags
+        for video_id in postings.missing:
+            logger.warning("recompute: %s not in meta cache — skipping", video_id)
+        skipped = len(postings.missing)
+    else:
+        postings = None
+        shards = _match_sharded(video_index, mapping_data.get("collections", []), meta_cache, workers)
+        matched_ids, unmatched_ids, unmatched_tags = shards.matched_ids, shards.unmatched_ids, shards.unmatched_tags
+        for video_id, error in shards.skipped:
+            if error is None:
+                logger.warning("recompute: %s not in meta cache — skipping", video_id)
             else:
-                unmatched_ids.append(video_id)
-                for tag in info_json.get("tags", []):
-                    t = tag.lower()
-                    unmatched_tags[t] = unmatched_tags.get(t, 0) + 1
+                logger.warning("recompute: skipping %s: %s", video_id, error)
+        skipped = len(shards.skipped)
 
+    measured = _sample_rule_stats(collections, postings) if shards is None else shards.rule_stats
+    with _RULE_STATS_LOCK:
+        _rule_stats.merge(measured)
+        collections.reorder(_rule_stats)
+
+    with _MAP_LOCK:
+        current = _map_state(mapping_path)
+        if current.data.get("collections", []) != mapping_data.get("collections", []):
+            return None
+
+        # Whatever else was written meanwhile is kept; only the match state is replaced.
+        mapping_data = dict(current.data)
         mapping_data["matched_ids"] = matched_ids
         mapping_data["unmatched_ids"] = unmatched_ids
-        mapping_data["unmatched_tags"] = dict(sorted(unmatched_tags.items(), key=operator.itemgetter(1), reverse=True))
+        mapping_data["unmatched_tags"] = _sorted_tags(unmatched_tags)
+        tracked: set[str] | None = None
+        for kind, video_id, *tags in tracked_meanwhile:
+            if tracked is None:
+                tracked = {*matched_ids, *unmatched_ids}
+            if video_id in tracked:
+                continue
+            if state is not None:  # the lists are about to stop being the hit state's
+                mapping_data["matched_ids"], mapping_data["unmatched_ids"] = list(matched_ids), list(unmatched_ids)
+                state = None
+            _track(mapping_data, tracked, video_id, kind == "m", tags[0] if tags else ())
+        mapping_data["unmatched_tags"] = _sorted_tags(mapping_data["unmatched_tags"])
 
-        save_map(mapping_path, mapping_data)
-        if skipped:
-            logger.error("recompute_all_collections: %d video(s) skipped due to read/parse errors", skipped)
-        logger.info(
-            "recompute_all_collections: %d matched, %d unmatched, %d skipped",
-            len(matched_ids),
-            len(unmatched_ids),
-            skipped,
-        )
-        return {"matched": len(matched_ids), "unmatched": len(unmatched_ids), "skipped": skipped}
+        _write_map(mapping_path, mapping_data)
+        if state is not None:
+            _hit_states[mapping_path] = state
 
+    matched, unmatched = len(mapping_data["matched_ids"]), len(mapping_data["unmatched_ids"])
+    if skipped:
+        logger.error("recompute_all_collections: %d video(s) skipped due to read/parse errors", skipped)
+    logger.info("recompute_all_collections: %d matched, %d unmatched, %d skipped", matched, unmatched, skipped)
+    # Materialized here, on the recompute's thread, so lookups of tracked videos don't rematch.
+    if postings is not None:
+        collection_membership(collections, postings)
+    return {"matched": matched, "unmatched": unmatched, "skipped": skipped}
 
-def resolve_collections(info_json: dict, mapping_path: str) -> list[str]:
+
+def rule_stats_report(collections: "list[dict] | CompiledCollections") -> list[dict]:
+    """Measured statistics for each rule of a collection list, for the rule stats API.
+
+    Rules are listed as written, each with its evaluation count, hit rate, mean
+    evaluation cost and its position in the order match() evaluates them in.
+    Collections without a usable rule are left out.
+    """
+    report: list[dict] = []
+    for c_name, written, ordered in compile_collections(collections).rules():
+        rules: list[dict] = []
+        for rule in written:
+            with _RULE_STATS_LOCK:
+                evaluations, hits, elapsed_ns = _rule_stats.get(rule.key)
+            rules.append(
+                {
+                    "field": rule.field,
+                    "match": "exact" if rule.exact else "in",
+                    "values": rule.raw,
+                    "evaluations": evaluations,
+                    "hits": hits,
+                    "hit_rate": round(hits / evaluations, 4) if evaluations else None,
+                    "mean_cost_us": round(elapsed_ns / evaluations / 1000, 3) if evaluations else None,
+                    "eval_position": next(i for i, r in enumerate(ordered) if r is rule),
+                }
+            )
+        report.append({"name": c_name, "rules": rules})
+    return report
+
+
+def resolve_collections(
+    info_json: dict, mapping_path: str, postings: VideoPostings | None = None, flush_delay: float = 0.0
+) -> list[str]:
     """
     Apply collection rules to a video's info_json.
 
-    Updates the mapping file with match state and unmatched tag counts only
-    if this video has not been previously tracked (not in matched_ids or
-    unmatched_ids). Returns list of matched collection names.
+    Updates the map's match state and unmatched tag counts only if this video has
+    not been previously tracked (not in matched_ids or unmatched_ids), as one
+    journal record; with a flush_delay the record stays in memory and is appended
+    within that many seconds, otherwise it is appended at once. Returns list of matched collection
+    names. For a tracked video, the answer comes from the materialized membership for
+    these postings, built on first use if the last recompute didn't leave one.
     """
+    v_id = info_json.get("id", "")
     with _MAP_LOCK:
-        v_id = info_json.get("id", "")
-        mapping_data = load_map(mapping_path)
-
-        matched_set = set(mapping_data.get("matched_ids", []))
-        unmatched_set = set(mapping_data.get("unmatched_ids", []))
-        already_tracked = v_id in matched_set or v_id in unmatched_set
-
-        # Always compute collections so Plex gets the right data on every fetch;
-        # state updates (file writes) are skipped for already-tracked videos.
-        c_matches, remaining_tags = match_video(info_json, mapping_data.get("collections", []))
+        state = _map_state(mapping_path)
+        if state.tracked is None:
+            state.tracked = {*state.data.get("matched_ids", []), *state.data.get("unmatched_ids", [])}
+        already_tracked = v_id in state.tracked
+        collections = compile_collections(state.data.get("collections", []))
 
+    # Always compute collections so Plex gets the right data on every fetch;
+    # state updates (file writes) are skipped for already-tracked videos.
+    # Matching is pure, so it runs without the map lock.
+    membership = collection_membership(collections, postings) if postings is not None and already_tracked else None
+    names = membership.of(v_id) if membership is not None else None
+    if names is not None:
+        c_matches = list(names)
+        logger.info("%s: Collection membership (materialized): %s", v_id, c_matches)
+    else:
+        c_matches, remaining_tags = match_video(info_json, collections)
         logger.info(
             "%s: Collection matching result: %s (remaining tags: %s)",
             v_id,
@@ -232,38 +1560,24 @@ def resolve_collections(info_json: dict, mapping_path: str) -> list[str]:
             remaining_tags,
         )
 
-        # Only update state if this is a new video (not yet tracked in either list)
-        if not already_tracked:
-            fresh_append = False
-
-            if c_matches:
-                matched_ids = mapping_data.setdefault("matched_ids", [])
-                if v_id not in matched_set:
-                    matched_ids.append(v_id)
-                    fresh_append = True
-            elif v_id not in unmatched_set:
-                mapping_data.setdefault("unmatched_ids", []).append(v_id)
-                fresh_append = True
-
-            # Track unused tags only for newly-seen unmatched videos to surface collection patterns
-            if fresh_append and not c_matches and remaining_tags:
-                unmatched_tags: dict[str, int] = mapping_data.setdefault("unmatched_tags", {})
-                for tag in remaining_tags:
-                    try:
-                        current = int(unmatched_tags.get(tag, 0))
-                    except (ValueError, TypeError):
-                        logger.warning(
-                            "Non-numeric count for tag %r in unmatched_tags (got %r) — treating as 0",
-                            tag,
-                            unmatched_tags.get(tag),
-                        )
-                        current = 0
-                    unmatched_tags[tag] = current + 1
-                mapping_data["unmatched_tags"] = dict(
-                    sorted(unmatched_tags.items(), key=operator.itemgetter(1), reverse=True)
-                )
-
-            save_map(mapping_path, mapping_data)
+    # Only update state if this is a new video (not yet tracked in either list)
+    if not already_tracked:
+        with _MAP_LOCK:
+            state = _map_state(mapping_path)
+            if state.tracked is None:
+                state.tracked = {*state.data.get("matched_ids", []), *state.data.get("unmatched_ids", [])}
+            if v_id not in state.tracked:  # another request may have tracked it meanwhile
+                tags = [] if c_matches else list(remaining_tags)
+                _track(state.data, state.tracked, v_id, bool(c_matches), tags)
+                _hit_states.pop(mapping_path, None)
+                record = ["m", v_id] if c_matches else ["u", v_id, tags]
+                state.pending.append(record)
+                for log in _tracking_logs.get(mapping_path, ()):
+                    log.append(record)
+                if flush_delay > 0:
+                    _schedule_flush(flush_delay)
+                else:
+                    _flush(mapping_path, state)  # on failure the record stays queued for flush_maps
 
-        logger.info("%s: Finished collection matching — result: %s", v_id, c_matches)
-        return c_matches
+    logger.info("%s: Finished collection matching — result: %s", v_id, c_matches)
+    return c_matches
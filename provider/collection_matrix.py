@@ -0,0 +1,169 @@
+"""
+Vectorized collection recompute over a video × term incidence matrix.
+
+Optional: needs NumPy, and collection_map only uses it for large libraries when it
+is installed. The posting lists of a VideoPostings become one sparse incidence
+matrix in compressed-column form — a column per (field, value) term, holding the
+ordinals of the videos with that value — and a collection becomes the set of
+columns its rules hit. Rule hits, per-video coverage and the unmatched-tag
+histogram are then gathers, uniques and bincounts over whole arrays instead of
+Python set and Counter updates per video.
+"""
+
+import threading
+from collections import Counter
+from collections.abc import Mapping, Sequence
+from itertools import chain
+from typing import Any
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None  # type: ignore[assignment]
+    NUMPY_AVAILABLE = False
+
+
+class IncidenceMatrix:
+    """Video × term incidence of a VideoPostings, one field at a time, plus its tag occurrences.
+
+    Columns for a field are built the first time a collection hits one of its terms.
+    Rows are the postings' video ordinals.
+    """
+
+    def __init__(self, postings: Any) -> None:
+        self._postings = postings
+        self.n = len(postings.ids)
+        # field → (value → column, column start offsets into indices, row indices)
+        self._fields: dict[str, tuple[dict[str, int], Any, Any]] = {}
+        self._tags: tuple[Any, Any, Any, list[int], bool] | None = None
+        self._lock = threading.Lock()
+
+    def _field(self, name: str) -> tuple[dict[str, int], Any, Any]:
+        cached = self._fields.get(name)
+        if cached is None:
+            with self._lock:
+                cached = self._fields.get(name)
+                if cached is None:
+                    postings, _ = self._postings.field(name)
+                    lists = list(postings.values())
+                    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+                    np.cumsum(np.fromiter(map(len, lists), dtype=np.int64, count=len(lists)), out=indptr[1:])
+                    indices = np.fromiter(chain.from_iterable(lists), dtype=np.int64, count=int(indptr[-1]))
+                    column = {value: i for i, value in enumerate(postings)}
+                    cached = self._fields[name] = (column, indptr, indices)
+        return cached
+
+    def _tag_layout(self) -> tuple[Any, Any, Any, list[int], bool]:
+        """Tag columns of the matrix: (column → tag id per entry, per-video tag counts, tag-list
+        lengths, ordinals whose tag list repeats a tag, whether every readable list is indexed).
+        """
+        if self._tags is None:
+            column, indptr, indices = self._field("tags")
+            tag_lists = self._postings.tag_lists()
+            with self._lock:
+                if self._tags is None:
+                    entry_terms = np.repeat(np.arange(len(column), dtype=np.int64), np.diff(indptr))
+                    distinct = np.bincount(indices, minlength=self.n)
+                    lengths = np.fromiter(
+                        (-1 if tags is None else len(tags) for tags in tag_lists), dtype=np.int64, count=self.n
+                    )
+                    odd = np.flatnonzero((distinct != lengths) & (lengths >= 0)).tolist()
+                    # An odd list is either indexed with repeats, or not indexed at all (tags
+                    # that are neither a list nor a string but still iterate, like a dict).
+                    indexed = all(distinct[o] for o in odd if tag_lists[o])
+                    self._tags = (entry_terms, distinct, lengths, odd, indexed)
+        return self._tags
+
+    def unmatched_tags(self, coverage: Any) -> Counter[str] | None:
+        """Tag counts over the videos with zero coverage, as the per-video Counter builds them.
+
+        Most common first, ties in order of first occurrence (by ordinal, then position in
+        the video's tag list) — so the result sorts the way recompute_all_collections
+        writes unmatched_tags. Returns None if an unmatched video's tags are unreadable,
+        or the tag columns can't stand in for the tag lists.
+        """
+        column, _, indices = self._field("tags")
+        entry_terms, _, lengths, odd, indexed = self._tag_layout()
+        unmatched = coverage == 0
+        if not indexed or (lengths[unmatched] < 0).any():
+            return None
+        vocabulary = list(column)
+        keep = unmatched[indices]
+        terms = entry_terms[keep]
+        videos = indices[keep]
+        counts = np.bincount(terms, minlength=len(vocabulary))
+        first = np.full(len(vocabulary), self.n, dtype=np.int64)
+        np.minimum.at(first, terms, videos)
+        tag_lists = self._postings.tag_lists()
+        for o in odd:
+            if unmatched[o]:
+                for tag, extra in Counter(tag_lists[o]).items():
+                    counts[column[tag]] += extra - 1
+        present = np.flatnonzero(counts)
+        if not present.size:
+            return Counter()
+        tallies = counts[present]
+        first_video = first[present]
+        order = np.lexsort((first_video, -tallies))
+        ordered = present[order].tolist()
+        # Tags first seen in the same video with the same count keep their order in its tag list.
+        tallies, first_video = tallies[order], first_video[order]
+        tied = (tallies[1:] == tallies[:-1]) & (first_video[1:] == first_video[:-1])
+        if tied.any():
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], tied, [0])).astype(np.int8))).tolist()
+            for lo, hi in zip(edges[::2], edges[1::2], strict=True):
+                tags = tag_lists[int(first_video[lo])]
+                ordered[lo : hi + 1] = sorted(ordered[lo : hi + 1], key=lambda t, tags=tags: tags.index(vocabulary[t]))
+        return Counter(dict(zip(map(vocabulary.__getitem__, ordered), tallies.tolist(), strict=True)))
+
+    def hits(self, terms: Mapping[str, Sequence[tuple[str, str]]]) -> tuple[dict[str, Any], Any]:
+        """Per collection name, the sorted ordinals its terms hit; and per ordinal, how many collections hit it.
+
+        terms is CompiledCollections.collection_terms(): every (field, value) in it must
+        be indexed in the postings.
+        """
+        names = list(terms)
+        owners: list[Any] = []
+        by_field: dict[str, list[tuple[int, str]]] = {}
+        for owner, c_name in enumerate(names):
+            for field_name, value in terms[c_name]:
+                by_field.setdefault(field_name, []).append((owner, value))
+        rows: list[Any] = []
+        for field_name, pairs in by_field.items():
+            column, indptr, indices = self._field(field_name)
+            cols = np.fromiter((column[value] for _, value in pairs), dtype=np.int64, count=len(pairs))
+            owner = np.fromiter((o for o, _ in pairs), dtype=np.int64, count=len(pairs))
+            # Ragged gather: the row indices of every selected column, back to back.
+            starts = indptr[cols]
+            lengths = indptr[cols + 1] - starts
+            ends = np.cumsum(lengths)
+            gather = np.repeat(starts - (ends - lengths), lengths) + np.arange(int(ends[-1]) if len(ends) else 0)
+            rows.append(indices[gather])
+            owners.append(np.repeat(owner, lengths))
+
+        n = max(self.n, 1)
+        if rows:
+            keys = np.unique(np.concatenate(owners) * n + np.concatenate(rows))
+        else:
+            keys = np.zeros(0, dtype=np.int64)
+        owner_of, ordinal_of = np.divmod(keys, n)
+        coverage = np.bincount(ordinal_of, minlength=self.n)
+        bounds = np.searchsorted(owner_of, np.arange(len(names) + 1))
+        return {c_name: ordinal_of[bounds[i] : bounds[i + 1]] for i, c_name in enumerate(names)}, coverage
+
+
+# The matrix for the latest VideoPostings asked for.
+_matrix: tuple[Any, IncidenceMatrix] | None = None
+
+
+def incidence_matrix(postings: Any) -> IncidenceMatrix:
+    """Return the incidence matrix of postings, reusing it while the postings are current."""
+    global _matrix
+    cached = _matrix
+    if cached is not None and cached[0] is postings:
+        return cached[1]
+    matrix = IncidenceMatrix(postings)
+    _matrix = (postings, matrix)
+    return matrix
@@ -0,0 +1,129 @@
+"""
+Index snapshot: persist the video index and meta cache to .yamp/ for warm startup.
+
+Each entry is keyed by the absolute .info.json path and carries the (mtime_ns, size)
+fingerprint the file had when it was read. On startup only sidecars whose fingerprint
+changed need to be parsed again; everything else is restored from the snapshot.
+"""
+
+import json
+import logging
+import os
+from typing import NamedTuple
+
+from info_json import load_fields
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE_NAME = "index_snapshot.json"
+# Bump when the on-disk layout changes — older snapshots are discarded, not migrated.
+SNAPSHOT_VERSION = 1
+
+Fingerprint = tuple[int, int]
+# (path, fingerprint, status, payload) — see fingerprint_and_project.
+ProjectionResult = tuple[str, Fingerprint | None, str, dict | str | None]
+
+
+class SnapshotEntry(NamedTuple):
+    """One indexed sidecar: its video ID, fingerprint, and projected meta (None if unparseable)."""
+
+    video_id: str
+    fingerprint: Fingerprint
+    meta: dict | None
+
+
+def file_fingerprint(path: str) -> Fingerprint | None:
+    """Return (mtime_ns, size) for path, or None if it cannot be stat'ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def fingerprint_and_project(
+    items: list[tuple[str, Fingerprint | None]], fields: frozenset[str]
+) -> list[ProjectionResult]:
+    """Stat each sidecar and parse it only if its fingerprint differs from the one given.
+
+    Runs inside process-pool workers, so it returns plain data and leaves logging to
+    the caller. Each result is (path, fingerprint, status, payload) where status is:
+      "unchanged" — fingerprint matches; not read (payload None)
+      "read"      — payload is the `fields` projection of the JSON object
+      "corrupt"   — not a valid JSON object (payload is the error message)
+      "error"     — could not be read, possibly transiently (payload is the error message)
+      "missing"   — could not be stat'ed (fingerprint and payload None)
+    """
+    results: list[ProjectionResult] = []
+    for path, known in items:
+        fingerprint = file_fingerprint(path)
+        if fingerprint is None:
+            results.append((path, None, "missing", None))
+            continue
+        if fingerprint == known:
+            results.append((path, fingerprint, "unchanged", None))
+            continue
+        try:
+            results.append((path, fingerprint, "read", load_fields(path, fields)))
+        except OSError as e:
+            results.append((path, fingerprint, "error", str(e)))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            results.append((path, fingerprint, "corrupt", str(e)))
+    return results
+
+
+def load_snapshot(snapshot_path: str, fields: frozenset[str]) -> dict[str, SnapshotEntry]:
+    """Load a snapshot written by save_snapshot.
+
+    Returns {} if the file is missing, unreadable, from another snapshot version, or was
+    written without some of `fields` — the caller then falls back to a full read. A
+    snapshot written with more fields is cut down to `fields`. Never raises.
+    """
+    try:
+        with open(snapshot_path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        logger.warning("load_snapshot: ignoring unreadable snapshot '%s': %s", snapshot_path, e)
+        return {}
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        logger.info("load_snapshot: snapshot version changed — ignoring '%s'", snapshot_path)
+        return {}
+    stored = set(data.get("fields", []))
+    if not fields <= stored:
+        logger.info("load_snapshot: projected fields changed — ignoring '%s'", snapshot_path)
+        return {}
+
+    entries: dict[str, SnapshotEntry] = {}
+    try:
+        for path, (video_id, mtime_ns, size, meta) in data.get("entries", {}).items():
+            if meta is not None and stored != fields:
+                meta = {k: v for k, v in meta.items() if k in fields}
+            entries[path] = SnapshotEntry(video_id, (mtime_ns, size), meta)
+    except (TypeError, ValueError) as e:
+        logger.warning("load_snapshot: malformed entry in '%s' — ignoring snapshot: %s", snapshot_path, e)
+        return {}
+    logger.info("load_snapshot: restored %d entries from %s", len(entries), snapshot_path)
+    return entries
+
+
+def save_snapshot(snapshot_path: str, entries: dict[str, SnapshotEntry], fields: frozenset[str]) -> None:
+    """Atomically write entries to snapshot_path. Raises OSError on failure."""
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "fields": sorted(fields),
+        "entries": {path: [e.video_id, *e.fingerprint, e.meta] for path, e in entries.items()},
+    }
+    content = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    tmp_path = snapshot_path + ".tmp"
+    try:
+        with open(tmp_path, encoding="utf-8", mode="w") as f:
+            f.write(content)
+        os.replace(tmp_path, snapshot_path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError as unlink_err:
+            logger.warning("save_snapshot: failed to clean up temp file '%s': %s", tmp_path, unlink_err)
+        raise
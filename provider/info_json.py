@@ -0,0 +1,152 @@
+"""
+Field-projecting reader for yt-dlp .info.json sidecars.
+
+Sidecars are often 1-5 MB, nearly all of it `formats`, `thumbnails`, and
+`automatic_captions`, while most callers need a handful of top-level keys. load_fields
+walks the top-level object, decodes only the requested values, and skips everything
+else without building Python objects for it. Scanning stops as soon as every requested
+key has been seen — `id` is the first key yt-dlp writes, so an ID lookup reads only the
+head of the file.
+
+Anything the scanner does not understand falls back to a full json.loads, so malformed
+input raises the same json.JSONDecodeError / UnicodeDecodeError that json.load would.
+Stopping early means the rest of the file is not validated; the one check made is that
+the document ends with the object's closing brace, which catches a sidecar cut off by
+an interrupted download. Damage in the middle of a file that still ends in "}" is only
+detected when the scan reaches it.
+
+Skipped strings and scalars cost a regex step, but skipped arrays and objects are
+decoded by json's C parser and discarded, so keys that come after `formats` or
+`automatic_captions` still pay for parsing them (though not for keeping them).
+"""
+
+import json
+import os
+import re
+from collections.abc import Collection
+from json.decoder import scanstring
+
+# Characters read before trying to finish from the head alone; the rest of the file
+# is read only if a requested key lies beyond it.
+_HEAD_CHARS = 64 * 1024
+
+# Bytes read from the end of the file to check it closes the object.
+_TAIL_BYTES = 64
+
+_WS = re.compile(r"[ \t\n\r]*")
+_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"')
+_SCALAR = re.compile(r"[-+.0-9a-zA-Z]+")
+_decoder = json.JSONDecoder()
+
+
+class _Unsupported(Exception):
+    """The scanner cannot continue — fall back to a full parse."""
+
+
+def _skip_value(s: str, i: int) -> int:
+    """Return the index just past the JSON value starting at s[i].
+
+    Strings and scalars are stepped over without being decoded. Containers are
+    decoded by the C scanner and dropped straight away: a pure-Python bracket matcher
+    is several times slower than json's C parser, and decoding one subtree at a time
+    still keeps peak memory at the largest subtree instead of the whole document.
+    """
+    c = s[i]
+    if c == '"':
+        m = _STRING_TAIL.match(s, i + 1)
+        if m is None:
+            raise _Unsupported
+        return m.end()
+    if c == "[" or c == "{":
+        return _decoder.raw_decode(s, i)[1]
+    m = _SCALAR.match(s, i)
+    if m is None:
+        raise _Unsupported
+    return m.end()
+
+
+def _scan(s: str, fields: Collection[str]) -> dict:
+    """Decode the requested top-level keys of the JSON object in s.
+
+    Raises _Unsupported, IndexError (ran off the end), or ValueError when s is not a
+    well-formed object — or, for a truncated head, not yet complete enough.
+    """
+    wanted = set(fields)
+    out: dict = {}
+    i = _WS.match(s, 0).end()
+    if s[i] != "{":
+        raise _Unsupported
+    i = _WS.match(s, i + 1).end()
+    if s[i] == "}":
+        return out
+    while True:
+        if s[i] != '"':
+            raise _Unsupported
+        key, i = scanstring(s, i + 1)
+        i = _WS.match(s, i).end()
+        if s[i] != ":":
+            raise _Unsupported
+        i = _WS.match(s, i + 1).end()
+        if key in wanted:
+            out[key], i = _decoder.raw_decode(s, i)
+            wanted.discard(key)
+        else:
+            i = _skip_value(s, i)
+        # Read the delimiter before stopping early: in a truncated head a number cut
+        # off at the boundary would otherwise decode as a shorter number.
+        i = _WS.match(s, i).end()
+        delim = s[i]
+        if not wanted:
+            return out
+        if delim == "}":
+            return out
+        if delim != ",":
+            raise _Unsupported
+        i = _WS.match(s, i + 1).end()
+
+
+def _closes_object(tail: str) -> bool:
+    """True if text ending in tail ends with a closing brace (trailing whitespace allowed)."""
+    return tail.rstrip(" \t\n\r").endswith("}")
+
+
+def project(text: str, fields: Collection[str]) -> dict:
+    """Return {key: value} for the keys in fields that are present in the JSON object text.
+
+    Raises json.JSONDecodeError if text is not valid JSON or not a JSON object (see the
+    module docstring for what an early stop leaves unchecked).
+    """
+    if _closes_object(text[-_TAIL_BYTES:]):
+        try:
+            return _scan(text, fields)
+        except (_Unsupported, IndexError, ValueError):
+            pass
+    info = json.loads(text)
+    if not isinstance(info, dict):
+        raise json.JSONDecodeError("Expecting a JSON object", text, 0)
+    return {k: info[k] for k in fields if k in info}
+
+
+def load_fields(path: str, fields: Collection[str]) -> dict:
+    """Read only the given top-level keys of the .info.json at path.
+
+    A drop-in for `{k: info[k] for k in fields if k in info}` after json.load: raises
+    OSError, json.JSONDecodeError, or UnicodeDecodeError for unreadable, truncated, or
+    non-object files. When the requested keys are all in the head, the rest of the file
+    is only checked for its closing brace, not parsed (see the module docstring).
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read(_HEAD_CHARS)
+        if len(text) == _HEAD_CHARS:
+            try:
+                result = _scan(text, fields)
+            except (_Unsupported, IndexError, ValueError):
+                text += f.read()
+            else:
+                size = f.buffer.seek(0, os.SEEK_END)
+                f.buffer.seek(max(0, size - _TAIL_BYTES))
+                if _closes_object(f.buffer.read().decode("utf-8", errors="replace")):
+                    return result
+                f.buffer.seek(0)
+                text = f.buffer.read().decode("utf-8")
+    return project(text, fields)
@@ -12,6 +12,11 @@ _YOUTUBE_ID_RE = re.compile(r"\[([A-Za-z0-9_-]{11})\](?:\.[^.\s]+)*$")
 _BILIBILI_ID_RE = re.compile(r"\[([AB][Vv][A-Za-z0-9]+)\](?:\.[^.\s]+)*$")
 _GENERIC_ID_RE = re.compile(r"\[([A-Za-z0-9_-]{5,})\](?:\.[^.\s]+)*$")
 
+# Top-level info_json keys read by build_metadata_response.
+METADATA_FIELDS = frozenset(
+    {"id", "title", "upload_date", "description", "duration", "extractor", "categories", "channel", "thumbnail"}
+)
+
 
 def _require_fields(info_json: dict, *fields: str) -> None:
     """Raise ValueError if any of the required fields are missing from info_json."""
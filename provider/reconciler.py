@@ -0,0 +1,190 @@
+"""
+Background index reconciliation: periodically re-sync the in-memory index with disk.
+
+A pass is an incremental index rebuild (unchanged directories cost one stat each).
+Scheduled passes are throttled by an IOBudget so a large library on a network mount
+is reconciled slowly in the background instead of in one burst that competes with
+Plex requests. The gap between passes adapts to how long the last one took, and
+drops to the minimum after a pass that found changes so active downloads are picked
+up quickly.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Scheduled passes may occupy at most 1/_DUTY_FACTOR of wall time, and so may
+# on-demand passes (see Reconciler.may_run_now).
+_DUTY_FACTOR = 10.0
+
+
+class IOBudget:
+    """Token bucket limiting file-system operations to `rate` per second (0 = unlimited).
+
+    spend() blocks the calling thread until the operations fit the budget, so call it
+    from worker threads only. It also counts every operation, which is how pass
+    progress is reported. lift() removes the limit from any thread, waking a waiting
+    spend() at once.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.spent = 0
+        self._tokens = rate  # allow a one-second burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._lifted = threading.Event()
+
+    def spend(self, n: int) -> None:
+        with self._lock:
+            self.spent += n
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate) - n
+            self._last = now
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._lifted.wait(wait)
+
+    def lift(self) -> None:
+        """Stop limiting: the rest of the pass runs at full speed."""
+        with self._lock:
+            self.rate = 0
+        self._lifted.set()
+
+
+class Reconciler:
+    """Run index rebuild passes one at a time, on a schedule and on demand.
+
+    `build(budget)` runs in a worker thread and returns a result that `publish(result)`
+    installs on the event loop, returning True if the index changed. Concurrent
+    callers of run_pass() share the pass in flight.
+
+    Scheduled passes draw from one long-lived budget, `throttle`, which other background
+    scanners (the sidecar poller) charge their stats to as well, so together they stay
+    within `iops`.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[IOBudget], Any],
+        publish: Callable[[Any], bool],
+        iops: float,
+        min_interval: float,
+        max_interval: float,
+    ) -> None:
+        self._build = build
+        self._publish = publish
+        self.iops = iops
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._task: asyncio.Task | None = None
+        self._budget: IOBudget | None = None
+        self._spent_before = 0  # self._budget.spent when the current or last pass started
+        self._throttle = IOBudget(iops)
+        self.passes = 0
+        self.last_duration = 0.0
+        self.last_finished = 0.0
+        self.last_changed = False
+        self.last_error: str | None = None
+        self.next_due = 0.0
+
+    @property
+    def throttle(self) -> IOBudget:
+        """The budget of scheduled passes. Read it for each batch of work: a lifted one is replaced."""
+        return self._throttle
+
+    @property
+    def in_flight(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def run_pass(self, throttled: bool = False) -> None:
+        """Run a pass, or wait for the one already in flight.
+
+        An unthrottled caller lifts the throttle of a scheduled pass it joins, so an
+        on-demand request never waits on the IOPS budget. The task is shielded: a
+        cancelled caller does not cancel the pass for the others. Build errors
+        propagate to every waiter.
+        """
+        if not self.in_flight:
+            self._budget = self._throttle if throttled else IOBudget(0)
+            self._spent_before = self._budget.spent
+            self._task = asyncio.ensure_future(self._run(self._budget))
+        elif not throttled and self._budget is not None and self._budget.rate > 0:
+            logger.info("Reconciler: on-demand pass joined a throttled one — lifting the throttle")
+            self._budget.lift()
+        await asyncio.shield(self._task)
+
+    async def _run(self, budget: IOBudget) -> None:
+        started = time.monotonic()
+        self.last_changed = False
+        try:
+            result = await asyncio.to_thread(self._build, budget)
+            self.last_changed = self._publish(result)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        finally:
+            if budget is self._throttle and budget.rate != self.iops:
+                self._throttle = IOBudget(self.iops)  # lifted for this pass only
+            self.record_pass(time.monotonic() - started, self.last_changed)
+        logger.info(
+            "Reconciler: pass %d done in %.1fs (%d stat(s), %s) — next in %.0fs",
+            self.passes,
+            self.last_duration,
+            budget.spent - self._spent_before,
+            "index changed" if self.last_changed else "no changes",
+            self.next_due - self.last_finished,
+        )
+
+    def record_pass(self, duration: float, changed: bool) -> None:
+        """Account for a pass that just finished (also used for the synchronous startup build)."""
+        self.passes += 1
+        self.last_duration = duration
+        self.last_changed = changed
+        self.last_finished = time.monotonic()
+        self.next_due = self.last_finished + self.interval()
+
+    def interval(self) -> float:
+        """Seconds until the next scheduled pass, based on the last one."""
+        if self.last_changed:
+            return self.min_interval
+        return min(self.max_interval, max(self.min_interval, self.last_duration * _DUTY_FACTOR))
+
+    def may_run_now(self) -> bool:
+        """True if an on-demand pass now would keep passes within the duty cycle."""
+        return self.in_flight or time.monotonic() - self.last_finished >= self.last_duration * _DUTY_FACTOR
+
+    async def run_forever(self) -> None:
+        """Schedule throttled passes until cancelled. Errors are logged and retried next interval."""
+        while True:
+            # Re-read next_due after every sleep: an on-demand pass in between pushes it back.
+            delay = self.next_due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await self.run_pass(throttled=True)
+            except Exception:
+                logger.exception("Reconciler: pass failed")
+
+    def status(self) -> dict:
+        """Progress and timing of the current or last pass, for the status API."""
+        now = time.monotonic()
+        return {
+            "state": "running" if self.in_flight else "idle",
+            "passes": self.passes,
+            "stats_done": self._budget.spent - self._spent_before if self._budget else 0,
+            "iops_budget": self.iops,
+            "last_duration_s": round(self.last_duration, 3),
+            "last_changed": self.last_changed,
+            "last_error": self.last_error,
+            "next_pass_in_s": None if self.in_flight else round(max(0.0, self.next_due - now), 1),
+        }
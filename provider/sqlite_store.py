@@ -0,0 +1,320 @@
+"""
+Optional SQLite store for the collection map and the index snapshot.
+
+One database file under .yamp/ (stdlib sqlite3, no outside services) holds what the
+JSON files otherwise hold: the collections with their rules, the per-video match
+state and unmatched tag counts, and the fingerprinted meta cache snapshot. Recording
+a newly seen video is an indexed insert, and saving a map or a snapshot only writes
+the rows that changed, instead of rewriting whole JSON documents.
+
+The snapshot's tags and channel are stored as rows and columns of their own, indexed
+(case-insensitively, as rules compare them) along with the video ID, so the stored
+metadata can be queried by tag or channel; the other projected fields are kept as
+JSON. This is a storage backend only: the server still loads the map's match state
+and the meta cache into memory and matches there, so resident memory still grows
+with the library. What the store saves is the cost of writing them back.
+
+A map is kept in SQLite once its .yamp/ directory holds the database file; see
+build_store and open_store. Errors surface as OSError, like the JSON files'.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections.abc import Iterator, Mapping
+
+from index_snapshot import SnapshotEntry
+
+logger = logging.getLogger(__name__)
+
+SQLITE_FILE_NAME = "yamp.sqlite3"
+# Top-level map keys with tables of their own; any other key is kept in settings as JSON.
+_MAP_TABLE_KEYS = ("collections", "matched_ids", "unmatched_ids", "unmatched_tags")
+
+# Bumped when a table changes shape; see _migrate.
+_SCHEMA_VERSION = 2
+
+# meta.extra is the projected meta minus what has columns of its own (NULL: no meta);
+# has_tags says whether a tags list was moved out into meta_tags.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS collections (position INTEGER PRIMARY KEY, name TEXT, spec TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS match_state (video_id TEXT PRIMARY KEY, matched INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS unmatched_tags (tag TEXT PRIMARY KEY, count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (
+    path TEXT PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    channel TEXT,
+    has_tags INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS meta_tags (
+    path TEXT NOT NULL, position INTEGER NOT NULL, tag TEXT NOT NULL, PRIMARY KEY (path, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS meta_video_id ON meta (video_id);
+CREATE INDEX IF NOT EXISTS meta_channel ON meta (channel COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS meta_tags_tag ON meta_tags (tag COLLATE NOCASE);
+"""
+
+
+def _migrate(db: sqlite3.Connection) -> None:
+    """Bring a database written by an older version up to _SCHEMA_VERSION."""
+    (version,) = db.execute("PRAGMA user_version").fetchone()
+    if version < 2 and db.execute("SELECT 1 FROM sqlite_master WHERE name = 'meta'").fetchone():
+        # Version 1 kept each meta as one JSON blob. The snapshot is a cache: drop it
+        # and let the next startup index from the sidecars.
+        logger.info("SQLiteStore: stored snapshot has an old layout — dropping it")
+        db.execute("DROP TABLE meta")
+        db.execute("DELETE FROM settings WHERE key = 'snapshot.fields'")
+    db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+
+def _meta_columns(meta: dict | None) -> tuple[str | None, bool, list[str], str | None]:
+    """Split a projected meta into (channel, has_tags, tags, extra) for the meta tables.
+
+    Tags and channel get columns only if they are strings; anything else stays in extra.
+    """
+    if meta is None:
+        return None, False, [], None
+    extra = dict(meta)
+    channel = extra.pop("channel") if isinstance(extra.get("channel"), str) else None
+    tags = extra.get("tags")
+    has_tags = isinstance(tags, list) and all(isinstance(t, str) for t in tags)
+    if has_tags:
+        del extra["tags"]
+    return channel, has_tags, tags if has_tags else [], json.dumps(extra, ensure_ascii=False)
+
+
+def _read_match_state(db: sqlite3.Connection) -> tuple[dict[str, int], dict[str, int]]:
+    """The stored match state (video ID → matched) and unmatched tag counts."""
+    state = dict(db.execute("SELECT video_id, matched FROM match_state ORDER BY rowid"))
+    # The map's order: most frequent first, ties by tag (see collection_map._sorted_tags).
+    tags = dict(db.execute("SELECT tag, count FROM unmatched_tags ORDER BY count DESC, tag"))
+    return state, tags
+
+
+class SQLiteStore:
+    """The database of one .yamp/ directory. Safe to share between threads."""
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # The snapshot entries last loaded or saved, so the next save only writes the difference.
+        self._saved: Mapping[str, SnapshotEntry] | None = None
+        try:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            _migrate(self._db)
+            self._db.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            raise OSError(f"Failed to open SQLite store '{db_path}': {e}") from e
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    yield self._db
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                raise OSError(f"SQLite store '{self.db_path}': {e}") from e
+
+    # ── Collection map ────────────────────────────────────────────────────────
+
+    def load_map(self) -> dict:
+        """Return the collection map, assembled as load_map reads it from JSON."""
+        with self._transaction() as db:
+            data: dict = {
+                "collections": [
+                    json.loads(spec) for (spec,) in db.execute("SELECT spec FROM collections ORDER BY position")
+                ]
+            }
+            for key, value in db.execute("SELECT key, value FROM settings WHERE key LIKE 'map.%'"):
+                data[key.removeprefix("map.")] = json.loads(value)
+            state, tags = _read_match_state(db)
+            data["matched_ids"] = [video_id for video_id, matched in state.items() if matched]
+            data["unmatched_ids"] = [video_id for video_id, matched in state.items() if not matched]
+            data["unmatched_tags"] = tags
+        return data
+
+    def save_map(self, data: dict) -> None:
+        """Store data as the map in one transaction.
+
+        Collections and other keys are rewritten; the match state and tag counts only
+        have their changed rows written, found by reading the stored rows inside the
+        transaction rather than keeping a second copy of them in memory. Videos keep the
+        row order they were first stored in, so the lists may load in a different order
+        than they were saved.
+        """
+        state = dict.fromkeys(data.get("matched_ids", []), 1)
+        for video_id in data.get("unmatched_ids", []):
+            state.setdefault(video_id, 0)
+        tags = dict(data.get("unmatched_tags", {}))
+        with self._transaction() as db:
+            db.execute("DELETE FROM collections")
+            db.executemany(
+                "INSERT INTO collections (position, name, spec) VALUES (?, ?, ?)",
+                (
+                    (i, c.get("name") if isinstance(c, dict) else None, json.dumps(c, ensure_ascii=False))
+                    for i, c in enumerate(data.get("collections", []))
+                ),
+            )
+            db.execute("DELETE FROM settings WHERE key LIKE 'map.%'")
+            db.executemany(
+                "INSERT INTO settings (key, value) VALUES (?, ?)",
+                (
+                    (f"map.{key}", json.dumps(value, ensure_ascii=False))
+                    for key, value in data.items()
+                    if key not in _MAP_TABLE_KEYS
+                ),
+            )
+            old_state, old_tags = _read_match_state(db)
+            gone = old_state.keys() - state.keys()
+            db.executemany("DELETE FROM match_state WHERE video_id = ?", ((v,) for v in gone))
+            db.executemany(
+                "INSERT INTO match_state (video_id, matched) VALUES (?, ?)"
+                " ON CONFLICT (video_id) DO UPDATE SET matched = excluded.matched",
+                ((v, m) for v, m in state.items() if old_state.get(v) != m),
+            )
+            db.executemany("DELETE FROM unmatched_tags WHERE tag = ?", ((t,) for t in old_tags.keys() - tags.keys()))
+            db.executemany(
+                "INSERT INTO unmatched_tags (tag, count) VALUES (?, ?)"
+                " ON CONFLICT (tag) DO UPDATE SET count = excluded.count",
+                ((t, c) for t, c in tags.items() if old_tags.get(t) != c),
+            )
+
+    def track(self, records: list[list]) -> None:
+        """Record newly seen videos, given as collection_map journal records, in one transaction.
+
+        A video already in the match state is skipped along with its tags, as on replay.
+        """
+        with self._transaction() as db:
+            for kind, video_id, *tags in records:
+                cursor = db.execute(
+                    "INSERT OR IGNORE INTO match_state (video_id, matched) VALUES (?, ?)", (video_id, kind == "m")
+                )
+                if cursor.rowcount and tags:
+                    db.executemany(
+                        "INSERT INTO unmatched_tags (tag, count) VALUES (?, 1)"
+                        " ON CONFLICT (tag) DO UPDATE SET count = count + 1",
+                        ((tag,) for tag in tags[0]),
+                    )
+
+    # ── Index snapshot ────────────────────────────────────────────────────────
+
+    def load_snapshot(self, fields: frozenset[str]) -> dict[str, SnapshotEntry]:
+        """Like index_snapshot.load_snapshot: {} if the stored entries lack some of `fields`."""
+        with self._transaction() as db:
+            row = db.execute("SELECT value FROM settings WHERE key = 'snapshot.fields'").fetchone()
+            stored = set(json.loads(row[0])) if row else set()
+            if row is None or not fields <= stored:
+                if row is not None:
+                    logger.info("SQLiteStore: projected fields changed — ignoring the stored snapshot")
+                return {}
+            tags: dict[str, list[str]] = {}
+            for path, tag in db.execute("SELECT path, tag FROM meta_tags ORDER BY path, position"):
+                tags.setdefault(path, []).append(tag)
+            entries: dict[str, SnapshotEntry] = {}
+            for path, video_id, mtime_ns, size, channel, has_tags, extra in db.execute(
+                "SELECT path, video_id, mtime_ns, size, channel, has_tags, extra FROM meta"
+            ):
+                meta = None
+                if extra is not None:
+                    meta = json.loads(extra)
+                    if channel is not None:
+                        meta["channel"] = channel
+                    if has_tags:
+                        meta["tags"] = tags.get(path, [])
+                    if stored != fields:
+                        meta = {k: v for k, v in meta.items() if k in fields}
+                entries[path] = SnapshotEntry(video_id, (mtime_ns, size), meta)
+        self._saved = entries if stored == fields else None
+        logger.info("SQLiteStore: restored %d entries from %s", len(entries), self.db_path)
+        return entries
+
+    def save_snapshot(self, entries: Mapping[str, SnapshotEntry], fields: frozenset[str]) -> None:
+        """Store the snapshot, writing only the entries that differ from the last one loaded or saved.
+
+        entries is kept for that comparison, not copied — don't modify it afterwards.
+        """
+        with self._transaction() as db:
+            row = db.execute("SELECT value FROM settings WHERE key = 'snapshot.fields'").fetchone()
+            saved = self._saved if row is not None and set(json.loads(row[0])) == fields else None
+            if saved is None:
+                db.execute("DELETE FROM meta")
+                db.execute("DELETE FROM meta_tags")
+                changed = list(entries.items())
+            else:
+                gone = [(p,) for p in saved.keys() - entries.keys()]
+                db.executemany("DELETE FROM meta WHERE path = ?", gone)
+                db.executemany("DELETE FROM meta_tags WHERE path = ?", gone)
+                changed = [(p, e) for p, e in entries.items() if saved.get(p) != e]
+                db.executemany("DELETE FROM meta_tags WHERE path = ?", ((p,) for p, _ in changed))
+            for p, e in changed:
+                channel, has_tags, tags, extra = _meta_columns(e.meta)
+                db.execute(
+                    "INSERT OR REPLACE INTO meta (path, video_id, mtime_ns, size, channel, has_tags, extra)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (p, e.video_id, *e.fingerprint, channel, has_tags, extra),
+                )
+                db.executemany(
+                    "INSERT INTO meta_tags (path, position, tag) VALUES (?, ?, ?)",
+                    ((p, i, tag) for i, tag in enumerate(tags)),
+                )
+            db.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES ('snapshot.fields', ?)",
+                (json.dumps(sorted(fields)),),
+            )
+        self._saved = entries
+
+
+# Open stores by database path, shared by every caller in the process.
+_stores: dict[str, SQLiteStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(yamp_dir: str) -> SQLiteStore | None:
+    """Return the store of a .yamp/ directory, or None if it has no database (JSON files are used)."""
+    db_path = os.path.join(yamp_dir, SQLITE_FILE_NAME)
+    store = _stores.get(db_path)
+    if store is None and os.path.exists(db_path):
+        with _stores_lock:
+            store = _stores.get(db_path)
+            if store is None:
+                store = _stores[db_path] = SQLiteStore(db_path)
+    return store
+
+
+def build_store(yamp_dir: str, data: dict) -> SQLiteStore:
+    """Create the database of a .yamp/ directory holding the collection map data, and open it.
+
+    The database is built under a temporary name and renamed into place, so a failed
+    build never leaves a half-filled store for open_store to pick up. Raises OSError.
+    """
+    db_path = os.path.join(yamp_dir, SQLITE_FILE_NAME)
+    tmp_path = db_path + ".tmp"
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(tmp_path)
+    store = SQLiteStore(tmp_path)
+    try:
+        store.save_map(data)
+    finally:
+        store.close()
+    os.replace(tmp_path, db_path)
+    store = open_store(yamp_dir)
+    assert store is not None
+    return store
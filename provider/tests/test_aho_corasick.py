@@ -0,0 +1,19 @@
+from aho_corasick import AhoCorasick
+
+
+def test_find_reports_overlapping_and_nested_patterns():
+    ac = AhoCorasick({"he": {1}, "she": {2}, "his": {3}, "hers": {4}})
+    assert ac.find("ushers") == {1, 2, 4}
+    assert ac.find("this") == {3}
+    assert ac.find("xyz") == set()
+
+
+def test_labels_are_merged_per_pattern():
+    ac = AhoCorasick({"jazz": {1, 2}, "azz": {3}})
+    assert ac.find("acid jazz live") == {1, 2, 3}
+
+
+def test_empty_pattern_occurs_in_every_text():
+    ac = AhoCorasick({"": {7}, "x": {8}})
+    assert ac.find("") == {7}
+    assert ac.find("x") == {7, 8}
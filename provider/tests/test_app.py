@@ -5,17 +5,22 @@ Uses httpx.AsyncClient with ASGITransport to exercise routes without
 triggering the lifespan (which requires a real DATA_PATH directory).
 """
 
+import asyncio
 import json
+import os
+import time
 from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import httpx
 import pytest
 import requests
+from fastapi import HTTPException
 from httpx import ASGITransport
 
 import app as yamp_app
 from app import app
+from video_index import VideoIndex
 
 FIXTURES = Path(__file__).parent / "fixtures"
 
@@ -26,9 +31,20 @@ def _map_path(tmp_path: Path) -> Path:
     return tmp_path / ".yamp" / "collection_map.json"
 
 
+def _use_index(monkeypatch, videos=None, stems=None, meta=None, entries=None) -> None:
+    """Publish a VideoIndex built from plain dicts as the app's current index."""
+    monkeypatch.setattr(yamp_app, "_index", VideoIndex(1, videos or {}, stems or {}, meta or {}, entries or {}))
+
+
 # ── Fixtures ──────────────────────────────────────────────────────────────────
 
 
+@pytest.fixture(autouse=True)
+def _restore_meta_fields(monkeypatch):
+    """Rule saves retarget the meta cache projection; keep that from leaking into other tests."""
+    monkeypatch.setattr(yamp_app, "_meta_fields", yamp_app._meta_fields)
+
+
 @pytest.fixture
 def tmp_data(tmp_path):
     info = json.loads((FIXTURES / "sample.info.json").read_bytes())
@@ -44,9 +60,7 @@ def patched_app(tmp_data, monkeypatch):
     tmp_path, info = tmp_data
     index = {info["id"]: str(tmp_path / f"{info['id']}.info.json")}
     stem_index = {info["id"]: info["id"]}  # stem of "{id}.info.json" is "{id}"
-    monkeypatch.setattr(yamp_app, "_video_index", index)
-    monkeypatch.setattr(yamp_app, "_stem_index", stem_index)
-    monkeypatch.setattr(yamp_app, "_video_meta_cache", {})  # empty → falls back to disk reads
+    _use_index(monkeypatch, index, stem_index)  # empty meta cache → falls back to disk reads
     monkeypatch.setattr(yamp_app, "DATA_PATH", str(tmp_path))
     return index, info, tmp_path
 
@@ -89,6 +103,119 @@ def test_build_index_filename_id_takes_priority(tmp_path):
     assert dir_id not in index
 
 
+def _bump_mtime(path: Path) -> None:
+    """Advance a directory's mtime so the test doesn't depend on timestamp granularity."""
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_build_index_incremental_skips_unchanged_directories(tmp_path, monkeypatch):
+    """With a dir_cache, unchanged directories are stat'ed but not re-listed."""
+    from app import build_index
+
+    video_dir = tmp_path / "Channel" / "Live [abcdefghijk]"
+    video_dir.mkdir(parents=True)
+    (video_dir / "Live.info.json").write_text(json.dumps({"id": "abcdefghijk"}), encoding="utf-8")
+    dir_cache: dict = {}
+    first = build_index(str(tmp_path), dir_cache=dir_cache)
+    assert set(dir_cache) == {str(tmp_path), str(tmp_path / "Channel"), str(video_dir)}
+
+    def _no_scandir(_path):
+        raise AssertionError("unchanged directory should not be listed")
+
+    monkeypatch.setattr(os, "scandir", _no_scandir)
+    assert build_index(str(tmp_path), dir_cache=dir_cache) == first
+
+
+def test_build_index_incremental_relists_changed_directory(tmp_path):
+    """A directory whose mtime changed is re-listed; new and removed videos are picked up."""
+    from app import build_index
+
+    channel = tmp_path / "Channel"
+    old_dir = channel / "Old [oldoldoldol]"
+    old_dir.mkdir(parents=True)
+    (old_dir / "Old.info.json").write_text("{}", encoding="utf-8")
+    dir_cache: dict = {}
+    index, _ = build_index(str(tmp_path), dir_cache=dir_cache)
+    assert set(index) == {"oldoldoldol"}
+
+    (old_dir / "Old.info.json").unlink()
+    old_dir.rmdir()
+    new_dir = channel / "New [newnewnewne]"
+    new_dir.mkdir()
+    (new_dir / "New.info.json").write_text("{}", encoding="utf-8")
+    _bump_mtime(channel)
+
+    index, stem_index = build_index(str(tmp_path), dir_cache=dir_cache)
+    assert set(index) == {"newnewnewne"}
+    assert stem_index == {"New": "newnewnewne"}
+    assert str(old_dir) not in dir_cache
+
+
+def test_build_index_incremental_retries_failed_reads(tmp_path):
+    """A directory with an unreadable no-bracket sidecar is not cached, so the read is retried."""
+    from app import build_index
+
+    bad = tmp_path / "bare.info.json"
+    bad.write_text("{{not json", encoding="utf-8")
+    dir_cache: dict = {}
+    index, _ = build_index(str(tmp_path), dir_cache=dir_cache)
+    assert index == {}
+    assert str(tmp_path) not in dir_cache
+
+    bad.write_text(json.dumps({"id": "bareID12345"}), encoding="utf-8")
+    index, _ = build_index(str(tmp_path), dir_cache=dir_cache)
+    assert index == {"bareID12345": str(bad)}
+
+
+def _make_tree(tmp_path: Path) -> None:
+    """Several channels with MeTube and flat layouts, plus one ID duplicated across folders."""
+    for c in range(4):
+        channel = tmp_path / f"Channel {c}"
+        for v in range(5):
+            video_dir = channel / f"Video {v} [c{c}v{v}xxxxxxx]"
+            video_dir.mkdir(parents=True)
+            (video_dir / f"Video {v}.info.json").write_text("{}", encoding="utf-8")
+        (channel / f"Flat [c{c}flatxxxxx].info.json").write_text("{}", encoding="utf-8")
+        (channel / "Dup [duplicateID].info.json").write_text("{}", encoding="utf-8")
+
+
+def test_build_index_parallel_matches_sequential(tmp_path):
+    """The thread-pool walker yields exactly the sequential result, including duplicate resolution."""
+    from app import build_index
+
+    _make_tree(tmp_path)
+    sequential = build_index(str(tmp_path))
+    parallel = build_index(str(tmp_path), workers=8)
+
+    assert parallel == sequential
+    assert list(parallel[0].items()) == list(sequential[0].items())
+
+
+def test_build_index_parallel_reports_walk_errors(tmp_path, monkeypatch, caplog):
+    """An unlistable directory goes through onerror and the rest of the tree is still indexed."""
+    import logging
+
+    from app import build_index
+
+    _make_tree(tmp_path)
+    broken = str(tmp_path / "Channel 1")
+    real_scandir = os.scandir
+
+    def _scandir(path):
+        if path == broken:
+            raise PermissionError(13, "Permission denied", path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", _scandir)
+    with caplog.at_level(logging.WARNING):
+        index, _ = build_index(str(tmp_path), workers=4)
+
+    assert "c0v0xxxxxxx" in index
+    assert not any(vid.startswith("c1") for vid in index)
+    assert any("Index walk error" in r.message and broken in r.message for r in caplog.records)
+
+
 # ── _video_id_from_plex_item ──────────────────────────────────────────────────
 
 
@@ -306,12 +433,12 @@ async def test_api_videos_basic(patched_app):
     assert isinstance(v["collections"], list)
 
 
-async def test_api_videos_corrupt_file(patched_app):
+async def test_api_videos_corrupt_file(patched_app, monkeypatch):
     index, info, tmp_path = patched_app
     # Inject a corrupt entry alongside the valid one
     bad_path = tmp_path / "bad_id.info.json"
     bad_path.write_text("{{not json}}", encoding="utf-8")
-    index["bad_id"] = str(bad_path)
+    _use_index(monkeypatch, {**index, "bad_id": str(bad_path)})
 
     async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         resp = await client.get("/api/videos")
@@ -323,12 +450,12 @@ async def test_api_videos_corrupt_file(patched_app):
     assert "bad_id" in data.get("skipped_videos", [])
 
 
-async def test_api_videos_unicode_decode_error(patched_app):
+async def test_api_videos_unicode_decode_error(patched_app, monkeypatch):
     """info.json with non-UTF-8 bytes → video is skipped, not a 500."""
     index, info, tmp_path = patched_app
     bad_path = tmp_path / "bad_unicode.info.json"
     bad_path.write_bytes(b"\xff\xfe not valid utf-8")
-    index["bad_unicode"] = str(bad_path)
+    _use_index(monkeypatch, {**index, "bad_unicode": str(bad_path)})
 
     async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         resp = await client.get("/api/videos")
@@ -433,6 +560,26 @@ async def test_api_get_collections_happy_path(patched_app):
     assert data["unmatched_tags"] == {"jazz": 3}
 
 
+async def test_api_collection_rule_stats_lists_rules_with_their_order(patched_app):
+    """Rule stats come back per collection, rules as written, with their evaluation position."""
+    _, _, tmp_path = patched_app
+    rules = [
+        {"field": "description", "match": "in", "values": ["live"]},
+        {"field": "tags", "match": "exact", "values": ["jazz"]},
+    ]
+    (_map_path(tmp_path)).write_text(json.dumps({"collections": [{"name": "Jazz", "rules": rules}]}), encoding="utf-8")
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.get("/api/collections/rule-stats")
+    assert resp.status_code == 200
+    (collection,) = resp.json()["collections"]
+    assert collection["name"] == "Jazz"
+    assert [(r["field"], r["match"], r["eval_position"]) for r in collection["rules"]] == [
+        ("description", "in", 0),
+        ("tags", "exact", 1),
+    ]
+    assert {"evaluations", "hits", "hit_rate", "mean_cost_us"} <= collection["rules"][0].keys()
+
+
 async def test_api_get_collections_corrupt_map(patched_app):
     """Corrupt map file → HTTP 500."""
     _, _, tmp_path = patched_app
@@ -1324,7 +1471,7 @@ async def test_match_parent_dir_fallback(patched_app):
 async def test_match_stem_index_fallback(patched_app, monkeypatch):
     """Bare filename with no ID anywhere → stem index resolves to correct video."""
     _, info, _ = patched_app
-    monkeypatch.setattr(yamp_app, "_stem_index", {"My Bare Title": info["id"]})
+    _use_index(monkeypatch, yamp_app._index.videos, {"My Bare Title": info["id"]})
     async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         resp = await client.post("/movies/library/metadata/matches", json={"filename": "My Bare Title.mp4"})
     assert resp.status_code == 200
@@ -1633,7 +1780,6 @@ async def test_api_fix_thumbnails_skips_items_without_content(patched_app, monke
     _, info, _ = patched_app
     monkeypatch.setattr(yamp_app, "PLEX_URL", "http://plex.invalid")
     monkeypatch.setattr(yamp_app, "PLEX_TOKEN", "tok")
-    monkeypatch.setattr(yamp_app, "_video_meta_cache", {})
     mock_item = MagicMock()
     mock_item.guid = f"{yamp_app.IDENTIFIER}://movie/{info['id']}"
     mock_section = MagicMock()
@@ -2297,10 +2443,13 @@ def test_get_channel_urls_deduplication(tmp_path, monkeypatch):
     }
     save_map(str(_map_path(tmp_path)), col_map)
 
-    monkeypatch.setattr(yamp_app, "_video_index", {vid: str(tmp_path / f"{vid}.info.json") for vid in ids})
     # meta cache provides the match fields so the function skips disk reads for filtering
     meta = {"tags": ["jazz"], "channel": "GoGo Penguin"}
-    monkeypatch.setattr(yamp_app, "_video_meta_cache", {vid: meta for vid in ids})
+    _use_index(
+        monkeypatch,
+        videos={vid: str(tmp_path / f"{vid}.info.json") for vid in ids},
+        meta={vid: meta for vid in ids},
+    )
     monkeypatch.setattr(yamp_app, "DATA_PATH", str(tmp_path))
 
     result = yamp_app._get_channel_urls_for_collection("Jazz")
@@ -2329,19 +2478,14 @@ def test_get_channel_urls_unicode_decode_error_skipped(tmp_path, monkeypatch):
     }
     save_map(str(_map_path(tmp_path)), col_map)
 
-    monkeypatch.setattr(
-        yamp_app,
-        "_video_index",
-        {
+    # Both IDs match via meta cache; the bad_id then fails on the disk read for uploader_url.
+    _use_index(
+        monkeypatch,
+        videos={
             valid_id: str(tmp_path / f"{valid_id}.info.json"),
             bad_id: str(tmp_path / f"{bad_id}.info.json"),
         },
-    )
-    # Both IDs match via meta cache; the bad_id then fails on the disk read for uploader_url.
-    monkeypatch.setattr(
-        yamp_app,
-        "_video_meta_cache",
-        {
+        meta={
             valid_id: {"tags": ["jazz"], "channel": "Valid"},
             bad_id: {"tags": ["jazz"], "channel": "Valid"},
         },
@@ -2657,7 +2801,7 @@ async def test_api_get_collections_oserror(patched_app, monkeypatch):
     def _raise_os_error(_path):
         raise OSError("permission denied")
 
-    monkeypatch.setattr(yamp_app, "load_map", _raise_os_error)
+    monkeypatch.setattr(yamp_app, "read_map_summary", _raise_os_error)
 
     async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         resp = await client.get("/api/collections")
@@ -2805,6 +2949,36 @@ def test_migrate_yamp_dir_rename_failure_no_crash(tmp_path, monkeypatch):
     assert (yamp_dir / MAPPING_FILE_NAME).exists()
 
 
+def test_migrate_to_sqlite_moves_map_and_snapshot(tmp_path, monkeypatch, title_fields):
+    """The JSON map and index snapshot move into the store; the snapshot is then loaded and saved there."""
+    from app import _load_index_snapshot, _migrate_to_sqlite, _save_index_snapshot, _snapshot_path
+    from collection_map import MAPPING_FILE_NAME, load_map
+    from index_snapshot import SnapshotEntry, save_snapshot
+
+    yamp_dir = tmp_path / ".yamp"
+    yamp_dir.mkdir()
+    map_path = yamp_dir / MAPPING_FILE_NAME
+    rules = [{"field": "title", "values": ["t"], "match": "in"}]
+    data = {"collections": [{"name": "T", "rules": rules}], "matched_ids": ["vid1234abcd"]}
+    map_path.write_text(json.dumps(data), encoding="utf-8")
+    entries = {str(tmp_path / "a.info.json"): SnapshotEntry("vid1234abcd", (1, 2), {"title": "T"})}
+    save_snapshot(_snapshot_path(str(tmp_path)), entries, title_fields)
+    monkeypatch.setattr(yamp_app, "DATA_PATH", str(tmp_path))
+    monkeypatch.setattr(yamp_app, "_YAMP_DIR", str(yamp_dir))
+
+    _migrate_to_sqlite()
+
+    assert (yamp_dir / "yamp.sqlite3").exists()
+    assert not map_path.exists()
+    assert not (yamp_dir / "index_snapshot.json").exists()
+    assert load_map(str(map_path))["matched_ids"] == ["vid1234abcd"]
+    assert _load_index_snapshot(str(tmp_path), title_fields) == entries
+
+    _save_index_snapshot(str(tmp_path), {}, title_fields)
+    assert _load_index_snapshot(str(tmp_path), title_fields) == {}
+    assert not (yamp_dir / "index_snapshot.json").exists()
+
+
 # ── GET /api/assets/{filename} ────────────────────────────────────────────────
 
 
@@ -3026,7 +3200,7 @@ async def test_api_assets_crop_corrupt_image(assets_dir):
 # ── _try_index_from_filename ──────────────────────────────────────────────────
 
 
-def test_try_index_from_filename_found(tmp_path, monkeypatch):
+async def test_try_index_from_filename_found(tmp_path, monkeypatch):
     """Sidecar .info.json inside DATA_PATH → returns True, indexed with meta cache."""
     from app import _try_index_from_filename
 
@@ -3034,38 +3208,31 @@ def test_try_index_from_filename_found(tmp_path, monkeypatch):
     info_path = tmp_path / "abc123.info.json"
     info_path.write_text(__import__("json").dumps(info), encoding="utf-8")
 
-    video_index: dict = {}
-    meta_cache: dict = {}
     monkeypatch.setattr(yamp_app, "DATA_PATH", str(tmp_path))
-    monkeypatch.setattr(yamp_app, "_video_index", video_index)
-    monkeypatch.setattr(yamp_app, "_video_meta_cache", meta_cache)
-    monkeypatch.setattr(yamp_app, "_stem_index", {})
+    _use_index(monkeypatch)
 
-    result = _try_index_from_filename("abc123", str(tmp_path / "abc123.mp4"))
+    result = await _try_index_from_filename("abc123", str(tmp_path / "abc123.mp4"))
 
     assert result is True
-    assert "abc123" in video_index
-    assert "abc123" in meta_cache
-    assert meta_cache["abc123"].get("tags") == ["jazz"]
+    assert "abc123" in yamp_app._index.videos
+    assert "abc123" in yamp_app._index.meta
+    assert yamp_app._index.meta["abc123"].get("tags") == ["jazz"]
 
 
-def test_try_index_from_filename_not_found(tmp_path, monkeypatch):
+async def test_try_index_from_filename_not_found(tmp_path, monkeypatch):
     """No sidecar → returns False, nothing added to index."""
     from app import _try_index_from_filename
 
-    video_index: dict = {}
     monkeypatch.setattr(yamp_app, "DATA_PATH", str(tmp_path))
-    monkeypatch.setattr(yamp_app, "_video_index", video_index)
-    monkeypatch.setattr(yamp_app, "_video_meta_cache", {})
-    monkeypatch.setattr(yamp_app, "_stem_index", {})
+    _use_index(monkeypatch)
 
-    result = _try_index_from_filename("nope", str(tmp_path / "nope.mp4"))
+    result = await _try_index_from_filename("nope", str(tmp_path / "nope.mp4"))
 
     assert result is False
-    assert "nope" not in video_index
+    assert "nope" not in yamp_app._index.videos
 
 
-def test_try_index_from_filename_outside_data_path(tmp_path, monkeypatch):
+async def test_try_index_from_filename_outside_data_path(tmp_path, monkeypatch):
     """Path outside DATA_PATH → rejected, returns False, nothing added to index."""
     from app import _try_index_from_filename
 
@@ -3076,54 +3243,96 @@ def test_try_index_from_filename_outside_data_path(tmp_path, monkeypatch):
     info_path = outside_dir / "evil.info.json"
     info_path.write_text('{"id": "evil"}', encoding="utf-8")
 
-    video_index: dict = {}
     monkeypatch.setattr(yamp_app, "DATA_PATH", str(data_dir))
-    monkeypatch.setattr(yamp_app, "_video_index", video_index)
-    monkeypatch.setattr(yamp_app, "_video_meta_cache", {})
-    monkeypatch.setattr(yamp_app, "_stem_index", {})
+    _use_index(monkeypatch)
 
-    result = _try_index_from_filename("evil", str(outside_dir / "evil.mp4"))
+    result = await _try_index_from_filename("evil", str(outside_dir / "evil.mp4"))
 
     assert result is False
-    assert "evil" not in video_index
+    assert "evil" not in yamp_app._index.videos
 
 
-def test_try_index_from_filename_corrupt_json(tmp_path, monkeypatch):
+async def test_try_index_from_filename_corrupt_json(tmp_path, monkeypatch):
     """Sidecar found but JSON corrupt → returns True (indexed), meta cache entry absent."""
     from app import _try_index_from_filename
 
     info_path = tmp_path / "corrupt123.info.json"
     info_path.write_text("not valid json {{{{", encoding="utf-8")
 
-    video_index: dict = {}
-    meta_cache: dict = {}
     monkeypatch.setattr(yamp_app, "DATA_PATH", str(tmp_path))
-    monkeypatch.setattr(yamp_app, "_video_index", video_index)
-    monkeypatch.setattr(yamp_app, "_video_meta_cache", meta_cache)
-    monkeypatch.setattr(yamp_app, "_stem_index", {})
+    _use_index(monkeypatch)
 
-    result = _try_index_from_filename("corrupt123", str(tmp_path / "corrupt123.mp4"))
+    result = await _try_index_from_filename("corrupt123", str(tmp_path / "corrupt123.mp4"))
 
     assert result is True
-    assert "corrupt123" in video_index
-    assert "corrupt123" not in meta_cache
+    assert "corrupt123" in yamp_app._index.videos
+    assert "corrupt123" not in yamp_app._index.meta
+
+
+async def test_try_index_from_filename_scans_media_dir_and_parent(tmp_path, monkeypatch):
+    """Sidecars named differently from the media file are found by listing its dir and parent."""
+    from app import _try_index_from_filename
+
+    video_dir = tmp_path / "Channel" / "Live Set [abcdefghijk]"
+    video_dir.mkdir(parents=True)
+    (video_dir / "Live Set.info.json").write_text(json.dumps({"id": "abcdefghijk", "title": "Live"}), encoding="utf-8")
+    (tmp_path / "Channel" / "Other [bbbbbbbbbbb].info.json").write_text('{"title": "Other"}', encoding="utf-8")
+    (tmp_path / "Elsewhere [ccccccccccc].info.json").write_text("{}", encoding="utf-8")
+
+    monkeypatch.setattr(yamp_app, "DATA_PATH", str(tmp_path))
+    _use_index(monkeypatch)
+    monkeypatch.setattr(yamp_app, "_snapshot_dirty", False)
+
+    assert await _try_index_from_filename("abcdefghijk", str(video_dir / "Live Set.f137.mp4")) is True
+    assert yamp_app._index.videos["abcdefghijk"] == str(video_dir / "Live Set.info.json")
+    assert "bbbbbbbbbbb" in yamp_app._index.videos  # parent directory indexed too
+    assert "ccccccccccc" not in yamp_app._index.videos  # no library walk
+
+
+async def test_try_index_from_filename_lists_directories_off_the_event_loop(tmp_path, monkeypatch):
+    """The listing and reading run in a worker thread so the match handler doesn't stall the loop."""
+    import threading
+
+    (tmp_path / "Live Set [abcdefghijk].info.json").write_text('{"title": "Live"}', encoding="utf-8")
+    monkeypatch.setattr(yamp_app, "DATA_PATH", str(tmp_path))
+    _use_index(monkeypatch)
+    threads = []
+    real = yamp_app._sidecars_near_media
+
+    def _record(*args):
+        threads.append(threading.current_thread())
+        return real(*args)
+
+    monkeypatch.setattr(yamp_app, "_sidecars_near_media", _record)
+
+    assert await yamp_app._try_index_from_filename("abcdefghijk", str(tmp_path / "Live Set.webm")) is True
+    assert threads and threads[0] is not threading.main_thread()
 
 
 # ── build_meta_cache ──────────────────────────────────────────────────────────
 
 
-def test_build_meta_cache_normal(tmp_path):
-    """Returns dict with only MATCH_FIELDS subset for each video."""
+@pytest.fixture
+def title_fields(monkeypatch):
+    """Project the meta cache as if a collection rule read titles."""
+    from collection_map import BASE_FIELDS
+
+    fields = BASE_FIELDS | {"title"}
+    monkeypatch.setattr(yamp_app, "_meta_fields", fields)
+    return fields
+
+
+def test_build_meta_cache_normal(tmp_path, title_fields):
+    """Returns dict with only the projected fields for each video."""
     import json as _json
 
     from app import build_meta_cache
-    from collection_map import MATCH_FIELDS
 
     info = {
         "id": "vid1",
         "title": "My Video",
         "tags": ["jazz"],
-        "upload_date": "20240101",  # not in MATCH_FIELDS — should be excluded
+        "upload_date": "20240101",  # not projected — should be excluded
         "thumbnail": "https://example.com/thumb.jpg",
     }
     path = tmp_path / "vid1.info.json"
@@ -3133,7 +3342,7 @@ def test_build_meta_cache_normal(tmp_path):
 
     assert "vid1" in cache
     for key in cache["vid1"]:
-        assert key in MATCH_FIELDS
+        assert key in title_fields
     assert "upload_date" not in cache["vid1"]
     assert cache["vid1"]["title"] == "My Video"
     assert cache["vid1"]["tags"] == ["jazz"]
@@ -3156,6 +3365,390 @@ def test_build_meta_cache_skips_corrupt_file(tmp_path):
     assert "bad" not in cache
 
 
+# ── refresh_meta_cache / index snapshot ───────────────────────────────────────
+
+
+def test_refresh_meta_cache_reuses_unchanged_entries(tmp_path):
+    """An unchanged sidecar is served from the snapshot without being re-read."""
+    from app import refresh_meta_cache
+    from index_snapshot import SnapshotEntry, file_fingerprint
+
+    path = tmp_path / "vid1.info.json"
+    path.write_text(json.dumps({"id": "vid1", "title": "On Disk"}), encoding="utf-8")
+    snapshot = {str(path): SnapshotEntry("vid1", file_fingerprint(str(path)), {"title": "From Snapshot"})}
+
+    cache, entries, reread = refresh_meta_cache({"vid1": str(path)}, snapshot)
+
+    assert reread == 0
+    assert cache["vid1"] == {"title": "From Snapshot"}
+    assert entries == snapshot
+
+
+def test_refresh_meta_cache_rereads_modified_entries(tmp_path, title_fields):
+    """A sidecar whose fingerprint changed is parsed again."""
+    from app import refresh_meta_cache
+    from index_snapshot import SnapshotEntry
+
+    path = tmp_path / "vid1.info.json"
+    path.write_text(json.dumps({"id": "vid1", "title": "On Disk"}), encoding="utf-8")
+    snapshot = {str(path): SnapshotEntry("vid1", (0, 0), {"title": "Stale"})}
+
+    cache, entries, reread = refresh_meta_cache({"vid1": str(path)}, snapshot)
+
+    assert reread == 1
+    assert cache["vid1"] == {"title": "On Disk"}
+    assert entries[str(path)].meta == {"title": "On Disk"}
+
+
+def test_refresh_meta_cache_records_corrupt_file(tmp_path):
+    """Corrupt JSON is kept in the snapshot with meta=None so it is not re-parsed next time."""
+    from app import refresh_meta_cache
+
+    path = tmp_path / "bad.info.json"
+    path.write_text("{{not json", encoding="utf-8")
+
+    cache, entries, _ = refresh_meta_cache({"bad": str(path)}, {})
+
+    assert "bad" not in cache
+    assert entries[str(path)].meta is None
+
+
+def test_rebuild_indexes_parses_sidecars_in_worker_processes(tmp_path, monkeypatch, title_fields):
+    """With META_WORKERS > 1, full batches go to the process pool and the rest are read inline."""
+    import app as yamp_app
+
+    monkeypatch.setattr(yamp_app, "META_WORKERS", 2)
+    monkeypatch.setattr(yamp_app._MetaLoader, "BATCH_SIZE", 2)
+    submitted = []
+    real_submit = yamp_app.ProcessPoolExecutor.submit
+
+    def _submit(self, fn, batch, *args):
+        submitted.extend(path for path, _ in batch)
+        return real_submit(self, fn, batch, *args)
+
+    monkeypatch.setattr(yamp_app.ProcessPoolExecutor, "submit", _submit)
+    for i in range(5):
+        d = tmp_path / f"ch{i % 2}"
+        d.mkdir(exist_ok=True)
+        (d / f"Video [vid{i:08d}].info.json").write_text(json.dumps({"title": f"T{i}"}), encoding="utf-8")
+
+    idx, _, cache, entries, _ = yamp_app._rebuild_indexes(str(tmp_path), {})
+
+    assert len(submitted) == 4
+    assert len(idx) == len(entries) == 5
+    assert cache == {f"vid{i:08d}": {"title": f"T{i}"} for i in range(5)}
+
+    # A pass over the unchanged library settles every sidecar by its stat and starts no pool.
+    (tmp_path / "ch0" / "Video [vid00000000].info.json").write_text(json.dumps({"title": "New"}), encoding="utf-8")
+    with patch.object(yamp_app, "ProcessPoolExecutor", side_effect=AssertionError("should not spawn")):
+        _, _, cache, _, _ = yamp_app._rebuild_indexes(str(tmp_path), entries)
+    assert cache["vid00000000"] == {"title": "New"}
+    assert cache["vid00000004"] == {"title": "T4"}
+
+
+def test_build_index_uses_snapshot_id_for_unchanged_file(tmp_path, monkeypatch):
+    """No-bracket filenames take their ID from the snapshot instead of re-parsing the JSON."""
+    from app import build_index
+    from index_snapshot import SnapshotEntry, file_fingerprint
+
+    path = tmp_path / "bare title.info.json"
+    path.write_text(json.dumps({"id": "bareID12345"}), encoding="utf-8")
+    snapshot = {str(path): SnapshotEntry("bareID12345", file_fingerprint(str(path)), {})}
+
+    def _no_open(*_args, **_kwargs):
+        raise AssertionError("sidecar should not be opened")
+
+    monkeypatch.setattr("builtins.open", _no_open)
+    index, stem_index = build_index(str(tmp_path), snapshot)
+
+    assert index == {"bareID12345": str(path)}
+    assert stem_index == {"bare title": "bareID12345"}
+
+
+def test_rebuild_indexes_writes_snapshot_for_warm_start(tmp_path, title_fields):
+    """A rebuild persists the snapshot; a second rebuild from it re-reads nothing."""
+    from app import _rebuild_indexes, _snapshot_path
+    from index_snapshot import load_snapshot
+
+    (tmp_path / ".yamp").mkdir()
+    (tmp_path / "Video [vid1234abcd].info.json").write_text(
+        json.dumps({"id": "vid1234abcd", "title": "T"}), encoding="utf-8"
+    )
+
+    idx, _, cache, entries, fields = _rebuild_indexes(str(tmp_path), {})
+    assert "vid1234abcd" in idx
+    assert cache["vid1234abcd"]["title"] == "T"
+    assert fields == title_fields
+
+    restored = load_snapshot(_snapshot_path(str(tmp_path)), title_fields)
+    assert restored == entries
+
+    with patch("app.json.load", side_effect=AssertionError("should not parse")):
+        _, _, warm_cache, _, _ = _rebuild_indexes(str(tmp_path), restored)
+    assert warm_cache == cache
+
+
+def test_rebuild_indexes_follows_meta_field_changes(tmp_path, monkeypatch, title_fields):
+    """New rule fields re-read every sidecar; dropped ones are cut from the snapshot without reading."""
+    from app import _rebuild_indexes
+
+    (tmp_path / ".yamp").mkdir()
+    (tmp_path / "Video [vid1234abcd].info.json").write_text(
+        json.dumps({"title": "T", "uploader_id": "@someone"}), encoding="utf-8"
+    )
+    _, _, _, entries, _ = _rebuild_indexes(str(tmp_path), {})
+
+    wider = title_fields | {"uploader_id"}
+    monkeypatch.setattr(yamp_app, "_meta_fields", wider)
+    _, _, cache, entries, fields = _rebuild_indexes(str(tmp_path), entries, None, None, title_fields)
+    assert fields == wider
+    assert cache["vid1234abcd"] == {"title": "T", "uploader_id": "@someone"}
+
+    monkeypatch.setattr(yamp_app, "_meta_fields", title_fields)
+    with patch("app.json.load", side_effect=AssertionError("should not parse")):
+        _, _, cache, _, fields = _rebuild_indexes(str(tmp_path), entries, None, None, wider)
+    assert fields == title_fields
+    assert cache["vid1234abcd"] == {"title": "T"}
+
+
+async def test_put_collections_extends_meta_cache_for_new_rule_fields(no_watcher, monkeypatch):
+    """A rule on an uncached field matches from disk right away, and the cache catches up in the background."""
+    from dataclasses import replace
+
+    from collection_map import BASE_FIELDS
+
+    _, info, tmp_path = no_watcher
+    monkeypatch.setattr(yamp_app, "_index", replace(yamp_app._index, meta_fields=BASE_FIELDS))
+    (tmp_path / f"{info['id']}.info.json").write_text(json.dumps({**info, "uploader_id": "@ggp"}), encoding="utf-8")
+    _map_path(tmp_path).write_text(json.dumps({"collections": []}), encoding="utf-8")
+    rule = {"field": "uploader_id", "match": "exact", "values": ["@ggp"]}
+
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.put("/api/collections", json={"collections": [{"name": "GGP", "rules": [rule]}]})
+    assert resp.status_code == 200
+    assert resp.json()["matched"] == 1
+    assert "uploader_id" in yamp_app._meta_fields
+
+    await yamp_app._reproject_meta_cache()
+    assert yamp_app._index.meta_fields == yamp_app._meta_fields
+    assert yamp_app._index.meta[info["id"]]["uploader_id"] == "@ggp"
+
+
+async def test_apply_map_edit_recomputes_collections_edited_on_disk(no_watcher, monkeypatch):
+    """A hand edit is diffed against the map in memory; only the collections it changed are recomputed."""
+    from collection_map import read_map
+
+    _, info, tmp_path = no_watcher
+    map_path = _map_path(tmp_path)
+    jazz = {"name": "Jazz", "rules": [{"field": "tags", "match": "exact", "values": ["jazz"]}]}
+    rock = {"name": "Rock", "rules": [{"field": "tags", "match": "exact", "values": ["rock"]}]}
+    map_path.write_text(json.dumps({"collections": [jazz, rock]}), encoding="utf-8")
+    read_map(str(map_path))
+    assert not await yamp_app._apply_map_edit()
+
+    rock["rules"][0]["values"] = ["live", "concert"]
+    map_path.write_text(json.dumps({"collections": [jazz, rock]}), encoding="utf-8")
+    recompute = MagicMock(return_value={"matched": 1, "unmatched": 0, "skipped": 0})
+    monkeypatch.setattr(yamp_app, "recompute_all_collections", recompute)
+    monkeypatch.setattr(yamp_app, "_prefetch_channel_art_bg", AsyncMock())
+
+    assert await yamp_app._apply_map_edit()
+    assert recompute.call_args.args[4] == {"Rock"}
+    assert not await yamp_app._apply_map_edit()
+
+
+async def test_apply_map_edit_rejects_duplicate_names_then_recomputes_everything(no_watcher, monkeypatch):
+    """Name-keyed diffs can't see an edit to one of two same-named collections: refuse, then match all again."""
+    from collection_map import read_map
+
+    _, _, tmp_path = no_watcher
+    map_path = _map_path(tmp_path)
+    first = {"name": "A", "rules": [{"field": "tags", "match": "exact", "values": ["x"]}]}
+    second = {"name": "A", "rules": [{"field": "tags", "match": "exact", "values": ["y"]}]}
+    map_path.write_text(json.dumps({"collections": [first, second]}), encoding="utf-8")
+    read_map(str(map_path))
+    recompute = MagicMock(return_value={"matched": 1, "unmatched": 0, "skipped": 0})
+    monkeypatch.setattr(yamp_app, "recompute_all_collections", recompute)
+    monkeypatch.setattr(yamp_app, "_prefetch_channel_art_bg", AsyncMock())
+
+    first["rules"][0]["values"] = ["zz"]
+    map_path.write_text(json.dumps({"collections": [first, second]}), encoding="utf-8")
+    assert not await yamp_app._apply_map_edit()
+    recompute.assert_not_called()
+
+    second["name"] = "B"
+    map_path.write_text(json.dumps({"collections": [first, second]}), encoding="utf-8")
+    assert await yamp_app._apply_map_edit()
+    assert recompute.call_args.args[4] is None
+
+
+# ── Sidecar watcher integration ───────────────────────────────────────────────
+
+
+@pytest.fixture
+def empty_index(tmp_path, monkeypatch, title_fields):
+    monkeypatch.setattr(yamp_app, "DATA_PATH", str(tmp_path))
+    _use_index(monkeypatch)
+    return tmp_path
+
+
+async def test_on_sidecar_changes_adds_video(empty_index):
+    folder = empty_index / "Live [abcdefghijk]"
+    folder.mkdir()
+    info = folder / "Live.info.json"
+    info.write_text(json.dumps({"id": "abcdefghijk", "title": "Live", "tags": ["jazz"]}), encoding="utf-8")
+
+    await yamp_app._on_sidecar_changes([("added", str(info))])
+
+    assert yamp_app._index.videos == {"abcdefghijk": str(info)}
+    assert yamp_app._index.stems == {"Live": "abcdefghijk"}
+    assert yamp_app._index.meta["abcdefghijk"]["tags"] == ["jazz"]
+    assert str(info) in yamp_app._index.entries
+
+
+async def test_on_sidecar_changes_modify_then_delete(empty_index):
+    info = empty_index / "Live [abcdefghijk].info.json"
+    info.write_text(json.dumps({"id": "abcdefghijk", "title": "Old"}), encoding="utf-8")
+    await yamp_app._on_sidecar_changes([("added", str(info))])
+
+    info.write_text(json.dumps({"id": "abcdefghijk", "title": "New"}), encoding="utf-8")
+    await yamp_app._on_sidecar_changes([("modified", str(info))])
+    assert yamp_app._index.meta["abcdefghijk"]["title"] == "New"
+
+    info.unlink()
+    await yamp_app._on_sidecar_changes([("deleted", str(info))])
+    assert yamp_app._index.videos == {}
+    assert yamp_app._index.stems == {}
+    assert yamp_app._index.meta == {}
+    assert yamp_app._index.entries == {}
+
+
+async def test_on_sidecar_changes_delete_of_untracked_path_keeps_other_entry(empty_index):
+    """Deleting a stale duplicate sidecar must not drop the path the index actually points at."""
+    kept = empty_index / "a" / "Live [abcdefghijk].info.json"
+    kept.parent.mkdir()
+    kept.write_text(json.dumps({"id": "abcdefghijk"}), encoding="utf-8")
+    await yamp_app._on_sidecar_changes([("added", str(kept))])
+
+    await yamp_app._on_sidecar_changes([("deleted", str(empty_index / "b" / "Live [abcdefghijk].info.json"))])
+
+    assert yamp_app._index.videos == {"abcdefghijk": str(kept)}
+
+
+async def test_get_info_json_rebuilds_on_a_miss_while_watcher_runs(patched_app, monkeypatch):
+    """The watcher can miss events, so an unknown ID still gets a duty-cycled rebuild."""
+    from collections import OrderedDict
+
+    index, _, _ = patched_app
+    running = MagicMock()
+    running.done.return_value = False
+    monkeypatch.setattr(yamp_app, "_watcher_task", running)
+    monkeypatch.setattr(yamp_app, "_reconciler", _fresh_reconciler())
+    monkeypatch.setattr(yamp_app, "_missing_ids", OrderedDict())
+    calls = []
+
+    def _rebuild(*_args):
+        calls.append(1)
+        return dict(index), {}, {}, {}
+
+    monkeypatch.setattr(yamp_app, "_rebuild_indexes", _rebuild)
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.get("/movies/library/metadata/missing0000")
+    assert resp.status_code == 404
+    assert calls == [1]
+
+
+def _fresh_reconciler():
+    """A reconciler with no pass run yet, so an index miss may rebuild straight away."""
+    from reconciler import Reconciler
+
+    return Reconciler(yamp_app._reconcile, yamp_app._install_indexes, 0, 60.0, 3600.0)
+
+
+@pytest.fixture
+def no_watcher(patched_app, monkeypatch):
+    """No sidecar watcher, no recent rebuild, and a clean negative-lookup cache."""
+    from collections import OrderedDict
+
+    monkeypatch.setattr(yamp_app, "_watcher_task", None)
+    monkeypatch.setattr(yamp_app, "_reconciler", _fresh_reconciler())
+    monkeypatch.setattr(yamp_app, "_missing_ids", OrderedDict())
+    monkeypatch.setattr(yamp_app, "_snapshot_dirty", False)
+    return patched_app
+
+
+async def test_get_info_json_coalesces_concurrent_rebuilds(no_watcher, monkeypatch):
+    """A burst of misses shares a single in-flight rebuild."""
+    index, _, _ = no_watcher
+    calls = []
+
+    def _slow_rebuild(*_args):
+        calls.append(1)
+        time.sleep(0.05)
+        return dict(index), {}, {}, {}
+
+    monkeypatch.setattr(yamp_app, "_rebuild_indexes", _slow_rebuild)
+    results = await asyncio.gather(
+        *(yamp_app._get_info_json(f"missing{i:04d}") for i in range(5)), return_exceptions=True
+    )
+
+    assert len(calls) == 1
+    assert all(isinstance(r, HTTPException) and r.status_code == 404 for r in results)
+
+
+async def test_get_info_json_remembers_missing_ids(no_watcher, monkeypatch):
+    """An ID a rebuild already missed is a plain 404 until the index changes."""
+    from index_snapshot import SnapshotEntry
+
+    index, _, _ = no_watcher
+    calls = []
+
+    def _rebuild(*_args):
+        calls.append(1)
+        return dict(index), {}, {}, {}
+
+    monkeypatch.setattr(yamp_app, "_rebuild_indexes", _rebuild)
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await yamp_app._get_info_json("missing0000")
+        yamp_app._reconciler.last_duration = 0.0  # the duty cycle is not what stops the rebuild
+    assert len(calls) == 1
+
+    new = str(no_watcher[2] / "new [newvideo001].info.json")
+    yamp_app._publish_changes([(new, SnapshotEntry("newvideo001", (1, 1), {}))])  # index changed
+    with pytest.raises(HTTPException):
+        await yamp_app._get_info_json("missing0000")
+    assert len(calls) == 2
+
+
+async def test_get_info_json_miss_respects_reconciler_duty_cycle(no_watcher, monkeypatch):
+    """Right after a slow pass, a new unknown ID does not trigger another rebuild."""
+    index, _, _ = no_watcher
+    calls = []
+
+    def _rebuild(*_args):
+        calls.append(1)
+        return dict(index), {}, {}, {}
+
+    monkeypatch.setattr(yamp_app, "_rebuild_indexes", _rebuild)
+    yamp_app._reconciler.record_pass(30.0, changed=False)  # a 30 s pass just finished
+    with pytest.raises(HTTPException):
+        await yamp_app._get_info_json("missing0000")
+    assert calls == []
+
+
+async def test_api_index_status_reports_reconciler(patched_app, monkeypatch):
+    monkeypatch.setattr(yamp_app, "_reconciler", _fresh_reconciler())
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.get("/api/index/status")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["indexed"] == len(yamp_app._index.videos)
+    assert body["generation"] == yamp_app._index.generation
+    assert body["reconciler"]["state"] == "idle"
+    assert body["reconciler"]["passes"] == 0
+
+
 # ── _download_image — size limit (413) ────────────────────────────────────────
 
 
@@ -1,15 +1,30 @@
 import json
+import logging
 import shutil
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 
 from collection_map import (
+    CompiledCollections,
+    RuleStats,
+    VideoPostings,
+    collection_membership,
+    compile_collections,
     diff_collections,
     find_collection_map,
+    flush_maps,
+    load_map,
     match_video,
+    read_collections,
+    read_map,
+    read_map_summary,
     recompute_all_collections,
     resolve_collections,
+    rule_stats_report,
+    take_map_edit,
+    write_map,
 )
 
 FIXTURES = Path(__file__).parent / "fixtures"
@@ -30,8 +45,8 @@ def _load_info() -> dict:
 
 
 def _load_map(map_path: str) -> dict:
-    with open(map_path, encoding="utf-8") as f:
-        return json.load(f)
+    """The map as written to disk: collection_map.json with its match state put back."""
+    return load_map(map_path)
 
 
 # ── Tag matching ──────────────────────────────────────────────────────────────
@@ -148,6 +163,119 @@ def test_unmatched_tags_sorted_by_frequency(tmp_path):
     assert tag_keys.index("ambient") < tag_keys.index("electronic")
 
 
+def test_resolve_collections_writes_behind_with_flush_delay(tmp_path):
+    """With a flush delay, new match state is served from memory and written in one batch by flush_maps."""
+    _, map_path = _fresh_map(tmp_path)
+    on_disk = _load_map(map_path)
+
+    for i in range(3):
+        info = _load_info()
+        info["id"] = f"new_video_{i}"
+        resolve_collections(info, map_path, None, 3600.0)
+
+    assert _load_map(map_path) == on_disk
+    assert read_map(map_path)["matched_ids"] == ["new_video_0", "new_video_1", "new_video_2"]
+    flush_maps()
+    assert _load_map(map_path) == read_map(map_path)
+
+
+def test_match_state_is_journaled_and_compacted(tmp_path, monkeypatch):
+    """The map file sheds its match state; new videos are journal appends, folded into the snapshot when long."""
+    import collection_map
+
+    _, map_path = _fresh_map(tmp_path)
+    yamp = tmp_path / ".yamp"
+    monkeypatch.setattr(collection_map, "_JOURNAL_COMPACT_RECORDS", 3)
+
+    for i in range(2):
+        info = _load_info()
+        info["id"] = f"new_video_{i}"
+        resolve_collections(info, map_path)
+
+    assert set(json.loads((yamp / "collection_map.json").read_text(encoding="utf-8"))) == {"collections"}
+    journal = (yamp / "match_state.journal").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in journal] == [["m", "new_video_0"], ["m", "new_video_1"]]
+    assert _load_map(map_path)["matched_ids"] == ["new_video_0", "new_video_1"]
+
+    info = _load_info()
+    info["id"] = "new_video_2"
+    resolve_collections(info, map_path)
+
+    assert not (yamp / "match_state.journal").exists()
+    state = json.loads((yamp / "match_state.json").read_text(encoding="utf-8"))
+    assert state["matched_ids"] == ["new_video_0", "new_video_1", "new_video_2"]
+
+
+def test_read_map_rereads_the_file_only_after_it_changed(tmp_path):
+    """An unchanged map is served from memory; a hand edit is picked up, keeping unflushed match state."""
+    _, map_path = _fresh_map(tmp_path)
+    read_map(map_path)
+    info = _load_info()
+    info["id"] = "new_video_0"
+    resolve_collections(info, map_path, None, 3600.0)
+
+    with patch("collection_map._read_map_files", side_effect=AssertionError("should not re-read")):
+        assert read_map(map_path)["matched_ids"] == ["new_video_0"]
+
+    edited = json.loads(Path(map_path).read_text(encoding="utf-8"))
+    edited["collections"] = edited["collections"][:1]
+    Path(map_path).write_text(json.dumps(edited) + "\n", encoding="utf-8")
+
+    data = read_map(map_path)
+    assert [c["name"] for c in data["collections"]] == ["GoGo Penguin"]
+    assert data["matched_ids"] == ["new_video_0"]
+    flush_maps()
+    assert _load_map(map_path)["matched_ids"] == ["new_video_0"]
+
+
+def test_take_map_edit_reports_hand_edits_once(tmp_path):
+    _, map_path = _fresh_map(tmp_path)
+    before = read_map(map_path)["collections"]
+    assert take_map_edit(map_path) is None
+
+    write_map(map_path, read_map(map_path))
+    assert take_map_edit(map_path) is None
+
+    Path(map_path).write_text(json.dumps({"collections": before[:1]}), encoding="utf-8")
+    assert take_map_edit(map_path) == (before, before[:1])
+    assert take_map_edit(map_path) is None
+
+
+def test_read_map_keeps_serving_memory_while_the_file_is_unreadable(tmp_path):
+    _, map_path = _fresh_map(tmp_path)
+    before = read_map(map_path)
+    Path(map_path).write_text("{not json", encoding="utf-8")
+    assert read_map(map_path) == before
+
+
+def test_read_only_accessors_do_not_copy_the_id_lists(tmp_path):
+    """Read-only callers get the collections and counts; the ID lists stay where they are."""
+    _, map_path = _fresh_map(tmp_path)
+    info = _load_info()
+    resolve_collections(info, map_path)
+
+    with patch("collection_map.copy.copy", side_effect=AssertionError("should not copy")):
+        collections = read_collections(map_path)
+        summary = read_map_summary(map_path)
+    assert collections is read_collections(map_path)
+    assert summary["collections"] is collections
+    assert summary["matched_count"] == 1
+    assert summary["unmatched_count"] == 0
+    assert summary["unmatched_tags"] == read_map(map_path)["unmatched_tags"]
+
+
+def test_load_map_skips_a_torn_journal_line(tmp_path):
+    """A record cut short by a crash mid-append is skipped; the ones before it still count."""
+    _, map_path = _fresh_map(tmp_path)
+    journal = tmp_path / ".yamp" / "match_state.journal"
+    journal.write_text('["u","vid00000001",["ambient"]]\n["m","vid0', encoding="utf-8")
+
+    data = load_map(map_path)
+
+    assert data["unmatched_ids"] == ["vid00000001"]
+    assert data["unmatched_tags"] == {"ambient": 1}
+
+
 # ── Deduplication ─────────────────────────────────────────────────────────────
 
 
@@ -190,7 +318,7 @@ def test_invalid_match_type_still_writes_unmatched_state(tmp_path):
     result = resolve_collections(info, str(map_path))
     assert result == []
 
-    saved = json.loads(map_path.read_text(encoding="utf-8"))
+    saved = load_map(str(map_path))
     assert info["id"] in saved["unmatched_ids"]
     assert info["id"] not in saved["matched_ids"]
 
@@ -246,6 +374,121 @@ def test_match_video_pure_does_not_mutate_info():
     assert info["tags"] == original_tags
 
 
+def test_match_video_tag_rules_consume_in_rule_order():
+    """Compiled rules keep rule order: a channel hit first leaves the tags unconsumed."""
+    info = {"tags": ["Jazz", "live"], "channel": "Penguin"}
+    collections = [
+        {"name": "A", "rules": [{"field": "channel", "match": "exact", "values": ["PENGUIN"]}]},
+        {
+            "name": "B",
+            "rules": [
+                {"field": "tags", "match": "in", "values": ["jaz"]},
+                {"field": "tags", "match": "exact", "values": ["live"]},
+            ],
+        },
+        {"name": "C", "rules": [{"field": "tags", "match": "exact", "values": ["jazz"]}]},
+    ]
+    matches, remaining = match_video(info, compile_collections(collections))
+    assert sorted(matches) == ["A", "B"]
+    assert remaining == {"live"}
+
+
+def test_compile_collections_reuses_compiled_form_for_same_content():
+    first = compile_collections(_collections())
+    assert compile_collections(_collections()) is first
+    assert compile_collections(first) is first
+    info = _load_info()
+    assert match_video(info, first) == match_video(info, _collections())
+
+
+def test_match_video_exact_rules_found_through_reverse_index():
+    """Exact rules across many collections match on tags, strings and lists alike."""
+    collections = [
+        {"name": f"Channel {i}", "rules": [{"field": "channel", "match": "exact", "values": [f"chan{i}"]}]}
+        for i in range(500)
+    ]
+    collections += [
+        {"name": "Jazz", "rules": [{"field": "tags", "match": "exact", "values": ["JAZZ"]}]},
+        {"name": "Music", "rules": [{"field": "categories", "match": "exact", "values": ["music"]}]},
+        {"name": "Jazz again", "rules": [{"field": "tags", "match": "exact", "values": ["jazz"]}]},
+    ]
+    compiled = compile_collections(collections)
+    info = {"tags": ["Jazz", "live"], "channel": "Chan42", "categories": ["Music"]}
+
+    matches, remaining = match_video(info, compiled)
+    assert sorted(matches) == ["Channel 42", "Jazz", "Music"]  # "jazz" was consumed by the first tag rule
+    assert remaining == {"live"}
+
+
+def test_match_video_in_rules_through_automaton():
+    """With enough `in` patterns a field gets an automaton; matching is unchanged."""
+    collections = [
+        {"name": f"Topic {i}", "rules": [{"field": "title", "match": "in", "values": [f"topic{i:04d}"]}]}
+        for i in range(300)
+    ]
+    collections.append({"name": "Live", "rules": [{"field": "tags", "match": "in", "values": ["LIVE"]}]})
+    info = {"tags": ["live at home", "jazz"], "title": "Notes on TOPIC0042 and topic0299"}
+
+    matches, remaining = match_video(info, compile_collections(collections))
+    assert sorted(matches) == ["Live", "Topic 299", "Topic 42"]
+    assert remaining == {"jazz"}
+
+
+def test_reorder_moves_cheap_rules_first_only_between_tag_rules():
+    """Non-tag rules are sorted by cost per hit; tag rules, which consume tags, stay put."""
+    rules = [
+        {"field": "description", "match": "in", "values": ["live"]},
+        {"field": "channel", "match": "exact", "values": ["Blue Note"]},
+        {"field": "tags", "match": "exact", "values": ["jazz"]},
+        {"field": "title", "match": "in", "values": ["trio"]},
+        {"field": "uploader", "match": "exact", "values": ["bn"]},
+    ]
+    collections = CompiledCollections([{"name": "Jazz", "rules": rules}])
+    ((_, written, _),) = collections.rules()
+    stats = RuleStats()
+    cost_and_hits = {
+        "description": (5000, 1),
+        "channel": (100, 50),
+        "tags": (1, 99),
+        "title": (900, 10),
+        "uploader": (50, 40),
+    }
+    for rule in written:
+        cost, hits = cost_and_hits[rule.field]
+        for i in range(100):
+            stats.record(rule.key, i < hits, cost)
+
+    collections.reorder(stats)
+
+    ((_, _, ordered),) = collections.rules()
+    assert [r.field for r in ordered] == ["channel", "description", "tags", "uploader", "title"]
+    info = {"tags": ["Jazz"], "description": "live at the club", "channel": "Blue Note"}
+    assert collections.match(info) == match_video(info, [{"name": "Jazz", "rules": rules}])
+
+
+def test_reorder_keeps_written_order_until_rules_have_enough_stats():
+    rules = [
+        {"field": "description", "match": "in", "values": ["live"]},
+        {"field": "channel", "match": "exact", "values": ["Blue Note"]},
+    ]
+    collections = CompiledCollections([{"name": "Jazz", "rules": rules}])
+    ((_, written, _),) = collections.rules()
+    stats = RuleStats()
+    stats.record(written[1].key, True, 1)
+
+    collections.reorder(stats)
+
+    assert [r.field for r in collections.rules()[0][2]] == ["description", "channel"]
+
+
+def test_match_video_bad_rule_values_raise_only_when_reached():
+    collections = [{"name": "Bad", "rules": [{"field": "channel", "match": "exact", "values": [1]}]}]
+    compiled = compile_collections(collections)
+    assert match_video({"tags": []}, compiled) == ([], set())
+    with pytest.raises(AttributeError):
+        match_video({"tags": [], "channel": "x"}, compiled)
+
+
 # ── recompute_all_collections ─────────────────────────────────────────────────
 
 
@@ -267,6 +510,405 @@ def test_recompute_all_collections_basic(tmp_path):
     assert info["id"] not in data["unmatched_ids"]
 
 
+def test_recompute_with_postings_matches_per_video_recompute(tmp_path):
+    """Posting-list recompute writes exactly what matching every video writes."""
+    _, map_path = _fresh_map(tmp_path)
+    info = _load_info()
+    meta_cache = {
+        info["id"]: {k: info[k] for k in ("tags", "title", "channel") if k in info},
+        "other000001": {"tags": ["Ambient", "live", "ambient"], "title": "Rain", "channel": "Nobody"},
+        "other000002": {"tags": ["live"], "title": "GoGo Penguin at home"},
+        "other000003": {"tags": [], "categories": ["Music", 7]},  # irregular: matched one by one
+    }
+    video_index = dict.fromkeys([*meta_cache, "uncached0001"], "/unused")
+
+    expected_stats = recompute_all_collections(video_index, map_path, meta_cache)
+    expected = _load_map(map_path)
+    stats = recompute_all_collections(video_index, map_path, meta_cache, VideoPostings(video_index, meta_cache))
+
+    assert stats == expected_stats
+    assert _load_map(map_path) == expected
+    assert list(expected["unmatched_tags"].items())[0] == ("ambient", 2)
+
+
+def test_recompute_with_postings_raises_on_unreadable_tags_like_per_video(tmp_path):
+    """A tag list match_video can't lower fails the recompute even when the video matches."""
+    map_path = str(tmp_path / "collection_map.json")
+    with open(map_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"collections": [{"name": "Live", "rules": [{"field": "title", "match": "in", "values": ["live"]}]}]}, f
+        )
+    meta_cache = {"vid00000001": {"tags": ["jazz", 7], "title": "Live at home"}}
+    video_index = dict.fromkeys(meta_cache, "/unused")
+
+    with pytest.raises(AttributeError):
+        recompute_all_collections(video_index, map_path, meta_cache)
+    with pytest.raises(AttributeError):
+        recompute_all_collections(video_index, map_path, meta_cache, VideoPostings(video_index, meta_cache))
+
+
+def test_recompute_reads_sidecars_for_fields_the_cache_lacks(tmp_path):
+    """A rule on a field the meta cache isn't projected to matches against the sidecar, not the cache."""
+    map_path = str(tmp_path / "collection_map.json")
+    rule = {"field": "uploader_id", "match": "exact", "values": ["@gogopenguin"]}
+    with open(map_path, "w", encoding="utf-8") as f:
+        json.dump({"collections": [{"name": "GGP", "rules": [rule]}]}, f)
+    sidecar = tmp_path / "vid00000001.info.json"
+    sidecar.write_text(json.dumps({"uploader_id": "@gogopenguin", "tags": []}), encoding="utf-8")
+    video_index = {"vid00000001": str(sidecar)}
+    meta_cache = {"vid00000001": {"tags": []}}
+    postings = VideoPostings(video_index, meta_cache, frozenset({"tags", "thumbnail"}))
+
+    assert collection_membership(compile_collections([{"name": "GGP", "rules": [rule]}]), postings) is None
+    stats = recompute_all_collections(video_index, map_path, meta_cache, postings)
+
+    assert stats["matched"] == 1
+    assert _load_map(map_path)["matched_ids"] == ["vid00000001"]
+
+
+def test_recompute_sharded_over_processes_matches_in_process(tmp_path, monkeypatch, caplog):
+    """Shards are merged in index order, so a parallel recompute writes what a serial one does."""
+    import collection_map
+
+    _, map_path = _fresh_map(tmp_path)
+    info = _load_info()
+    meta_cache = {
+        "other000001": {"tags": ["Ambient", "live"], "title": "Rain"},
+        info["id"]: {k: info[k] for k in ("tags", "title", "channel") if k in info},
+        "other000002": {"tags": ["live", "ambient"], "title": "Night", "description": "unused by the rules"},
+        "other000003": {"tags": ["Drone"], "title": "Hum"},
+    }
+    video_index = dict.fromkeys([*meta_cache, "uncached0001"], "/unused")
+
+    expected_stats = recompute_all_collections(video_index, map_path, meta_cache)
+    expected = _load_map(map_path)
+    monkeypatch.setattr(collection_map, "_SHARD_MIN_VIDEOS", 0)
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger="collection_map"):
+        stats = recompute_all_collections(video_index, map_path, meta_cache, None, None, 3)
+
+    assert stats == expected_stats
+    written = _load_map(map_path)
+    assert written == expected
+    assert list(written["unmatched_tags"].items()) == list(expected["unmatched_tags"].items())
+    assert "in 3 shard(s)" in caplog.text
+    assert "uncached0001 not in meta cache" in caplog.text
+
+
+def test_recompute_records_rule_stats(tmp_path):
+    import collection_map
+
+    _, map_path = _fresh_map(tmp_path)
+    info = _load_info()
+    meta_cache = {info["id"]: {k: info[k] for k in ("tags", "title", "channel") if k in info}}
+    video_index = dict.fromkeys(meta_cache, "/unused")
+    (_, written, _), *_ = compile_collections(_load_map(map_path)["collections"]).rules()
+    before = collection_map._rule_stats.get(written[0].key)[0]
+
+    recompute_all_collections(video_index, map_path, meta_cache)
+    recompute_all_collections(video_index, map_path, meta_cache, VideoPostings(video_index, meta_cache))
+
+    report = rule_stats_report(_load_map(map_path)["collections"])
+    assert collection_map._rule_stats.get(written[0].key)[0] == before + 2
+    assert report[0]["rules"][0]["evaluations"] == before + 2
+
+
+def test_recompute_merges_rule_stats_under_their_lock(tmp_path, monkeypatch):
+    """Recomputes of different maps run on worker threads at once; the shared stats only change under the lock."""
+    import collection_map
+
+    _, map_path = _fresh_map(tmp_path)
+    info = _load_info()
+    meta_cache = {info["id"]: {k: info[k] for k in ("tags", "title", "channel") if k in info}}
+    video_index = dict.fromkeys(meta_cache, "/unused")
+    shared = collection_map._rule_stats
+    real_record, real_merge = RuleStats.record, RuleStats.merge
+
+    def _record(self, *args):
+        assert self is not shared, "measurements go to a RuleStats of their own"
+        real_record(self, *args)
+
+    def _merge(self, other):
+        assert self is not shared or collection_map._RULE_STATS_LOCK.locked()
+        real_merge(self, other)
+
+    monkeypatch.setattr(RuleStats, "record", _record)
+    monkeypatch.setattr(RuleStats, "merge", _merge)
+    recompute_all_collections(video_index, map_path, meta_cache)
+    recompute_all_collections(video_index, map_path, meta_cache, VideoPostings(video_index, meta_cache))
+
+
+def test_recompute_with_rules_changed_only_reevaluates_those_collections(tmp_path, monkeypatch):
+    """An edit re-evaluates the named collections and updates the lists by delta."""
+    import collection_map
+
+    map_path = str(tmp_path / "collection_map.json")
+    collections = [
+        {"name": "Jazz", "rules": [{"field": "tags", "match": "exact", "values": ["jazz"]}]},
+        {"name": "Rock", "rules": [{"field": "tags", "match": "exact", "values": ["rock"]}]},
+    ]
+    meta_cache = {
+        "vid00000001": {"tags": ["jazz", "live"]},
+        "vid00000002": {"tags": ["rock", "live"]},
+        "vid00000003": {"tags": ["pop"]},
+    }
+    video_index = dict.fromkeys(meta_cache, "/unused")
+    postings = VideoPostings(video_index, meta_cache)
+    with open(map_path, "w", encoding="utf-8") as f:
+        json.dump({"collections": collections}, f)
+    recompute_all_collections(video_index, map_path, meta_cache, postings)
+
+    edited = [collections[0], {"name": "Rock", "rules": [{"field": "tags", "match": "exact", "values": ["pop"]}]}]
+    data = read_map(map_path)
+    data["collections"] = edited
+    write_map(map_path, data)
+    evaluated = []
+    original = collection_map.CompiledCollections.collection_hits
+
+    def _spy(self, postings, names=None):
+        evaluated.append(names)
+        return original(self, postings, names)
+
+    monkeypatch.setattr(collection_map.CompiledCollections, "collection_hits", _spy)
+    stats = recompute_all_collections(video_index, map_path, meta_cache, postings, {"Rock"})
+
+    assert evaluated == [{"Rock"}]
+    assert stats == {"matched": 2, "unmatched": 1, "skipped": 0}
+    data = _load_map(map_path)
+    assert data["matched_ids"] == ["vid00000001", "vid00000003"]
+    assert data["unmatched_ids"] == ["vid00000002"]
+    assert data["unmatched_tags"] == {"rock": 1, "live": 1}
+
+
+def test_incremental_and_full_recompute_order_tied_tags_alike(tmp_path):
+    """Tags with equal counts are ordered by name, whichever path counted them."""
+    meta_cache = {"vid00000001": {"tags": ["zz", "beta"]}, "vid00000002": {"tags": ["alpha"]}}
+    video_index = dict.fromkeys(meta_cache, "/unused")
+    postings = VideoPostings(video_index, meta_cache)
+    before = [{"name": "Z", "rules": [{"field": "tags", "match": "exact", "values": ["zz"]}]}]
+    after = [{"name": "Z", "rules": [{"field": "tags", "match": "exact", "values": ["none"]}]}]
+
+    incremental = str(tmp_path / "incremental.json")
+    write_map(incremental, {"collections": before})
+    recompute_all_collections(video_index, incremental, meta_cache, postings)
+    write_map(incremental, {**read_map(incremental), "collections": after})
+    recompute_all_collections(video_index, incremental, meta_cache, postings, {"Z"})
+
+    full = str(tmp_path / "full.json")
+    write_map(full, {"collections": after})
+    recompute_all_collections(video_index, full, meta_cache, postings)
+
+    expected = [("alpha", 1), ("beta", 1), ("zz", 1)]
+    assert list(_load_map(incremental)["unmatched_tags"].items()) == expected
+    assert list(_load_map(full)["unmatched_tags"].items()) == expected
+
+
+def test_recompute_with_duplicate_names_matches_everything_again(tmp_path):
+    """Hits are kept by name, so an edit to one of two same-named collections can't be applied as a delta."""
+    map_path = str(tmp_path / "collection_map.json")
+    x = {"name": "A", "rules": [{"field": "tags", "match": "exact", "values": ["x"]}]}
+    y = {"name": "A", "rules": [{"field": "tags", "match": "exact", "values": ["y"]}]}
+    meta_cache = {"vid00000001": {"tags": ["x"]}, "vid00000002": {"tags": ["y"]}}
+    video_index = dict.fromkeys(meta_cache, "/unused")
+    postings = VideoPostings(video_index, meta_cache)
+    write_map(map_path, {"collections": [x, y]})
+    recompute_all_collections(video_index, map_path, meta_cache, postings)
+
+    data = read_map(map_path)
+    data["collections"] = [{"name": "A", "rules": [{"field": "tags", "match": "exact", "values": ["z"]}]}, y]
+    write_map(map_path, data)
+    recompute_all_collections(video_index, map_path, meta_cache, postings, {"A"})
+
+    assert _load_map(map_path)["matched_ids"] == ["vid00000002"]
+
+
+def test_recompute_matches_without_the_map_lock_and_keeps_videos_tracked_meanwhile(tmp_path, monkeypatch):
+    """resolve_collections answers during a recompute's matching, and what it tracks is not written over."""
+    import collection_map
+
+    map_path = str(tmp_path / "collection_map.json")
+    jazz = {"name": "Jazz", "rules": [{"field": "tags", "match": "exact", "values": ["jazz"]}]}
+    write_map(map_path, {"collections": [jazz]})
+    meta_cache = {"vid00000001": {"tags": ["jazz"]}, "vid00000002": {"tags": ["pop"]}}
+    video_index = dict.fromkeys(meta_cache, "/unused")
+    postings = VideoPostings(video_index, meta_cache)
+    original = collection_map.CompiledCollections.collection_hits
+
+    def _resolve_meanwhile(self, postings, names=None):
+        assert not collection_map._MAP_LOCK.locked()
+        assert resolve_collections({"id": "vid00000003", "tags": ["drone"]}, map_path) == []
+        return original(self, postings, names)
+
+    monkeypatch.setattr(collection_map.CompiledCollections, "collection_hits", _resolve_meanwhile)
+    stats = recompute_all_collections(video_index, map_path, meta_cache, postings)
+
+    assert stats == {"matched": 1, "unmatched": 2, "skipped": 0}
+    data = _load_map(map_path)
+    assert data["matched_ids"] == ["vid00000001"]
+    assert data["unmatched_ids"] == ["vid00000002", "vid00000003"]
+    assert data["unmatched_tags"] == {"pop": 1, "drone": 1}
+
+
+def test_recompute_matches_again_when_the_collections_change_meanwhile(tmp_path, monkeypatch):
+    """A result matched against collections that were replaced while matching is not written."""
+    import collection_map
+
+    map_path = str(tmp_path / "collection_map.json")
+    jazz = {"name": "Jazz", "rules": [{"field": "tags", "match": "exact", "values": ["jazz"]}]}
+    pop = {"name": "Pop", "rules": [{"field": "tags", "match": "exact", "values": ["pop"]}]}
+    write_map(map_path, {"collections": [jazz]})
+    meta_cache = {"vid00000001": {"tags": ["jazz"]}, "vid00000002": {"tags": ["pop"]}}
+    video_index = dict.fromkeys(meta_cache, "/unused")
+    postings = VideoPostings(video_index, meta_cache)
+    original = collection_map.CompiledCollections.collection_hits
+    runs = []
+
+    def _edit_meanwhile(self, postings, names=None):
+        runs.append(self.names())
+        if len(runs) == 1:
+            write_map(map_path, {**read_map(map_path), "collections": [jazz, pop]})
+        return original(self, postings, names)
+
+    monkeypatch.setattr(collection_map.CompiledCollections, "collection_hits", _edit_meanwhile)
+    stats = recompute_all_collections(video_index, map_path, meta_cache, postings)
+
+    assert runs == [{"Jazz"}, {"Jazz", "Pop"}]
+    assert stats == {"matched": 2, "unmatched": 0, "skipped": 0}
+    assert _load_map(map_path)["matched_ids"] == ["vid00000001", "vid00000002"]
+
+
+def test_tracking_a_new_video_drops_the_hit_state_of_the_map(tmp_path):
+    """A video tracked between recomputes forces the next one to start from scratch, not a stale delta."""
+    map_path = str(tmp_path / "collection_map.json")
+    jazz = {"name": "Jazz", "rules": [{"field": "tags", "match": "exact", "values": ["jazz"]}]}
+    meta_cache = {"vid00000001": {"tags": ["jazz"]}, "vid00000002": {"tags": ["rock"]}}
+    video_index = dict.fromkeys(meta_cache, "/unused")
+    postings = VideoPostings(video_index, meta_cache)
+    write_map(map_path, {"collections": [jazz]})
+    recompute_all_collections(video_index, map_path, meta_cache, postings)
+
+    resolve_collections({"id": "vid00000003", "tags": ["jazz"]}, map_path, postings)
+    assert read_map(map_path)["matched_ids"] == ["vid00000001", "vid00000003"]
+    pop = {"name": "Pop", "rules": [{"field": "tags", "match": "exact", "values": ["pop"]}]}
+    data = read_map(map_path)
+    data["collections"] = [jazz, pop]
+    write_map(map_path, data)
+    recompute_all_collections(video_index, map_path, meta_cache, postings, {"Pop"})
+
+    data = _load_map(map_path)
+    assert data["matched_ids"] == ["vid00000001"]
+    assert data["unmatched_ids"] == ["vid00000002"]
+
+
+def test_journal_replay_sorts_unmatched_tags_once(tmp_path):
+    _, map_path = _fresh_map(tmp_path)
+    journal = tmp_path / ".yamp" / "match_state.journal"
+    journal.write_text(
+        '["u","vid00000001",["ambient"]]\n["u","vid00000002",["drone","noise"]]\n["u","vid00000003",["noise"]]\n',
+        encoding="utf-8",
+    )
+
+    assert list(load_map(map_path)["unmatched_tags"].items()) == [("noise", 2), ("ambient", 1), ("drone", 1)]
+
+
+def test_collection_membership_matches_match_video_per_video():
+    """Materialized membership agrees with match_video, tag consumption included."""
+    collections = compile_collections(
+        [
+            {"name": "Live", "rules": [{"field": "tags", "match": "in", "values": ["live"]}]},
+            {"name": "Live Jazz", "rules": [{"field": "tags", "match": "exact", "values": ["live jazz"]}]},
+            {"name": "Penguin", "rules": [{"field": "channel", "match": "exact", "values": ["GoGo Penguin"]}]},
+        ]
+    )
+    meta_cache = {
+        "vid00000001": {"tags": ["Live Jazz"], "channel": "GoGo Penguin"},  # "Live" consumes the tag
+        "vid00000002": {"tags": ["live jazz"]},
+        "vid00000003": {"tags": ["studio"], "channel": "gogo penguin"},
+        "vid00000004": {"tags": ["ambient"]},
+    }
+    postings = VideoPostings(dict.fromkeys(meta_cache, "/unused"), meta_cache)
+
+    membership = collection_membership(collections, postings)
+    for video_id, meta in meta_cache.items():
+        assert sorted(membership.of(video_id)) == sorted(match_video(meta, collections)[0])
+    assert membership.members("Live") == ["vid00000001", "vid00000002"]
+    assert membership.members("Live Jazz") == []
+    assert membership.of("unknown0001") is None
+    assert collection_membership(collections, postings) is membership
+
+
+def test_collection_membership_builds_without_holding_the_map_lock(tmp_path, monkeypatch):
+    """resolve_collections shares the map lock, so the O(library) build runs after releasing it."""
+    import collection_map
+
+    _, map_path = _fresh_map(tmp_path)
+    info = _load_info()
+    meta_cache = {info["id"]: {k: info[k] for k in ("tags", "title", "channel") if k in info}}
+    video_index = {info["id"]: "/unused"}
+    postings = VideoPostings(video_index, meta_cache)
+    real_init = collection_map.CollectionMembership.__init__
+    built = []
+
+    def _init(self, *args):
+        assert not collection_map._MAP_LOCK.locked()
+        built.append(True)
+        real_init(self, *args)
+
+    monkeypatch.setattr(collection_map.CollectionMembership, "__init__", _init)
+    recompute_all_collections(video_index, map_path, meta_cache, postings)
+    assert built
+    membership = collection_membership(compile_collections(_load_map(map_path)["collections"]), postings)
+    assert "GoGo Penguin" in membership.of(info["id"])
+
+
+def test_resolve_collections_uses_materialized_membership(tmp_path, monkeypatch):
+    """Once materialized, a tracked video's collections are a lookup, not a rematch."""
+    import collection_map
+
+    _, map_path = _fresh_map(tmp_path)
+    info = _load_info()
+    meta_cache = {info["id"]: {k: info[k] for k in ("tags", "title", "channel") if k in info}}
+    video_index = {info["id"]: "/unused"}
+    postings = VideoPostings(video_index, meta_cache)
+    recompute_all_collections(video_index, map_path, meta_cache, postings)
+    collection_membership(compile_collections(_load_map(map_path)["collections"]), postings)
+
+    def _no_match(*_args):
+        raise AssertionError("should not rematch")
+
+    monkeypatch.setattr(collection_map.CompiledCollections, "match", _no_match)
+    assert "GoGo Penguin" in resolve_collections(info, map_path, postings)
+
+
+def test_resolve_collections_after_recompute_does_not_rematch(tmp_path, monkeypatch):
+    """The recompute leaves the membership materialized, so the first lookup is already cheap."""
+    import collection_map
+
+    _, map_path = _fresh_map(tmp_path)
+    info = _load_info()
+    meta_cache = {info["id"]: {k: info[k] for k in ("tags", "title", "channel") if k in info}}
+    video_index = {info["id"]: "/unused"}
+    postings = VideoPostings(video_index, meta_cache)
+    recompute_all_collections(video_index, map_path, meta_cache, postings)
+
+    def _no_match(*_args):
+        raise AssertionError("should not rematch")
+
+    monkeypatch.setattr(collection_map, "match_video", _no_match)
+    monkeypatch.setattr(collection_map.CompiledCollections, "collection_hits", _no_match)
+    assert "GoGo Penguin" in resolve_collections(info, map_path, postings)
+
+
+def test_video_postings_containing_searches_the_vocabulary():
+    postings = VideoPostings(
+        {"a": "", "b": "", "c": ""},
+        {"a": {"title": "Live at Home"}, "b": {"title": "home again"}, "c": {"title": "Studio"}},
+    )
+    assert sorted(postings.containing("title", "home")) == [[0], [1]]
+    assert postings.containing("title", "xyz") == []
+    assert len(postings.containing("title", "")) == 3
+
+
 def test_recompute_clears_stale_state(tmp_path):
     _, map_path = _fresh_map(tmp_path)
     info = _load_info()
@@ -331,8 +973,7 @@ def test_recompute_newly_matched_tag_removed_from_unmatched(tmp_path):
 
     # Restore collections and recompute — video should now be matched
     data["collections"] = _collections()
-    with open(map_path, "w", encoding="utf-8") as f:
-        json.dump(data, f)
+    write_map(map_path, data)
 
     recompute_all_collections({info["id"]: str(info_path)}, map_path)
     data = _load_map(map_path)
@@ -368,6 +1009,23 @@ def test_find_collection_map_not_found(tmp_path):
     assert found is None
 
 
+def test_find_collection_map_remembers_the_map_while_it_exists(tmp_path):
+    """A found map is returned without walking again; once it is gone the walk finds the next one."""
+    inner = tmp_path / "channel" / ".yamp"
+    inner.mkdir(parents=True)
+    (inner / "collection_map.json").write_text("{}", encoding="utf-8")
+    (tmp_path / ".yamp").mkdir()
+    (tmp_path / ".yamp" / "collection_map.json").write_text("{}", encoding="utf-8")
+    start = str(tmp_path / "channel")
+
+    assert find_collection_map(start, str(tmp_path)) == str(inner / "collection_map.json")
+    with patch("collection_map.Path.resolve", side_effect=AssertionError("should not walk")):
+        assert find_collection_map(start, str(tmp_path)) == str(inner / "collection_map.json")
+
+    (inner / "collection_map.json").unlink()
+    assert find_collection_map(start, str(tmp_path)) == str(tmp_path / ".yamp" / "collection_map.json")
+
+
 # ── match_video edge cases ────────────────────────────────────────────────────
 
 
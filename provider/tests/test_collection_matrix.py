@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import collection_map  # noqa: E402
+from collection_map import VideoPostings, compile_collections, load_map, recompute_all_collections  # noqa: E402
+from collection_matrix import IncidenceMatrix  # noqa: E402
+
+COLLECTIONS = [
+    {"name": "Jazz", "rules": [{"field": "tags", "match": "exact", "values": ["jazz"]}]},
+    {"name": "Live", "rules": [{"field": "title", "match": "in", "values": ["live"]}]},
+    {"name": "Rock", "rules": [{"field": "channel", "match": "exact", "values": ["Rock Channel"]}]},
+]
+
+META = {
+    "vid00000001": {"tags": ["Jazz", "piano"], "title": "Trio", "channel": "Blue"},
+    "vid00000002": {"tags": ["piano", "Rain", "rain"], "title": "Rain", "channel": "Grey"},
+    "vid00000003": {"tags": ["ambient", "rain"], "title": "Live at home", "channel": "Rock Channel"},
+    "vid00000004": {"tags": ["ambient", "piano", "sleep"], "title": "Night"},
+    "vid00000005": {"tags": "Sleep", "title": "Quiet"},
+    "vid00000006": {"title": "No tags", "channel": "rock channel"},
+}
+
+
+def test_hits_and_coverage_match_posting_sets():
+    postings = VideoPostings(dict.fromkeys(META, "/unused"), META)
+    collections = compile_collections(COLLECTIONS)
+    hits, coverage = IncidenceMatrix(postings).hits(collections.collection_terms(postings))
+
+    expected = collections.collection_hits(postings)
+    assert {name: set(ordinals.tolist()) for name, ordinals in hits.items()} == expected
+    assert coverage.tolist() == [sum(o in s for s in expected.values()) for o in range(len(postings.ids))]
+
+
+def test_unmatched_tags_keep_counter_order():
+    """Counts include repeated tags; ties keep first-occurrence order, as the per-video Counter does."""
+    postings = VideoPostings(dict.fromkeys(META, "/unused"), META)
+    matrix = IncidenceMatrix(postings)
+    coverage = matrix.hits(compile_collections(COLLECTIONS).collection_terms(postings))[1]
+
+    counts = matrix.unmatched_tags(coverage)
+    # Unmatched: vid00000002, vid00000004 and vid00000005, whose string tag counts per character.
+    assert list(counts.items()) == [
+        ("piano", 2),
+        ("rain", 2),
+        ("e", 2),
+        ("ambient", 1),
+        ("sleep", 1),
+        ("s", 1),
+        ("l", 1),
+        ("p", 1),
+    ]
+
+
+def test_recompute_through_matrix_matches_per_video_recompute(tmp_path, monkeypatch):
+    monkeypatch.setattr(collection_map, "_MATRIX_MIN_VIDEOS", 0)
+    built = []
+    monkeypatch.setattr(collection_map, "incidence_matrix", lambda p: built.append(p) or IncidenceMatrix(p))
+    map_path = str(tmp_path / "collection_map.json")
+    with open(map_path, "w", encoding="utf-8") as f:
+        json.dump({"collections": COLLECTIONS}, f)
+    video_index = dict.fromkeys([*META, "uncached0001"], "/unused")
+
+    expected_stats = recompute_all_collections(video_index, map_path, META)
+    expected = load_map(map_path)
+    postings = VideoPostings(video_index, META)
+    stats = recompute_all_collections(video_index, map_path, META, postings)
+
+    assert built == [postings]
+    assert stats == expected_stats
+    written = load_map(map_path)
+    assert written == expected
+    assert list(written["unmatched_tags"].items()) == list(expected["unmatched_tags"].items())
@@ -0,0 +1,93 @@
+import json
+
+from index_snapshot import (
+    SNAPSHOT_VERSION,
+    SnapshotEntry,
+    file_fingerprint,
+    fingerprint_and_project,
+    load_snapshot,
+    save_snapshot,
+)
+
+FIELDS = frozenset({"tags", "title"})
+
+
+def _entries(tmp_path) -> dict[str, SnapshotEntry]:
+    return {
+        str(tmp_path / "a.info.json"): SnapshotEntry("aaaaaaaaaaa", (123, 45), {"title": "A", "tags": ["x"]}),
+        str(tmp_path / "b.info.json"): SnapshotEntry("bbbbbbbbbbb", (678, 9), None),
+    }
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    path = str(tmp_path / "snap.json")
+    entries = _entries(tmp_path)
+    save_snapshot(path, entries, FIELDS)
+    assert load_snapshot(path, FIELDS) == entries
+
+
+def test_load_missing_returns_empty(tmp_path):
+    assert load_snapshot(str(tmp_path / "missing.json"), FIELDS) == {}
+
+
+def test_load_corrupt_returns_empty(tmp_path):
+    path = tmp_path / "snap.json"
+    path.write_text("{not json", encoding="utf-8")
+    assert load_snapshot(str(path), FIELDS) == {}
+
+
+def test_load_version_mismatch_returns_empty(tmp_path):
+    path = tmp_path / "snap.json"
+    path.write_text(json.dumps({"version": SNAPSHOT_VERSION + 1, "fields": sorted(FIELDS), "entries": {}}))
+    assert load_snapshot(str(path), FIELDS) == {}
+
+
+def test_load_fields_mismatch_returns_empty(tmp_path):
+    """A snapshot projected with different fields would serve incomplete meta — discard it."""
+    path = str(tmp_path / "snap.json")
+    save_snapshot(path, _entries(tmp_path), FIELDS)
+    assert load_snapshot(path, FIELDS | {"description"}) == {}
+
+
+def test_load_fields_superset_is_projected(tmp_path):
+    """A snapshot holding more fields than needed still warms the start, cut down to the fields asked for."""
+    path = str(tmp_path / "snap.json")
+    save_snapshot(path, _entries(tmp_path), FIELDS)
+    restored = load_snapshot(path, frozenset({"tags"}))
+    assert restored[str(tmp_path / "a.info.json")].meta == {"tags": ["x"]}
+    assert restored[str(tmp_path / "b.info.json")].meta is None
+
+
+def test_load_malformed_entry_returns_empty(tmp_path):
+    path = tmp_path / "snap.json"
+    data = {"version": SNAPSHOT_VERSION, "fields": sorted(FIELDS), "entries": {"/x.info.json": ["id"]}}
+    path.write_text(json.dumps(data), encoding="utf-8")
+    assert load_snapshot(str(path), FIELDS) == {}
+
+
+def test_file_fingerprint_changes_with_content(tmp_path):
+    path = tmp_path / "a.info.json"
+    path.write_text("{}", encoding="utf-8")
+    before = file_fingerprint(str(path))
+    path.write_text('{"title": "longer"}', encoding="utf-8")
+    assert file_fingerprint(str(path)) != before
+    assert file_fingerprint(str(tmp_path / "missing")) is None
+
+
+def test_fingerprint_and_project_statuses(tmp_path):
+    good = tmp_path / "good.info.json"
+    good.write_text(json.dumps({"title": "T", "tags": ["x"], "description": "dropped"}), encoding="utf-8")
+    bad = tmp_path / "bad.info.json"
+    bad.write_text("[1, 2]", encoding="utf-8")
+    same = tmp_path / "same.info.json"
+    same.write_text("{}", encoding="utf-8")
+    missing = str(tmp_path / "missing.info.json")
+
+    results = fingerprint_and_project(
+        [(str(good), None), (str(bad), None), (str(same), file_fingerprint(str(same))), (missing, None)], FIELDS
+    )
+
+    assert [r[2] for r in results] == ["read", "corrupt", "unchanged", "missing"]
+    assert results[0][3] == {"title": "T", "tags": ["x"]}
+    assert results[0][1] == file_fingerprint(str(good))
+    assert results[3][1] is None
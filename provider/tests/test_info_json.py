@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import info_json
+from info_json import load_fields, project
+
+DOC = {
+    "id": "abcdefghijk",
+    "title": 'Title with "quotes", [brackets] and é',
+    "formats": [{"url": "https://x/a?b=[1]", "fragments": [{"duration": 5.0}], "acodec": None}],
+    "duration": 634,
+    "is_live": False,
+    "tags": ["a", "b"],
+    "empty": {},
+    "upload_date": "20240101",
+}
+
+
+@pytest.mark.parametrize("separators", [(",", ":"), (", ", ": ")])
+def test_project_matches_full_parse(separators):
+    text = json.dumps(DOC, separators=separators, indent=None)
+    fields = {"title", "tags", "upload_date", "duration", "missing"}
+    assert project(text, fields) == {k: DOC[k] for k in fields if k in DOC}
+
+
+def test_project_indented_and_escaped():
+    text = json.dumps(DOC, indent=2, ensure_ascii=True)
+    assert project(text, {"title", "is_live", "empty"}) == {"title": DOC["title"], "is_live": False, "empty": {}}
+
+
+def test_project_rejects_malformed_input():
+    with pytest.raises(json.JSONDecodeError):
+        project('{"id": "x", "formats": [1, 2', {"upload_date"})
+    with pytest.raises(json.JSONDecodeError):
+        project("[1, 2]", {"id"})
+
+
+def test_load_fields_stops_after_head(tmp_path, monkeypatch):
+    """Keys near the front are returned from the head without reading the rest of the file."""
+    monkeypatch.setattr(info_json, "_HEAD_CHARS", 64)
+    path = tmp_path / "v.info.json"
+    # The body past the head is not parsed: only the closing brace is checked.
+    path.write_text('{"id": "abcdefghijk", "formats": [' + "x" * 1000 + "]}\n", encoding="utf-8")
+
+    assert load_fields(str(path), ("id",)) == {"id": "abcdefghijk"}
+
+
+@pytest.mark.parametrize("head_chars", [16, 64 * 1024])
+def test_load_fields_rejects_a_truncated_file(tmp_path, monkeypatch, head_chars):
+    """A sidecar cut off mid-write raises like json.load, even when the wanted keys come first."""
+    monkeypatch.setattr(info_json, "_HEAD_CHARS", head_chars)
+    path = tmp_path / "v.info.json"
+    path.write_text('{"id": "abc", "title": "t", "formats": [1,2,' + " 3," * 20, encoding="utf-8")
+
+    with pytest.raises(json.JSONDecodeError):
+        load_fields(str(path), ("id", "title"))
+
+
+def test_load_fields_reads_past_head(tmp_path, monkeypatch):
+    """A number cut off at the head boundary is not mistaken for a shorter one."""
+    monkeypatch.setattr(info_json, "_HEAD_CHARS", 16)
+    path = tmp_path / "v.info.json"
+    path.write_text('{"duration": 1234567, "formats": [], "title": "T"}', encoding="utf-8")
+
+    assert load_fields(str(path), ("duration", "title")) == {"duration": 1234567, "title": "T"}
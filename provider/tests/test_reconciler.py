@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from reconciler import IOBudget, Reconciler
+
+
+def test_io_budget_throttles_to_rate():
+    budget = IOBudget(100)
+    budget.spend(100)  # the one-second burst is free
+    start = time.monotonic()
+    budget.spend(10)
+    assert time.monotonic() - start >= 0.08
+    assert budget.spent == 110
+
+
+def test_io_budget_zero_rate_only_counts():
+    budget = IOBudget(0)
+    start = time.monotonic()
+    budget.spend(1_000_000)
+    assert time.monotonic() - start < 0.05
+    assert budget.spent == 1_000_000
+
+
+def test_interval_adapts_to_pass_duration():
+    rec = Reconciler(lambda b: None, lambda r: False, 0, 60.0, 3600.0)
+    rec.record_pass(1.0, changed=False)
+    assert rec.interval() == 60.0  # clamped to the minimum
+    rec.record_pass(30.0, changed=False)
+    assert rec.interval() == 300.0
+    rec.record_pass(1000.0, changed=False)
+    assert rec.interval() == 3600.0  # clamped to the maximum
+    rec.record_pass(1000.0, changed=True)
+    assert rec.interval() == 60.0  # changes found — look again soon
+    assert not rec.may_run_now()
+
+
+async def test_run_pass_is_single_flight_and_reports_progress():
+    calls = []
+
+    def build(budget):
+        calls.append(1)
+        budget.spend(5)
+        time.sleep(0.05)
+        return "result"
+
+    published = []
+    rec = Reconciler(build, lambda r: published.append(r) or True, 0, 60.0, 3600.0)
+    await asyncio.gather(*(rec.run_pass() for _ in range(3)))
+
+    assert calls == [1]
+    assert published == ["result"]
+    status = rec.status()
+    assert status["state"] == "idle"
+    assert status["passes"] == 1
+    assert status["stats_done"] == 5
+    assert status["last_changed"] is True
+
+
+async def test_run_pass_records_errors():
+    def build(budget):
+        raise OSError("boom")
+
+    rec = Reconciler(build, lambda r: False, 0, 60.0, 3600.0)
+    with pytest.raises(OSError):
+        await rec.run_pass()
+    assert rec.status()["last_error"] == "boom"
+    assert rec.passes == 1
+
+
+def test_io_budget_lift_wakes_a_waiting_spend():
+    budget = IOBudget(10)
+    budget.spend(10)
+    start = time.monotonic()
+    timer = threading.Timer(0.05, budget.lift)
+    timer.start()
+    budget.spend(50)  # five seconds at the budgeted rate
+    assert time.monotonic() - start < 1.0
+    assert budget.rate == 0
+
+
+async def test_on_demand_pass_lifts_the_throttle_of_a_scheduled_pass():
+    """Joining a throttled pass in flight must not make an on-demand caller wait on the budget."""
+
+    def build(budget):
+        for _ in range(20):
+            budget.spend(10)  # 200 operations at 10/s: about 19 seconds throttled
+        return None
+
+    rec = Reconciler(build, lambda r: False, 10, 60.0, 3600.0)
+    scheduled = asyncio.ensure_future(rec.run_pass(throttled=True))
+    await asyncio.sleep(0.05)
+    start = time.monotonic()
+    await asyncio.wait_for(rec.run_pass(), timeout=5)
+    assert time.monotonic() - start < 1.0
+    await scheduled
+    assert rec.passes == 1
+    assert rec.throttle.rate == 10  # lifted for that pass only
+
+
+async def test_scheduled_passes_share_the_throttle_with_other_scanners():
+    """Stats charged to the throttle from outside count against the same rate, not as pass progress."""
+
+    def build(budget):
+        budget.spend(3)
+
+    rec = Reconciler(build, lambda r: False, 1000, 60.0, 3600.0)
+    rec.throttle.spend(7)
+    await rec.run_pass(throttled=True)
+    assert rec.throttle.spent == 10
+    assert rec.status()["stats_done"] == 3
@@ -0,0 +1,155 @@
+import json
+import shutil
+import sqlite3
+from pathlib import Path
+
+from collection_map import flush_maps, load_map, migrate_map_to_sqlite, read_map, resolve_collections
+from index_snapshot import SnapshotEntry
+from sqlite_store import SQLITE_FILE_NAME, SQLiteStore, build_store, open_store
+
+FIXTURES = Path(__file__).parent / "fixtures"
+FIELDS = frozenset({"tags", "title"})
+
+
+def _map_data() -> dict:
+    return {
+        "collections": [{"name": "Jazz", "rules": [{"field": "tags", "values": ["jazz"], "match": "exact"}]}],
+        "version": 2,
+        "matched_ids": ["vid_b", "vid_a"],
+        "unmatched_ids": ["vid_c"],
+        "unmatched_tags": {"rock": 2, "ambient": 1, "pop": 1},
+    }
+
+
+def test_map_roundtrip_keeps_order_and_extra_keys(tmp_path):
+    store = SQLiteStore(str(tmp_path / SQLITE_FILE_NAME))
+    store.save_map(_map_data())
+    assert store.load_map() == _map_data()
+
+
+def test_track_skips_known_videos_and_counts_tags(tmp_path):
+    store = SQLiteStore(str(tmp_path / SQLITE_FILE_NAME))
+    store.save_map(_map_data())
+
+    store.track([["u", "vid_d", ["ambient", "noise"]], ["u", "vid_c", ["ambient"]], ["m", "vid_e"]])
+
+    data = store.load_map()
+    assert data["matched_ids"] == ["vid_b", "vid_a", "vid_e"]
+    assert data["unmatched_ids"] == ["vid_c", "vid_d"]
+    assert data["unmatched_tags"] == {"ambient": 2, "rock": 2, "pop": 1, "noise": 1}
+
+
+def test_save_map_writes_only_changed_match_state_rows(tmp_path):
+    """A recompute that changes a few videos costs a few row writes, not a rewrite of every ID."""
+    store = SQLiteStore(str(tmp_path / SQLITE_FILE_NAME))
+    data = {
+        "collections": [],
+        "matched_ids": [f"vid{i:08d}" for i in range(500)],
+        "unmatched_ids": ["vid_c"],
+        "unmatched_tags": {"rock": 2, "pop": 1},
+    }
+    store.save_map(data)
+    data["matched_ids"] = [*data["matched_ids"][1:], "vid_c"]
+    data["unmatched_ids"] = ["vid00000000"]
+    data["unmatched_tags"] = {"rock": 3}
+
+    before = store._db.total_changes
+    store.save_map(data)
+    # Two flipped videos and two tag rows, plus the collections and settings rewrite (no rows here).
+    assert store._db.total_changes - before == 4
+
+    loaded = SQLiteStore(store.db_path).load_map()
+    assert sorted(loaded["matched_ids"]) == sorted(data["matched_ids"])
+    assert loaded["unmatched_ids"] == ["vid00000000"]
+    assert loaded["unmatched_tags"] == {"rock": 3}
+
+
+def test_snapshot_saves_only_changed_entries_and_projects(tmp_path):
+    store = SQLiteStore(str(tmp_path / SQLITE_FILE_NAME))
+    a, b = str(tmp_path / "a.info.json"), str(tmp_path / "b.info.json")
+    entries = {
+        a: SnapshotEntry("aaaaaaaaaaa", (1, 2), {"title": "A", "tags": ["x"]}),
+        b: SnapshotEntry("bbbbbbbbbbb", (3, 4), None),
+    }
+    store.save_snapshot(entries, FIELDS)
+    assert store.load_snapshot(FIELDS) == entries
+    assert store.load_snapshot(FIELDS | {"description"}) == {}
+    assert store.load_snapshot(frozenset({"tags"}))[a].meta == {"tags": ["x"]}
+
+    store.load_snapshot(FIELDS)
+    updated = {a: SnapshotEntry("aaaaaaaaaaa", (5, 6), {"title": "A2", "tags": []})}
+    store.save_snapshot(updated, FIELDS)
+    assert SQLiteStore(store.db_path).load_snapshot(FIELDS) == updated
+
+
+def test_snapshot_keeps_tags_and_channel_in_indexed_columns(tmp_path):
+    """Tags and channel are queryable rows; values that aren't strings round-trip through the JSON remainder."""
+    store = SQLiteStore(str(tmp_path / SQLITE_FILE_NAME))
+    fields = frozenset({"tags", "title", "channel"})
+    entries = {
+        "a": SnapshotEntry("aaaaaaaaaaa", (1, 2), {"title": "A", "tags": ["Jazz", "live"], "channel": "GoGo Penguin"}),
+        "b": SnapshotEntry("bbbbbbbbbbb", (3, 4), {"title": "B", "tags": ["jazz", 7], "channel": None}),
+        "c": SnapshotEntry("ccccccccccc", (5, 6), {}),
+    }
+    store.save_snapshot(entries, fields)
+
+    db = store._db
+    assert db.execute("SELECT path FROM meta_tags WHERE tag = 'jazz' COLLATE NOCASE").fetchall() == [("a",)]
+    assert db.execute("SELECT path FROM meta WHERE channel = 'gogo penguin' COLLATE NOCASE").fetchall() == [("a",)]
+    query = "EXPLAIN QUERY PLAN SELECT path FROM meta_tags WHERE tag = 'x' COLLATE NOCASE"
+    plan = " ".join(row[3] for row in db.execute(query))
+    assert "meta_tags_tag" in plan
+    assert SQLiteStore(store.db_path).load_snapshot(fields) == entries
+
+    store.save_snapshot({"a": entries["a"]._replace(meta={"title": "A", "tags": ["rock"]})}, fields)
+    assert db.execute("SELECT path, tag FROM meta_tags").fetchall() == [("a", "rock")]
+
+
+def test_an_old_snapshot_layout_is_dropped_and_the_map_kept(tmp_path):
+    db_path = str(tmp_path / SQLITE_FILE_NAME)
+    db = sqlite3.connect(db_path)
+    db.executescript(
+        "CREATE TABLE settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        "CREATE TABLE meta (path TEXT PRIMARY KEY, video_id TEXT NOT NULL, mtime_ns INTEGER NOT NULL,"
+        " size INTEGER NOT NULL, meta TEXT);"
+        "INSERT INTO meta VALUES ('a', 'aaaaaaaaaaa', 1, 2, '{}');"
+        """INSERT INTO settings VALUES ('snapshot.fields', '["tags"]'), ('map.version', '2');"""
+    )
+    db.close()
+
+    store = SQLiteStore(db_path)
+    assert store.load_snapshot(frozenset({"tags"})) == {}
+    assert store.load_map()["version"] == 2
+
+
+def test_migrate_moves_the_map_and_match_state_into_sqlite(tmp_path):
+    """After migration the JSON files are .bak and new match state goes to the database."""
+    yamp = tmp_path / ".yamp"
+    yamp.mkdir()
+    map_path = str(yamp / "collection_map.json")
+    shutil.copy(FIXTURES / "_collection_map.json", map_path)
+    before = load_map(map_path)
+
+    assert migrate_map_to_sqlite(map_path)
+    assert not migrate_map_to_sqlite(map_path)
+
+    assert not Path(map_path).exists()
+    assert Path(map_path + ".bak").exists()
+    assert load_map(map_path) == before
+
+    info = json.loads((FIXTURES / "sample.info.json").read_text(encoding="utf-8"))
+    info["id"] = "new_video_0"
+    assert "GoGo Penguin" in resolve_collections(info, map_path)
+    flush_maps()
+
+    store = open_store(str(yamp))
+    assert store is not None
+    assert "new_video_0" in store.load_map()["matched_ids"]
+    assert read_map(map_path)["matched_ids"] == store.load_map()["matched_ids"]
+
+
+def test_build_store_replaces_a_leftover_temporary_file(tmp_path):
+    (tmp_path / (SQLITE_FILE_NAME + ".tmp")).write_bytes(b"not a database")
+    store = build_store(str(tmp_path), _map_data())
+    assert store.load_map() == _map_data()
+    assert not (tmp_path / (SQLITE_FILE_NAME + ".tmp")).exists()
@@ -0,0 +1,40 @@
+import pytest
+
+from index_snapshot import SnapshotEntry
+from video_index import VideoIndex
+
+
+def test_apply_is_copy_on_write():
+    before = VideoIndex()
+    after = before.apply([("/d/Title [abcdefghijk].info.json", SnapshotEntry("abcdefghijk", (1, 2), {"title": "T"}))])
+
+    assert after.generation == before.generation + 1
+    assert after.videos == {"abcdefghijk": "/d/Title [abcdefghijk].info.json"}
+    assert after.stems == {"Title [abcdefghijk]": "abcdefghijk"}
+    assert after.meta == {"abcdefghijk": {"title": "T"}}
+    assert before.videos == {} and before.entries == {}
+
+
+def test_apply_drops_and_renames():
+    path = "/d/clip.info.json"
+    index = VideoIndex().apply([(path, SnapshotEntry("aaaaaaaaaaa", (1, 1), {}))])
+
+    renamed = index.apply([(path, SnapshotEntry("bbbbbbbbbbb", (2, 2), None))])
+    assert renamed.videos == {"bbbbbbbbbbb": path}
+    assert renamed.meta == {}
+
+    dropped = renamed.apply([(path, None)])
+    assert dropped.videos == {} and dropped.stems == {} and dropped.entries == {}
+
+
+def test_updated_keeps_generation_when_nothing_changed():
+    index = VideoIndex(3, {"a": "/a.info.json"}, {"a": "a"}, {"a": {}}, {})
+
+    assert index.updated({"a": "/a.info.json"}, {"a": "a"}, {"a": {}}, {}) is index
+    assert index.updated({}, {}, {}, {}).generation == 4
+
+
+def test_mappings_are_read_only():
+    index = VideoIndex(1, {"a": "/a.info.json"})
+    with pytest.raises(TypeError):
+        index.videos["b"] = "/b.info.json"  # type: ignore[index]
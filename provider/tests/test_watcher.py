@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import watcher
+from reconciler import IOBudget
+from watcher import DirectoryPoller, resolve_watch_mode, watch_sidecars
+
+
+def _write(path, data: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data), encoding="utf-8")
+
+
+def _bump_mtime(path) -> None:
+    """Force a distinct mtime so the test doesn't depend on filesystem timestamp granularity."""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+# ── DirectoryPoller ───────────────────────────────────────────────────────────
+
+
+def test_poller_prime_reports_nothing(tmp_path):
+    _write(tmp_path / "a [aaaaaaaaaaa].info.json", {"id": "aaaaaaaaaaa"})
+    poller = DirectoryPoller(str(tmp_path))
+    poller.prime()
+    assert poller.poll() == []
+
+
+def test_poller_detects_new_video_folder(tmp_path):
+    """MeTube layout: a new per-video folder inside an existing channel folder."""
+    channel = tmp_path / "Channel"
+    channel.mkdir()
+    poller = DirectoryPoller(str(tmp_path))
+    poller.prime()
+
+    info = channel / "Title [bbbbbbbbbbb]" / "Title.info.json"
+    _write(info, {"id": "bbbbbbbbbbb"})
+    _bump_mtime(channel)
+
+    assert poller.poll() == [("added", str(info))]
+    assert poller.poll() == []
+
+
+def test_poller_detects_modified_and_ignores_other_files(tmp_path):
+    info = tmp_path / "a [aaaaaaaaaaa].info.json"
+    _write(info, {"id": "aaaaaaaaaaa"})
+    poller = DirectoryPoller(str(tmp_path))
+    poller.prime()
+
+    _write(info, {"id": "aaaaaaaaaaa", "title": "rewritten"})
+    (tmp_path / "a [aaaaaaaaaaa].mp4").write_bytes(b"")
+    _bump_mtime(tmp_path)
+
+    assert poller.poll() == [("modified", str(info))]
+
+
+def test_poller_detects_deleted_folder(tmp_path):
+    folder = tmp_path / "Title [ccccccccccc]"
+    info = folder / "Title.info.json"
+    _write(info, {"id": "ccccccccccc"})
+    poller = DirectoryPoller(str(tmp_path))
+    poller.prime()
+
+    info.unlink()
+    folder.rmdir()
+    _bump_mtime(tmp_path)
+
+    assert poller.poll() == [("deleted", str(info))]
+
+
+def test_poller_unchanged_directories_are_not_listed(tmp_path, monkeypatch):
+    _write(tmp_path / "sub" / "a [aaaaaaaaaaa].info.json", {"id": "aaaaaaaaaaa"})
+    poller = DirectoryPoller(str(tmp_path))
+    poller.prime()
+
+    def _no_scandir(_path):
+        raise AssertionError("unchanged directory should not be listed")
+
+    monkeypatch.setattr(watcher.os, "scandir", _no_scandir)
+    assert poller.poll() == []
+
+
+def test_poller_primes_from_a_baseline_without_walking(tmp_path, monkeypatch):
+    """The index walk's listings stand in for the priming walk; only directories missing from them are listed."""
+    sub, other = tmp_path / "sub", tmp_path / "other"
+    info = sub / "a [aaaaaaaaaaa].info.json"
+    _write(info, {"id": "aaaaaaaaaaa"})
+    other.mkdir()
+    st = os.stat(info)
+    baseline = {
+        str(tmp_path): (os.stat(tmp_path).st_mtime_ns, ("other", "sub"), {}),
+        str(sub): (os.stat(sub).st_mtime_ns, (), {info.name: (st.st_mtime_ns, st.st_size)}),
+    }
+    listed = []
+    real_scandir = os.scandir
+
+    def _scandir(path):
+        listed.append(path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(watcher.os, "scandir", _scandir)
+    poller = DirectoryPoller(str(tmp_path))
+    poller.prime(baseline)
+    assert listed == [str(other)]
+    assert poller.poll() == []
+
+    _write(info, {"id": "aaaaaaaaaaa", "title": "rewritten"})
+    _bump_mtime(sub)
+    assert poller.poll() == [("modified", str(info))]
+
+
+def test_poller_charges_its_stats_to_the_budget(tmp_path):
+    _write(tmp_path / "sub" / "a [aaaaaaaaaaa].info.json", {"id": "aaaaaaaaaaa"})
+    budget = IOBudget(0)
+    poller = DirectoryPoller(str(tmp_path), lambda: budget)
+    poller.prime()
+    assert budget.spent == 3  # two directories and one sidecar
+
+    _bump_mtime(tmp_path / "sub")
+    poller.poll()
+    assert budget.spent == 3 + 2 + 2  # a stat per directory, then the changed one listed again
+
+
+# ── resolve_watch_mode ────────────────────────────────────────────────────────
+
+
+@pytest.mark.parametrize("mode", ["off", "poll"])
+def test_resolve_watch_mode_explicit(tmp_path, mode):
+    assert resolve_watch_mode(mode, str(tmp_path)) == mode
+
+
+def test_resolve_watch_mode_without_watchfiles_polls(tmp_path, monkeypatch):
+    monkeypatch.setattr(watcher, "_WATCHFILES_AVAILABLE", False)
+    assert resolve_watch_mode("auto", str(tmp_path)) == "poll"
+    assert resolve_watch_mode("inotify", str(tmp_path)) == "poll"
+
+
+def test_resolve_watch_mode_network_mount_polls(tmp_path, monkeypatch):
+    monkeypatch.setattr(watcher, "_WATCHFILES_AVAILABLE", True)
+    monkeypatch.setattr(watcher, "_mount_fs_type", lambda _p: "nfs4")
+    assert resolve_watch_mode("auto", str(tmp_path)) == "poll"
+
+
+def test_resolve_watch_mode_local_mount_uses_inotify(tmp_path, monkeypatch):
+    monkeypatch.setattr(watcher, "_WATCHFILES_AVAILABLE", True)
+    monkeypatch.setattr(watcher, "_mount_fs_type", lambda _p: "ext4")
+    assert resolve_watch_mode("auto", str(tmp_path)) == "inotify"
+
+
+# ── watch_sidecars ────────────────────────────────────────────────────────────
+
+
+async def test_watch_sidecars_polling_delivers_changes(tmp_path):
+    received: list = []
+    delivered = asyncio.Event()
+
+    async def _on_changes(changes):
+        received.extend(changes)
+        delivered.set()
+
+    task = asyncio.ensure_future(watch_sidecars(str(tmp_path), _on_changes, "poll", poll_interval=0.01))
+    try:
+        await asyncio.sleep(0.05)  # let the poller prime
+        info = tmp_path / "a [aaaaaaaaaaa].info.json"
+        _write(info, {"id": "aaaaaaaaaaa"})
+        _bump_mtime(tmp_path)
+        await asyncio.wait_for(delivered.wait(), timeout=5)
+    finally:
+        task.cancel()
+    assert received == [("added", str(info))]
+
+
+async def test_watch_sidecars_callback_error_keeps_watching(tmp_path, caplog):
+    calls = 0
+    second = asyncio.Event()
+
+    async def _on_changes(_changes):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("boom")
+        second.set()
+
+    task = asyncio.ensure_future(watch_sidecars(str(tmp_path), _on_changes, "poll", poll_interval=0.01))
+    try:
+        await asyncio.sleep(0.05)
+        _write(tmp_path / "a [aaaaaaaaaaa].info.json", {"id": "aaaaaaaaaaa"})
+        _bump_mtime(tmp_path)
+        await asyncio.sleep(0.1)
+        _write(tmp_path / "b [bbbbbbbbbbb].info.json", {"id": "bbbbbbbbbbb"})
+        _bump_mtime(tmp_path)
+        await asyncio.wait_for(second.wait(), timeout=5)
+    finally:
+        task.cancel()
+    assert any("failed to apply" in r.message for r in caplog.records)
@@ -0,0 +1,98 @@
+"""
+Immutable, versioned view of the in-memory video index.
+
+A VideoIndex bundles the four lookups kept about the library — video ID → .info.json
+path, filename stem → video ID, the projected meta cache, and the fingerprinted
+snapshot entries — under one generation number, along with the field set the meta
+cache is projected to. Instances are never mutated: updates
+build a new instance (copy-on-write) which the app publishes with a single assignment,
+so a thread holding an instance keeps a consistent view without locks. Generations only
+move forward, so caches derived from an index can key their invalidation on them.
+"""
+
+import os
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
+from functools import cached_property
+from types import MappingProxyType
+
+from collection_map import VideoPostings
+from index_snapshot import SnapshotEntry
+from watcher import SIDECAR_SUFFIX
+
+
+def _frozen(mapping: Mapping | None = None) -> Mapping:
+    if isinstance(mapping, MappingProxyType):
+        return mapping
+    return MappingProxyType(dict(mapping) if mapping is not None else {})
+
+
+@dataclass(frozen=True)
+class VideoIndex:
+    """One published version of the index. Mappings are read-only views; don't mutate the meta dicts."""
+
+    generation: int = 0
+    videos: Mapping[str, str] = field(default_factory=_frozen)  # video_id → .info.json path
+    stems: Mapping[str, str] = field(default_factory=_frozen)  # .info.json stem → video_id (match fallback)
+    meta: Mapping[str, dict] = field(default_factory=_frozen)  # video_id → meta_fields projection
+    entries: Mapping[str, SnapshotEntry] = field(default_factory=_frozen)  # .info.json path → warm-start entry
+    meta_fields: frozenset[str] | None = None  # fields meta is projected to (None: whatever the rules read)
+
+    def __post_init__(self) -> None:
+        for name in ("videos", "stems", "meta", "entries"):
+            object.__setattr__(self, name, _frozen(getattr(self, name)))
+
+    @cached_property
+    def postings(self) -> VideoPostings:
+        """Inverted index of meta, built on first use and shared by every reader of this generation."""
+        return VideoPostings(self.videos, self.meta, self.meta_fields)
+
+    def updated(
+        self,
+        videos: Mapping[str, str],
+        stems: Mapping[str, str],
+        meta: Mapping[str, dict],
+        entries: Mapping[str, SnapshotEntry],
+        meta_fields: frozenset[str] | None = None,
+    ) -> "VideoIndex":
+        """Return the next generation holding these mappings, or self if nothing changed.
+
+        The mappings are taken over, not copied — the caller must not modify them afterwards.
+        """
+        if (
+            videos == self.videos
+            and stems == self.stems
+            and meta == self.meta
+            and entries == self.entries
+            and meta_fields == self.meta_fields
+        ):
+            return self
+        wrap = MappingProxyType
+        return VideoIndex(self.generation + 1, wrap(videos), wrap(stems), wrap(meta), wrap(entries), meta_fields)
+
+    def apply(self, changes: Iterable[tuple[str, SnapshotEntry | None]]) -> "VideoIndex":
+        """Return the next generation with each .info.json path re-synced to its entry (None drops it).
+
+        The whole batch costs one copy of the mappings, however many paths it touches.
+        """
+        videos, stems, meta, entries = dict(self.videos), dict(self.stems), dict(self.meta), dict(self.entries)
+        for path, entry in changes:
+            stem = os.path.basename(path).removesuffix(SIDECAR_SUFFIX)
+            prev = entries.pop(path, None)
+            old_id = prev.video_id if prev else stems.get(stem)
+            if old_id and videos.get(old_id) == path and (entry is None or entry.video_id != old_id):
+                del videos[old_id]
+                meta.pop(old_id, None)
+                if stems.get(stem) == old_id:
+                    del stems[stem]
+            if entry is None:
+                continue
+            videos[entry.video_id] = path
+            stems[stem] = entry.video_id
+            entries[path] = entry
+            if entry.meta is not None:
+                meta[entry.video_id] = entry.meta
+            else:
+                meta.pop(entry.video_id, None)
+        wrap = MappingProxyType
+        return VideoIndex(self.generation + 1, wrap(videos), wrap(stems), wrap(meta), wrap(entries), self.meta_fields)
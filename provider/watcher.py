@@ -0,0 +1,250 @@
+"""
+Sidecar watcher: report .info.json adds, modifications, and deletions under the data path.
+
+Uses inotify (through the optional `watchfiles` package) when it is available and the
+data path is on a local filesystem. Network mounts (NFS/SMB) never deliver inotify
+events, so they — and installs without watchfiles — use DirectoryPoller instead.
+"""
+
+import asyncio
+import logging
+import os
+from collections.abc import Callable, Collection, Coroutine, Mapping
+from dataclasses import dataclass, field
+from typing import Literal
+
+from reconciler import IOBudget
+
+logger = logging.getLogger(__name__)
+
+# Optional dependency: watchfiles provides inotify-backed watching. It ships with
+# uvicorn[standard]; without it the polling scanner is used.
+try:
+    import watchfiles as _watchfiles
+
+    _WATCHFILES_AVAILABLE = True
+except ImportError:
+    _watchfiles = None  # type: ignore[assignment]
+    _WATCHFILES_AVAILABLE = False
+
+SIDECAR_SUFFIX = ".info.json"
+
+# Filesystem types on which inotify events are not delivered for remote writes.
+_NETWORK_FS_TYPES = frozenset({"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "fuse.sshfs", "fuse.rclone", "afs"})
+
+ChangeKind = Literal["added", "modified", "deleted"]
+Change = tuple[ChangeKind, str]
+WatchMode = Literal["auto", "inotify", "poll", "off"]
+# directory → (mtime_ns, subdirectory names, {sidecar name: (mtime_ns, size)}), as a walk saw it.
+Baseline = Mapping[str, tuple[int, Collection[str], Mapping[str, tuple[int, int]]]]
+
+
+def _mount_fs_type(path: str) -> str | None:
+    """Return the filesystem type of the mount containing path (Linux only), or None."""
+    real = os.path.realpath(path)
+    best_mount, best_type = "", None
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mount_point = parts[1].replace("\\040", " ")
+                inside = real == mount_point or real.startswith(mount_point.rstrip("/") + "/")
+                if inside and len(mount_point) >= len(best_mount):
+                    best_mount, best_type = mount_point, parts[2]
+    except OSError:
+        return None
+    return best_type
+
+
+def resolve_watch_mode(mode: str, root: str) -> Literal["inotify", "poll", "off"]:
+    """Pick the concrete watch strategy for root.
+
+    "auto" uses inotify on local filesystems when watchfiles is installed and polls
+    otherwise. An explicit "inotify" still falls back to polling if watchfiles is missing.
+    """
+    if mode == "off":
+        return "off"
+    if mode == "poll":
+        return "poll"
+    if not _WATCHFILES_AVAILABLE:
+        if mode == "inotify":
+            logger.warning("watchfiles is not installed — falling back to polling for %s", root)
+        return "poll"
+    if mode == "auto":
+        fs_type = _mount_fs_type(root)
+        if fs_type in _NETWORK_FS_TYPES:
+            logger.info("%s is on a network filesystem (%s) — using the polling watcher", root, fs_type)
+            return "poll"
+    elif mode != "inotify":
+        logger.warning("Unknown watch mode %r — using auto", mode)
+        return resolve_watch_mode("auto", root)
+    return "inotify"
+
+
+@dataclass
+class _DirState:
+    mtime_ns: int
+    subdirs: frozenset[str] = frozenset()
+    sidecars: dict[str, tuple[int, int]] = field(default_factory=dict)  # name → (mtime_ns, size)
+
+
+class DirectoryPoller:
+    """Detect sidecar changes by re-listing only directories whose mtime changed.
+
+    A poll costs one stat per directory. Adding, removing, or renaming an entry
+    bumps the parent directory's mtime; yt-dlp writes .info.json via rename, so
+    rewrites are caught too. In-place edits that keep the directory mtime are not.
+
+    budget, if given, returns the IOBudget each stat is charged to (looked up per
+    charge, so the owner may swap it), which paces the poll.
+    """
+
+    def __init__(self, root: str, budget: Callable[[], IOBudget] | None = None) -> None:
+        self.root = root
+        self._dirs: dict[str, _DirState] = {}
+        self._budget = budget
+
+    def _charge(self, n: int) -> None:
+        if self._budget is not None and n:
+            self._budget().spend(n)
+
+    def prime(self, baseline: Baseline | None = None) -> None:
+        """Record the current tree as the baseline without reporting any changes.
+
+        With baseline (the directories a walk just listed), it is adopted as is instead
+        of walking the tree again; only directories it names but lacks are listed.
+        """
+        self._dirs.clear()
+        if baseline is None:
+            self._scan(self.root, [])
+            return
+        for path, (mtime_ns, subdirs, sidecars) in baseline.items():
+            self._dirs[path] = _DirState(mtime_ns, frozenset(subdirs), dict(sidecars))
+        if self.root not in self._dirs:
+            self._scan(self.root, [])
+        for path, state in list(self._dirs.items()):
+            for name in state.subdirs:
+                subdir = os.path.join(path, name)
+                if subdir not in self._dirs:
+                    self._scan(subdir, [])
+
+    def poll(self) -> list[Change]:
+        """Return the changes since the previous poll (or prime)."""
+        changes: list[Change] = []
+        for path in list(self._dirs):
+            state = self._dirs.get(path)
+            if state is None:
+                continue  # forgotten earlier in this pass along with a removed parent
+            self._charge(1)
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                self._forget(path, changes)
+                continue
+            if mtime_ns != state.mtime_ns:
+                self._scan(path, changes)
+        return changes
+
+    def _scan(self, path: str, changes: list[Change]) -> None:
+        old = self._dirs.get(path)
+        self._charge(1)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError as e:
+            logger.warning("DirectoryPoller: cannot list '%s' — skipping: %s", path, e)
+            if old is not None:
+                self._forget(path, changes)
+            return
+
+        subdirs: set[str] = set()
+        sidecars: dict[str, tuple[int, int]] = {}
+        self._charge(sum(entry.name.endswith(SIDECAR_SUFFIX) for entry in entries))
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.add(entry.name)
+                elif entry.name.endswith(SIDECAR_SUFFIX):
+                    st = entry.stat()
+                    sidecars[entry.name] = (st.st_mtime_ns, st.st_size)
+            except OSError as e:
+                logger.warning("DirectoryPoller: cannot stat '%s': %s", entry.path, e)
+        self._dirs[path] = _DirState(mtime_ns, frozenset(subdirs), sidecars)
+
+        old_sidecars = old.sidecars if old else {}
+        for name, fingerprint in sidecars.items():
+            prev = old_sidecars.get(name)
+            if prev is None:
+                changes.append(("added", os.path.join(path, name)))
+            elif prev != fingerprint:
+                changes.append(("modified", os.path.join(path, name)))
+        for name in old_sidecars.keys() - sidecars.keys():
+            changes.append(("deleted", os.path.join(path, name)))
+
+        old_subdirs = old.subdirs if old else frozenset()
+        for name in subdirs - old_subdirs:
+            self._scan(os.path.join(path, name), changes)
+        for name in old_subdirs - subdirs:
+            self._forget(os.path.join(path, name), changes)
+
+    def _forget(self, path: str, changes: list[Change]) -> None:
+        state = self._dirs.pop(path, None)
+        if state is None:
+            return
+        for name in state.sidecars:
+            changes.append(("deleted", os.path.join(path, name)))
+        for name in state.subdirs:
+            self._forget(os.path.join(path, name), changes)
+
+
+def _is_sidecar(_change, path: str) -> bool:
+    return path.endswith(SIDECAR_SUFFIX)
+
+
+async def watch_sidecars(
+    root: str,
+    on_changes: Callable[[list[Change]], Coroutine[None, None, None]],
+    mode: str = "auto",
+    poll_interval: float = 30.0,
+    baseline: Callable[[], Baseline] | None = None,
+    budget: Callable[[], IOBudget] | None = None,
+) -> None:
+    """Watch root until cancelled, awaiting on_changes for every batch of sidecar changes.
+
+    Exceptions raised by on_changes are logged and the watcher keeps running. When
+    polling, baseline returns the tree as a walk last listed it, which primes the
+    poller without walking again, and budget paces its stats (see DirectoryPoller).
+    """
+    resolved = resolve_watch_mode(mode, root)
+    if resolved == "off":
+        logger.info("Sidecar watcher disabled")
+        return
+
+    async def _deliver(changes: list[Change]) -> None:
+        try:
+            await on_changes(changes)
+        except Exception:
+            logger.exception("watch_sidecars: failed to apply %d change(s)", len(changes))
+
+    if resolved == "inotify":
+        logger.info("Watching %s for .info.json changes (inotify)", root)
+        kinds: dict = {
+            _watchfiles.Change.added: "added",  # type: ignore[union-attr]
+            _watchfiles.Change.modified: "modified",  # type: ignore[union-attr]
+            _watchfiles.Change.deleted: "deleted",  # type: ignore[union-attr]
+        }
+        async for batch in _watchfiles.awatch(root, watch_filter=_is_sidecar):  # type: ignore[union-attr]
+            await _deliver(sorted((kinds[c], p) for c, p in batch))
+        return
+
+    logger.info("Watching %s for .info.json changes (polling every %.0fs)", root, poll_interval)
+    poller = DirectoryPoller(root, budget)
+    await asyncio.to_thread(lambda: poller.prime(None if baseline is None else baseline()))
+    while True:
+        await asyncio.sleep(poll_interval)
+        changes = await asyncio.to_thread(poller.poll)
+        if changes:
+            await _deliver(changes)